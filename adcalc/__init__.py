@@ -1,11 +1,17 @@
 from flask import Flask, render_template, jsonify
-from .models import db, Organisation, Region, Broadcast
+from .models import db, Organisation, Region, Broadcast, init_db_command
 from .region import region_bp
 from .org import org_bp
 from .broadcast import broadcast_bp
 from .api import api_bp
 from .auth import auth_bp
 from .utils import calculate_cost
+from .jobs import init_jobs
+from .profiling import init_profiling
+from .metrics import init_metrics
+from .rkn_loader import load_rkn_command
+from .database import database_uri, engine_options
+from .sqlite_tuning import DEFAULT_PRAGMAS, init_sqlite_tuning
 import logging
 from logging.handlers import RotatingFileHandler
 import os
@@ -30,7 +36,9 @@ def create_app(test_config=None):
     app = Flask(__name__, instance_relative_config=True)
 
     if test_config is None:
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///broadcasts.db'
+        # Any SQLAlchemy URL from DATABASE_URL, SQLite file by default; see database.py
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
         app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
         # Базовый коэфициент для расчета - 1 копейка за человека
         app.config['COST_PER_PERSON'] = 1
@@ -38,14 +46,14 @@ def create_app(test_config=None):
         # Optional email whitelist: comma-separated values in environment or .env file
         # Examples: 'alice@example.com,bob@example.com,@example.org'
         app.config['EMAIL_WHITELIST'] = os.environ.get('EMAIL_WHITELIST')
+        # PRAGMA profile of every SQLite connection, see sqlite_tuning.py; ignored on other backends
+        app.config['SQLITE_PRAGMAS'] = dict(DEFAULT_PRAGMAS)
     else:
         app.config.from_mapping(test_config)
 
     # Initialize the database
     db.init_app(app)
-
-    with app.app_context():
-        db.create_all()
+    init_sqlite_tuning(app)
 
     # Setup logging
     if not app.debug and not app.testing:
@@ -60,6 +68,11 @@ def create_app(test_config=None):
         app.logger.setLevel(logging.INFO)
         app.logger.info('AdCalc application startup')
 
+    # SQL statistics of every request, slow requests go to the log above
+    init_profiling(app)
+    # Prometheus-style /metrics of this process
+    init_metrics(app)
+
     @app.route('/')
     def index():
         """Главная страница: отображает калькулятор рекламного бюджета"""
@@ -71,4 +84,10 @@ def create_app(test_config=None):
     app.register_blueprint(org_bp)
     app.register_blueprint(broadcast_bp)
 
+    init_jobs(app)
+
+    # Tables and indexes are created by `flask --app adcalc init-db`, not on start
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(load_rkn_command)
+
     return app
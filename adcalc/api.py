@@ -1,6 +1,9 @@
 from flask import Blueprint, jsonify, request
+import numpy as np
 from .models import Organisation, Broadcast, db
-from .utils import calculate_cost
+from .utils import region_summary, suggest_names, SUGGEST_LIMIT
+from .cache import cached_json
+from .database import ID_BATCH_SIZE
 from functools import wraps
 from flask import session, redirect, url_for
 
@@ -20,51 +23,175 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 @api_bp.route('/organisations-detailed')
 def api_organisations_detailed():
     """API для получения детальной информации об организациях и их broadcasts
-    Используется в интерфейсе выбора организаций"""
+    Используется в интерфейсе выбора организаций.
+    Ответ кэшируется до изменения данных, с ETag и ответом 304"""
+    return cached_json(request.path, _organisations_detailed)
+
+
+def _organisations_detailed():
+    # Один запрос: организации с трансляциями и их сохраненной стоимостью
+    rows = (
+        db.session.query(
+            Organisation.id,
+            Organisation.name,
+            Broadcast.id,
+            Broadcast.smi_name,
+            Broadcast.district_name,
+            Broadcast.cost,
+        )
+        .outerjoin(Broadcast, Broadcast.org_id == Organisation.id)
+        .order_by(Organisation.id, Broadcast.id)
+        .all()
+    )
+
     organisations_list = []
-    organisations = Organisation.query.all()
-    
-    for organisation in organisations:
-        org_data = {
-            'id': organisation.id,
-            'name': organisation.name,
-            'cost': sum([calculate_cost(broadcast) for broadcast in organisation.broadcasts]),
-            'broadcasts': []
-        }
-        
-        for broadcast in organisation.broadcasts:
-            broadcast_cost = calculate_cost(broadcast)
-            smi_name = broadcast.smi_name or "<none>"
-            district_name = broadcast.district_name or "<none>"
-
-            broadcast_data = {
-                'id': broadcast.id,
-                'smi': smi_name,
-                'district': district_name,
-                'cost': broadcast_cost
+    org_data = None
+    for org_id, org_name, broadcast_id, smi_name, district_name, broadcast_cost in rows:
+        if org_data is None or org_data['id'] != org_id:
+            org_data = {
+                'id': org_id,
+                'name': org_name,
+                'cost': 0,
+                'broadcasts': []
             }
-            org_data['broadcasts'].append(broadcast_data)
-        
-        organisations_list.append(org_data)
-    
-    return jsonify(organisations_list)
+            organisations_list.append(org_data)
+
+        # Организация без трансляций дает одну строку с пустыми полями трансляции
+        if broadcast_id is None:
+            continue
+
+        org_data['cost'] += broadcast_cost
+        org_data['broadcasts'].append({
+            'id': broadcast_id,
+            'smi': smi_name or "<none>",
+            'district': district_name or "<none>",
+            'cost': broadcast_cost
+        })
+
+    return organisations_list
 
 
 @api_bp.route('/region/<int:reg_id>/broadcasts')
 def api_region_smi(reg_id):
     """API для получения JSON вещаний для конкретного региона
     Используется в списке покрытия регионов"""
-    output = {}
-    if reg_id == 0:
-        region_broadcasts = Broadcast.query.all()
-    else:
-        region_broadcasts = Broadcast.query.filter_by(region_id=reg_id).all()
+    # Сводка по региону (или по всей России при reg_id == 0) хранится в кэше,
+    # готовый ответ - до изменения данных
+    return cached_json(request.path, lambda: dict(region_summary(reg_id)))
+
+
+# Максимальное число подсказок в одном ответе
+SUGGEST_LIMIT_MAX = 100
+
+
+@api_bp.route('/suggest/<any(smi, district):kind>')
+@login_required
+def api_suggest(kind):
+    """API подсказок для полей СМИ и района в формах трансляций
+    /api/suggest/smi?q=Рад&limit=20 - названия, начинающиеся с q"""
+    limit = request.args.get('limit', SUGGEST_LIMIT, type=int)
+    limit = max(1, min(limit, SUGGEST_LIMIT_MAX))
+    return jsonify(suggest_names(kind, request.args.get('q', ''), limit))
+
+
+# Допустимые идентификаторы: целые числа в пределах INTEGER базы (64 бита)
+ID_MIN, ID_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def _valid_ids(ids):
+    """Отсортированные уникальные ID или None, если есть не целые числа.
+    bool и float (true, 1.9) не принимаются"""
+    if not all(type(i) is int and ID_MIN <= i <= ID_MAX for i in ids):
+        return None
+    return sorted(set(ids))
+
+
+def _selected_broadcast_rows(org_ids, broadcast_ids):
+    columns = (
+        Broadcast.id,
+        Broadcast.org_id,
+        Organisation.name,
+        Broadcast.smi_name,
+        Broadcast.district_name,
+        Broadcast.cost,
+    )
+    query = db.session.query(*columns).join(Organisation, Organisation.id == Broadcast.org_id)
+    rows = {}
+    for ids, column in ((org_ids, Broadcast.org_id), (broadcast_ids, Broadcast.id)):
+        for i in range(0, len(ids), ID_BATCH_SIZE):
+            for row in query.filter(column.in_(ids[i:i + ID_BATCH_SIZE])):
+                rows[row[0]] = row
+    # Порядок как в /organisations-detailed: по организации, затем по трансляции
+    return sorted(rows.values(), key=lambda row: (row[1], row[0]))
+
+
+@api_bp.route('/budget/allocate', methods=['POST'])
+def api_budget_allocate():
+    """API для распределения бюджета между выбранными трансляциями
+    Ожидает JSON: {"budget": 1000, "org_ids": [1, 2], "broadcast_ids": [5, 6, ...]}
+    Доля трансляции = стоимость / суммарная стоимость выбранных * бюджет"""
+    data = request.get_json(silent=True)
+    if not data or 'budget' not in data:
+        return jsonify({'error': 'Missing budget field'}), 400
+
+    try:
+        budget = float(data['budget'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'budget must be a number'}), 400
+    if not np.isfinite(budget) or budget <= 0:
+        return jsonify({'error': 'budget must be positive'}), 400
+
+    org_ids = data.get('org_ids') or []
+    broadcast_ids = data.get('broadcast_ids') or []
+    if not isinstance(org_ids, list) or not isinstance(broadcast_ids, list):
+        return jsonify({'error': 'org_ids and broadcast_ids must be lists'}), 400
+    org_ids = _valid_ids(org_ids)
+    broadcast_ids = _valid_ids(broadcast_ids)
+    if org_ids is None or broadcast_ids is None:
+        return jsonify({'error': 'ids must be integers'}), 400
+    if not org_ids and not broadcast_ids:
+        return jsonify({'error': 'Nothing selected'}), 400
+
+    rows = _selected_broadcast_rows(org_ids, broadcast_ids)
+    cost = np.array([row[5] or 0 for row in rows], dtype=float)
+    total_cost = float(cost.sum())
+    if total_cost <= 0:
+        return jsonify({'error': 'Selected broadcasts have zero total cost'}), 400
+
+    # Доли всех трансляций и суммы по организациям за один векторный проход
+    share = cost / total_cost * budget
+    org_keys, org_index = np.unique(
+        np.array([row[1] for row in rows], dtype=np.int64), return_inverse=True
+    )
+    org_cost = np.bincount(org_index, weights=cost, minlength=len(org_keys))
+    org_share = np.bincount(org_index, weights=share, minlength=len(org_keys))
 
-    # Calculate total cost of broadcasts
-    region_cost = sum([calculate_cost(broadcast) for broadcast in region_broadcasts])
-    output['region_cost'] = region_cost  
+    # Строки отсортированы по организации, поэтому индексы групп идут по возрастанию
+    organisations = []
+    for row, index, broadcast_cost, broadcast_share in zip(
+            rows, org_index.tolist(), cost.tolist(), share.tolist()):
+        if index == len(organisations):
+            organisations.append({
+                'id': row[1],
+                'name': row[2],
+                'cost': float(org_cost[index]),
+                'share': float(org_share[index]),
+                'broadcasts': [],
+            })
+        org_data = organisations[index]
+        org_data['broadcasts'].append({
+            'id': row[0],
+            'smi': row[3] or "<none>",
+            'district': row[4] or "<none>",
+            'cost': broadcast_cost,
+            'share': broadcast_share,
+        })
 
-    return jsonify(output)
+    return jsonify({
+        'budget': budget,
+        'total_cost': total_cost,
+        'organisations': organisations,
+    })
 
 
 @api_bp.route('/broadcasts/delete', methods=['POST'])
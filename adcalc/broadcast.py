@@ -1,12 +1,17 @@
 import logging
 from logging import log
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file
-from .models import db, Organisation, Region, Broadcast
+from flask import Blueprint, Response, jsonify, render_template, request, redirect, url_for, flash, stream_with_context
+from sqlalchemy import func, literal_column, tuple_
+from sqlalchemy.orm import joinedload
+from .models import db, Organisation, Region, Broadcast, UploadJob
 from .utils import calculate_cost
+from .jobs import submit_upload, job_status
+from . import metrics
 from werkzeug.utils import secure_filename
-import pandas as pd
+import csv
 import io
+import tempfile
 from functools import wraps
 from flask import session
 
@@ -31,15 +36,142 @@ def inject_functions():
     return dict(calculate_cost=calculate_cost)
 
 
+# Rows per page of the broadcast list
+LIST_PAGE_SIZE = 50
+
+# Sort keys of the broadcast list; id breaks ties and is the cursor by itself
+LIST_SORT_KEYS = {
+    "id": None,
+    "cost": Broadcast.cost,
+    # Broadcasts without population sort as 0. The literal 0 (not a bound
+    # parameter) lets SQLite match the expression index ix_broadcast_population
+    "population": func.coalesce(Broadcast.district_population, literal_column("0")),
+}
+
+
+def _sort_value(broadcast, sort):
+    if sort == "cost":
+        return broadcast.cost
+    return broadcast.district_population or 0
+
+
+def _cursor(broadcast, sort):
+    # "<id>" or "<sort value>:<id>"
+    if sort == "id":
+        return str(broadcast.id)
+    return f"{_sort_value(broadcast, sort)!r}:{broadcast.id}"
+
+
+def _parse_cursor(value, sort):
+    # Values of the sort key and id, None for a missing or malformed cursor
+    if not value:
+        return None
+    try:
+        if sort == "id":
+            return (int(value),)
+        key, _, broadcast_id = value.rpartition(":")
+        return float(key), int(broadcast_id)
+    except ValueError:
+        return None
+
+
+class BroadcastPage:
+    """One page of the broadcast list with cursors of the neighbouring pages"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def list_broadcasts(filters=None, sort="id", descending=False, after=None, before=None,
+                    per_page=LIST_PAGE_SIZE):
+    """Keyset (seek) pagination of broadcasts: rows after the cursor `after`
+    or before the cursor `before`, ordered by the sort key and id.
+    filters maps columns to required values. Organisation and region are
+    loaded by the same joined query. It is an outer join: broadcasts whose
+    organisation or region is missing (SQLite does not enforce the foreign
+    keys by default) are listed too"""
+    key = LIST_SORT_KEYS[sort]
+    columns = (Broadcast.id,) if key is None else (key, Broadcast.id)
+
+    query = Broadcast.query.options(
+        joinedload(Broadcast.org),
+        joinedload(Broadcast.region),
+    )
+    for column, value in (filters or {}).items():
+        query = query.filter(column == value)
+
+    backwards = after is None and before is not None
+    cursor = _parse_cursor(before if backwards else after, sort)
+    # The previous page is read in reverse order from its last row
+    reverse = descending != backwards
+    if cursor is not None:
+        if len(columns) == 1:
+            bound, value = columns[0], cursor[0]
+        else:
+            bound, value = tuple_(*columns), tuple_(*cursor)
+        query = query.filter(bound < value if reverse else bound > value)
+    query = query.order_by(*(column.desc() if reverse else column.asc() for column in columns))
+
+    items = query.limit(per_page + 1).all()
+    more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+    has_next = True if backwards else more
+    has_prev = more if backwards else cursor is not None
+    return BroadcastPage(
+        items,
+        next_cursor=_cursor(items[-1], sort) if has_next and items else None,
+        prev_cursor=_cursor(items[0], sort) if has_prev and items else None,
+    )
+
+
 @broadcast_bp.route("/list")
 @login_required
 def broadcast_list():
-    """List all broadcasts with their details"""
-    page = request.args.get("page", 1, type=int)
-    pagination = Broadcast.query.paginate(page=page, per_page=50)
-    broadcasts = pagination.items
+    """List broadcasts page by page: ?after=<cursor> / ?before=<cursor>,
+    sort=id|cost|population, order=asc|desc, filters org_id, region_id, smi"""
+    sort = request.args.get("sort", "id")
+    if sort not in LIST_SORT_KEYS:
+        sort = "id"
+    order = "desc" if request.args.get("order") == "desc" else "asc"
+
+    filters = {}
+    list_args = {}
+    for name, column, value_type in (
+        ("org_id", Broadcast.org_id, int),
+        ("region_id", Broadcast.region_id, int),
+        ("smi", Broadcast.smi_name, str),
+    ):
+        value = request.args.get(name, type=value_type)
+        if value not in (None, ""):
+            filters[column] = value
+            list_args[name] = value
+    if sort != "id":
+        list_args["sort"] = sort
+    if order == "desc":
+        list_args["order"] = order
+
+    page = list_broadcasts(
+        filters,
+        sort=sort,
+        descending=order == "desc",
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+    )
+    organisations = db.session.query(Organisation.id, Organisation.name).order_by(Organisation.name).all()
+    regions = db.session.query(Region.id, Region.name).order_by(Region.name).all()
     return render_template(
-        "broadcast/broadcast-list.html", broadcasts=broadcasts, pagination=pagination
+        "broadcast/broadcast-list.html",
+        broadcasts=page.items,
+        page=page,
+        list_args=list_args,
+        sort=sort,
+        order=order,
+        organisations=organisations,
+        regions=regions,
     )
 
 
@@ -100,20 +232,10 @@ def broadcast_create():
         # Show the form for creating a new broadcast
         organisations = Organisation.query.all()
         regions = Region.query.all()
-        smis = [
-            s[0] for s in db.session.query(Broadcast.smi_name).distinct().all() if s[0]
-        ]
-        districts = [
-            d[0]
-            for d in db.session.query(Broadcast.district_name).distinct().all()
-            if d[0]
-        ]
         return render_template(
             "broadcast/broadcast-create.html",
             organisations=organisations,
             regions=regions,
-            smis=smis,
-            districts=districts,
         )
 
 
@@ -166,21 +288,11 @@ def broadcast_update(broadcast_id):
         # Show the form for updating the broadcast
         organisations = Organisation.query.all()
         regions = Region.query.all()
-        smis = [
-            s[0] for s in db.session.query(Broadcast.smi_name).distinct().all() if s[0]
-        ]
-        districts = [
-            d[0]
-            for d in db.session.query(Broadcast.district_name).distinct().all()
-            if d[0]
-        ]
         return render_template(
             "broadcast/broadcast-update.html",
             broadcast=broadcast,
             organisations=organisations,
             regions=regions,
-            smis=smis,
-            districts=districts,
         )
 
 
@@ -203,154 +315,174 @@ def broadcast_upload_excel():
         flash("Ошибка: Не выбран файл для загрузки", "error")
         return redirect(url_for("broadcast.broadcast_list"))
 
+    # pandas is loaded by the first upload, not when a worker starts
+    from .excel_import import read_broadcast_excel, import_broadcasts
+
     filename = secure_filename(file.filename)
     try:
-        # Read Excel file into DataFrame
-        try:
-            df = pd.read_excel(file, sheet_name="table")
-        except ValueError:
-            file.seek(0)
-            df = pd.read_excel(file)
-        required_columns = {
-            "org_id",
-            "region_id",
-            "smi_name",
-            "smi_rating",
-            "smi_male_proportion",
-            "district_name",
-            "district_population",
-            "frequency",
-            "power",
-        }
-        if not required_columns.issubset(set(df.columns.tolist())):
-            raise ValueError(
-                "Некорректные названия столбцов в Excel файле. Ожидаются: org_id, region_id, smi_name, smi_rating, smi_male_proportion, district_name, district_population, frequency, power"
+        df = read_broadcast_excel(file)
+        result = import_broadcasts(df)
+        for row, message in result.skipped:
+            log(logging.WARNING, f"{filename}, строка {row}: {message}")
+
+        if result.errors:
+            db.session.rollback()
+            flash(
+                f"Файл не загружен, ошибок: {len(result.errors)}. {result.error_report()}",
+                "error",
             )
-
-        # drop empty rows if any
-        df = df.dropna(how="all")
-
-        def to_optional_float(value):
-            if pd.isna(value):
-                return None
-            try:
-                return float(value)
-            except Exception:
-                raise ValueError(f"Поле должно содержать только числовые значения: {value}")
-        success_count = 0
-        for _, row in df.iterrows():
-            org_id = row.get("org_id")
-            region_id = row.get("region_id")
-            frequency = row.get("frequency")
-            if pd.isna(org_id):
-                log(logging.WARNING, "Обязательное поле org_id не должно быть пустым")
-                continue
-            if pd.isna(region_id):
-                log(logging.WARNING, "Обязательное поле region_id не должно быть пустым")
-                continue
-            if pd.isna(frequency):
-                log(logging.WARNING, "Обязательное поле frequency не должно быть пустым")
-                continue
-
-            try:
-                org_id = int(org_id)
-            except Exception:
-                raise ValueError(f"org_id должен быть целым числом: {org_id}")
-            try:
-                region_id = int(region_id)
-            except Exception:
-                raise ValueError(f"region_id должен быть целым числом: {region_id}")
-
-            org = Organisation.query.filter_by(id=org_id).first()
-            if not org:
-                raise ValueError(f"Не найдена организация с ID {org_id}")
-            region = Region.query.filter_by(id=region_id).first()
-            if not region:
-                raise ValueError(f"Не найден регион с ID {region_id}")
-
-
-            smi_rating = to_optional_float(row.get("smi_rating"))
-            smi_male_proportion = to_optional_float(row.get("smi_male_proportion"))
-            district_population = None
-            if not pd.isna(row.get("district_population")):
-                try:
-                    district_population = int(row.get("district_population"))
-                except Exception:
-                    raise ValueError(
-                        f"Поле district_population должно быть числовым: {row.get('district_population')}"
-                    )
-            power = to_optional_float(row.get("power"))
-
-            broadcast = Broadcast(
-                org_id=org.id,
-                smi_name=row.get("smi_name"),
-                smi_rating=smi_rating,
-                smi_male_proportion=smi_male_proportion,
-                district_name=row.get("district_name"),
-                district_population=district_population,
-                region_id=region.id,
-                frequency=str(row.get("frequency")) if not pd.isna(row.get("frequency")) else None,
-                power=power,
-            )
-            db.session.add(broadcast)
-            success_count += 1
-
-        db.session.commit()
-        flash(f"Файл успешно загружен, импортировано {success_count} записей", "success")
+        else:
+            db.session.commit()
+            flash(f"Файл успешно загружен, импортировано {result.inserted} записей", "success")
 
     # catch specific ValueErrors for better user feedback
     except ValueError as e:
+        db.session.rollback()
         error_msg = str(e)
         flash(error_msg, "error")
 
     # catch all other exceptions to prevent app crash and provide feedback
     except Exception as e:
+        db.session.rollback()
         flash(str(e), "error")
         print(f"Exception: {e}")
 
     return redirect(url_for("broadcast.broadcast_list"))
 
 
+@broadcast_bp.route("/upload_jobs", methods=["POST"])
+@login_required
+def broadcast_upload_job_create():
+    """Accept an Excel file for background import and return the job id immediately"""
+    file = request.files.get("excel_file")
+    if not file or file.filename == "":
+        return jsonify({"error": "Не выбран файл для загрузки"}), 400
+
+    job = submit_upload(file)
+    status_url = url_for("broadcast.broadcast_upload_job_status", job_id=job.id)
+    response = jsonify(dict(job_status(job), status_url=status_url))
+    response.headers["Location"] = status_url
+    return response, 202
+
+
+@broadcast_bp.route("/upload_jobs/<int:job_id>")
+@login_required
+def broadcast_upload_job_status(job_id):
+    """Progress of a background import: rows processed, errors and throughput"""
+    job = db.get_or_404(UploadJob, job_id)
+    return jsonify(job_status(job))
+
+
+# Columns of the exported broadcast table, in order
+EXPORT_COLUMNS = [
+    "org_id",
+    "org_name",
+    "region_id",
+    "smi_name",
+    "smi_rating",
+    "smi_male_proportion",
+    "district_name",
+    "district_population",
+    "frequency",
+    "power",
+    "price",
+]
+
+# Rows fetched from the database per round trip while exporting
+EXPORT_BATCH_SIZE = 1000
+
+# Size of the chunks an exported xlsx file is streamed in
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def iter_export_rows():
+    """Yield export rows (tuples in EXPORT_COLUMNS order) from a single joined query"""
+    query = (
+        db.session.query(
+            Broadcast.org_id,
+            func.coalesce(Organisation.name, ""),
+            Broadcast.region_id,
+            Broadcast.smi_name,
+            Broadcast.smi_rating,
+            Broadcast.smi_male_proportion,
+            Broadcast.district_name,
+            Broadcast.district_population,
+            Broadcast.frequency,
+            Broadcast.power,
+            Broadcast.cost,
+        )
+        .outerjoin(Organisation, Organisation.id == Broadcast.org_id)
+        .order_by(Broadcast.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    exported = 0
+    try:
+        for row in query:
+            exported += 1
+            yield tuple(row)
+    finally:
+        metrics.inc('adcalc_excel_export_rows_total', exported)
+
+
+def _iter_csv():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM lets Excel detect UTF-8 for cyrillic names
+    buffer.write("\ufeff")
+    writer.writerow(EXPORT_COLUMNS)
+    for i, row in enumerate(iter_export_rows(), start=1):
+        writer.writerow(row)
+        if i % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _iter_file(file):
+    try:
+        while True:
+            chunk = file.read(EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
+
+
 @broadcast_bp.route("/download_excel")
 @login_required
 def broadcast_download_excel():
-    """Return an Excel file containing all broadcasts"""
-    broadcasts = Broadcast.query.all()
-    rows = []
-    for b in broadcasts:
-        rows.append({
-            "org_id": b.org_id,
-            "org_name": b.org.name if b.org else "",
-            "region_id": b.region_id,
-            "smi_name": b.smi_name,
-            "smi_rating": b.smi_rating,
-            "smi_male_proportion": b.smi_male_proportion,
-            "district_name": b.district_name,
-            "district_population": b.district_population,
-            "frequency": b.frequency,
-            "power": b.power,
-            "price": calculate_cost(b),
-        })
-    df = pd.DataFrame(rows, columns=[
-        "org_id",
-        "org_name",
-        "region_id",
-        "smi_name",
-        "smi_rating",
-        "smi_male_proportion",
-        "district_name",
-        "district_population",
-        "frequency",
-        "power",
-        "price",
-    ])
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="table")
+    """Return a file containing all broadcasts: xlsx (default) or csv (?format=csv).
+    Rows are read in batches and the response is streamed in chunks"""
+    if request.args.get("format") == "csv":
+        return Response(
+            stream_with_context(_iter_csv()),
+            mimetype="text/csv",
+            headers={"Content-Disposition": "attachment; filename=broadcasts.csv"},
+        )
+
+    from openpyxl import Workbook
+
+    # Write-only workbook keeps rows on disk instead of building the sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("table")
+    sheet.append(EXPORT_COLUMNS)
+    for row in iter_export_rows():
+        sheet.append(row)
+
+    output = tempfile.TemporaryFile()
+    try:
+        workbook.save(output)
+    except BaseException:
+        output.close()
+        raise
     output.seek(0)
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name="broadcasts.xlsx",
+    response = Response(
+        _iter_file(output),
         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": "attachment; filename=broadcasts.xlsx"},
     )
+    # The generator's finally never runs if the client leaves before the first chunk
+    response.call_on_close(output.close)
+    return response
@@ -0,0 +1,181 @@
+import hashlib
+import time
+
+from flask import Response, current_app, has_app_context, request
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from .models import db, DataVersion, Organisation, Region, Broadcast
+from . import metrics
+
+# Which cached values depend on which models
+DEPENDENCIES = {
+    'region_summaries': (Region, Broadcast),
+    'broadcast_names': (Broadcast,),
+    'responses': (Organisation, Region, Broadcast),
+    'data_version': (Organisation, Region, Broadcast),
+}
+
+# A commit writing any of these bumps DataVersion
+VERSIONED_MODELS = (Organisation, Region, Broadcast)
+
+# Default lifetime of a cached value, seconds. Bounds staleness across
+# gunicorn workers, which do not see each other's invalidations.
+DEFAULT_TTL = 300
+
+# How long a process trusts the data version it has read, seconds. Bounds
+# how late cached JSON responses follow writes made by other workers.
+DEFAULT_DATA_VERSION_TTL = 5
+
+
+def _store():
+    return current_app.extensions.setdefault('adcalc_cache', {})
+
+
+def cached(name, loader):
+    """Return cached value for name, calling loader() on a miss or after CACHE_TTL"""
+    store = _store()
+    ttl = current_app.config.get('CACHE_TTL', DEFAULT_TTL)
+    now = time.monotonic()
+    entry = store.get(name)
+    if entry is not None and now - entry[1] < ttl:
+        metrics.inc('adcalc_cache_requests_total', cache=name, result='hit')
+        return entry[0]
+    metrics.inc('adcalc_cache_requests_total', cache=name, result='miss')
+    value = loader()
+    store[name] = (value, now)
+    return value
+
+
+def invalidate(*names):
+    """Drop cached values by name, or all values when no names are given"""
+    if not has_app_context():
+        return
+    store = _store()
+    for name in names or list(store):
+        store.pop(name, None)
+
+
+def invalidate_models(models):
+    """Drop cached values that depend on any of the given model classes"""
+    models = set(models)
+    names = [name for name, deps in DEPENDENCIES.items() if models.intersection(deps)]
+    if names:
+        invalidate(*names)
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    models = {type(obj) for obj in (*session.new, *session.dirty, *session.deleted)}
+    if models:
+        session.info.setdefault('adcalc_changed_models', set()).update(models)
+        invalidate_models(models)
+
+
+def _has_data_version(connection):
+    """Whether the data_version table exists, checked once per app. A database
+    upgraded without flask init-db lacks it: writes then keep working, and other
+    processes see them once their cached values expire (CACHE_TTL)"""
+    if not has_app_context():
+        return inspect(connection).has_table(DataVersion.__tablename__)
+    extensions = current_app.extensions
+    if 'adcalc_data_version_table' not in extensions:
+        exists = inspect(connection).has_table(DataVersion.__tablename__)
+        if not exists:
+            current_app.logger.warning(
+                'Table data_version is missing, run "flask --app adcalc init-db". '
+                'Until then cached JSON responses follow writes of other processes only after CACHE_TTL')
+        extensions['adcalc_data_version_table'] = exists
+    return extensions['adcalc_data_version_table']
+
+
+@event.listens_for(Session, 'before_commit')
+def _before_commit(session):
+    # Pending objects are flushed here, so their models are known below
+    session.flush()
+    models = session.info.get('adcalc_changed_models')
+    if models and models.intersection(VERSIONED_MODELS) and _has_data_version(session.connection()):
+        # Core statement on the session connection: part of the same transaction
+        session.connection().execute(
+            update(DataVersion.__table__)
+            .where(DataVersion.__table__.c.id == 1)
+            .values(version=DataVersion.__table__.c.version + 1, updated_at=func.now())
+        )
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    # Invalidate again so that values loaded between flush and commit are dropped
+    models = session.info.pop('adcalc_changed_models', None)
+    if models:
+        invalidate_models(models)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('adcalc_changed_models', None)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _do_orm_execute(orm_execute_state):
+    # Bulk INSERT/UPDATE/DELETE statements bypass the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        models = {mapper.class_ for mapper in orm_execute_state.all_mappers}
+        if models:
+            orm_execute_state.session.info.setdefault('adcalc_changed_models', set()).update(models)
+            invalidate_models(models)
+
+
+def data_version():
+    """(version, updated_at) of the data as known to this process, read from the
+    database at most every DATA_VERSION_TTL seconds. When another process has
+    bumped the version, the values cached here are dropped"""
+    store = _store()
+    ttl = min(current_app.config.get('DATA_VERSION_TTL', DEFAULT_DATA_VERSION_TTL),
+              current_app.config.get('CACHE_TTL', DEFAULT_TTL))
+    now = time.monotonic()
+    known = store.get('data_version')
+    if known is None or now - known[2] >= ttl:
+        row = None
+        if _has_data_version(db.session.connection()):
+            row = db.session.execute(
+                select(DataVersion.version, DataVersion.updated_at).where(DataVersion.id == 1)
+            ).first()
+        version, updated_at = row if row is not None else (0, None)
+        if known is not None and known[0] != version:
+            invalidate()
+        known = store['data_version'] = (version, updated_at, now)
+    return known[0], known[1]
+
+
+def cached_json(key, loader):
+    """JSON response of loader() with ETag and Last-Modified; 304 for a matching
+    If-None-Match or If-Modified-Since. The encoded body is reused while the
+    data version is unchanged, for at most CACHE_TTL"""
+    version, updated_at = data_version()
+    responses = _store().setdefault('responses', {})
+    ttl = current_app.config.get('CACHE_TTL', DEFAULT_TTL)
+    now = time.monotonic()
+    entry = responses.get(key)
+
+    if entry is not None and entry['version'] == version and now - entry['created'] < ttl:
+        metrics.inc('adcalc_cache_requests_total', cache='responses', result='hit')
+    else:
+        metrics.inc('adcalc_cache_requests_total', cache='responses', result='miss')
+        body = current_app.json.dumps(loader()).encode() + b'\n'
+        entry = responses[key] = {
+            'body': body,
+            'version': version,
+            # The hash tells apart bodies rebuilt after writes that bypassed the session
+            'etag': f"{version}-{hashlib.md5(body).hexdigest()[:12]}",
+            'last_modified': updated_at,
+            'created': now,
+        }
+
+    response = Response(entry['body'], mimetype=current_app.json.mimetype)
+    response.set_etag(entry['etag'])
+    if entry['last_modified'] is not None:
+        response.last_modified = entry['last_modified']
+    # Browsers keep the body but revalidate it on every load
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
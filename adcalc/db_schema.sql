@@ -39,10 +39,45 @@ CREATE TABLE if not EXISTS broadcast (
     frequency TEXT,
     power REAL,
     
+    -- Materialized cost: smi_rating / 100 * district_population * region.rating
+    cost REAL NOT NULL DEFAULT 0,
+    
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (org_id) REFERENCES organisation(id) ON DELETE RESTRICT,
     FOREIGN KEY (region_id) REFERENCES region(id)
 );
 
-create index idx_broadcast_org on broadcast(org_id);
-create index idx_broadcast_region on broadcast(region_id);
+create index ix_broadcast_region_district on broadcast(region_id, district_name);
+create index ix_broadcast_org_district on broadcast(org_id, district_name);
+create index ix_broadcast_smi_name on broadcast(smi_name);
+create index ix_broadcast_district_name on broadcast(district_name);
+create index ix_broadcast_population on broadcast(coalesce(district_population, 0));
+create index ix_broadcast_cost on broadcast(cost);
+
+-- Background Excel uploads, see adcalc/jobs.py
+CREATE TABLE if not EXISTS upload_job (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename VARCHAR(255) NOT NULL,
+    path VARCHAR(500) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    total_rows INTEGER,
+    rows_processed INTEGER NOT NULL DEFAULT 0,
+    inserted INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    errors TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    heartbeat_at TIMESTAMP
+);
+
+create index ix_upload_job_status on upload_job(status);
+
+-- Single row, bumped by every commit writing organisation, region or broadcast
+CREATE TABLE if not EXISTS data_version (
+    id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0);
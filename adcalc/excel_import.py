@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert
+
+from . import metrics
+from .database import ID_BATCH_SIZE
+from .models import db, Organisation, Region, Broadcast
+from .utils import cost_array
+
+REQUIRED_COLUMNS = [
+    "org_id",
+    "region_id",
+    "smi_name",
+    "smi_rating",
+    "smi_male_proportion",
+    "district_name",
+    "district_population",
+    "frequency",
+    "power",
+]
+
+# Rows per INSERT statement
+IMPORT_CHUNK_SIZE = 1000
+
+# Number of error lines shown to the user
+ERROR_REPORT_LIMIT = 10
+
+
+class ImportResult:
+    """Outcome of a broadcast import: inserted row count, skipped rows and errors.
+    skipped and errors are lists of (excel_row_number, message)"""
+
+    def __init__(self, inserted=0, skipped=None, errors=None):
+        self.inserted = inserted
+        self.skipped = skipped or []
+        self.errors = errors or []
+
+    def error_report(self, limit=ERROR_REPORT_LIMIT):
+        lines = [f"Строка {row}: {message}" for row, message in self.errors[:limit]]
+        if len(self.errors) > limit:
+            lines.append(f"... и еще {len(self.errors) - limit} ошибок")
+        return "; ".join(lines)
+
+
+def read_broadcast_excel(file):
+    """Read uploaded Excel file into a DataFrame: sheet 'table' or the first sheet"""
+    try:
+        df = pd.read_excel(file, sheet_name="table")
+    except ValueError:
+        file.seek(0)
+        df = pd.read_excel(file)
+    if not set(REQUIRED_COLUMNS).issubset(set(df.columns.tolist())):
+        raise ValueError(
+            "Некорректные названия столбцов в Excel файле. Ожидаются: " + ", ".join(REQUIRED_COLUMNS)
+        )
+    return df
+
+
+def _to_number(series):
+    values = pd.to_numeric(series, errors="coerce")
+    invalid = series.notna() & values.isna()
+    return values, invalid
+
+
+def _fetch_by_ids(id_column, ids, *columns):
+    # IN (...) lists are batched to stay under the SQLite parameter limit
+    rows = []
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        batch = ids[start:start + ID_BATCH_SIZE]
+        rows.extend(db.session.query(id_column, *columns).filter(id_column.in_(batch)).all())
+    return rows
+
+
+def _to_text(series):
+    return series.map(lambda value: None if pd.isna(value) else str(value))
+
+
+def prepare_broadcasts(df):
+    """Validate and coerce a broadcast DataFrame column by column.
+    Returns (records DataFrame ready for insert, ImportResult with skipped rows and errors)"""
+    result = ImportResult()
+    df = df.dropna(how="all")
+    # Row numbers as the user sees them in Excel (header is row 1)
+    rows = pd.Series(df.index + 2, index=df.index)
+
+    # Rows without required fields are skipped, as before
+    for column in ("org_id", "region_id", "frequency"):
+        missing = df[column].isna()
+        for row in rows[missing]:
+            result.skipped.append((int(row), f"Обязательное поле {column} не должно быть пустым"))
+        df, rows = df[~missing], rows[~missing]
+
+    errors = []
+
+    def add_errors(mask, column, message):
+        for index in df.index[mask]:
+            errors.append((index, message(df.at[index, column])))
+
+    numbers = {}
+    for column in ("org_id", "region_id"):
+        values, invalid = _to_number(df[column])
+        invalid |= values.notna() & (values % 1 != 0)
+        add_errors(invalid, column, lambda value, column=column: f"{column} должен быть целым числом: {value}")
+        numbers[column] = values.where(~invalid)
+
+    # Valid organisation and region ids are fetched once
+    org_ids = numbers["org_id"].dropna().astype("int64").unique().tolist()
+    region_ids = numbers["region_id"].dropna().astype("int64").unique().tolist()
+    known_orgs = {org_id for (org_id,) in _fetch_by_ids(Organisation.id, org_ids)}
+    ratings = dict(_fetch_by_ids(Region.id, region_ids, Region.rating))
+
+    add_errors(
+        numbers["org_id"].notna() & ~numbers["org_id"].isin(list(known_orgs)),
+        "org_id",
+        lambda value: f"Не найдена организация с ID {int(float(value))}",
+    )
+    add_errors(
+        numbers["region_id"].notna() & ~numbers["region_id"].isin(list(ratings)),
+        "region_id",
+        lambda value: f"Не найден регион с ID {int(float(value))}",
+    )
+
+    for column in ("smi_rating", "smi_male_proportion", "district_population", "power"):
+        values, invalid = _to_number(df[column])
+        add_errors(
+            invalid, column,
+            lambda value, column=column: f"Поле {column} должно содержать только числовые значения: {value}",
+        )
+        numbers[column] = values.astype(float)
+
+    if errors:
+        errors.sort(key=lambda error: error[0])
+        result.errors = [(int(rows[index]), message) for index, message in errors]
+        return None, result
+
+    records = pd.DataFrame({
+        "org_id": numbers["org_id"].astype("int64"),
+        "region_id": numbers["region_id"].astype("int64"),
+        "smi_name": _to_text(df["smi_name"]),
+        "smi_rating": numbers["smi_rating"],
+        "smi_male_proportion": numbers["smi_male_proportion"],
+        "district_name": _to_text(df["district_name"]),
+        # int() semantics: fractional populations are truncated
+        "district_population": numbers["district_population"].apply(np.trunc).astype("Int64"),
+        "frequency": _to_text(df["frequency"]),
+        "power": numbers["power"],
+    }, index=df.index)
+    records["cost"] = cost_array(
+        records["smi_rating"],
+        numbers["district_population"].apply(np.trunc),
+        records["region_id"].map(ratings).astype(float),
+    )
+    return records, result
+
+
+def _to_mappings(records):
+    return records.astype(object).where(records.notna(), None).to_dict("records")
+
+
+def insert_broadcasts(records, start=0, chunk_size=None, on_chunk=None):
+    """Bulk insert prepared records from position start in chunks of IMPORT_CHUNK_SIZE.
+    on_chunk(rows_done, inserted) is called after every chunk, e.g. to commit progress.
+    Returns the number of inserted rows"""
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    inserted = 0
+    for offset in range(start, len(records), chunk_size):
+        mappings = _to_mappings(records.iloc[offset:offset + chunk_size])
+        db.session.execute(insert(Broadcast), mappings)
+        inserted += len(mappings)
+        metrics.inc('adcalc_excel_import_rows_total', len(mappings))
+        if on_chunk is not None:
+            on_chunk(offset + len(mappings), len(mappings))
+    return inserted
+
+
+def import_broadcasts(df, chunk_size=None):
+    """Validate a DataFrame of broadcasts and insert it in chunks.
+    Nothing is inserted if any row has errors. The caller commits the session"""
+    records, result = prepare_broadcasts(df)
+    if result.errors:
+        return result
+
+    result.inserted = insert_broadcasts(records, chunk_size=chunk_size)
+    return result
@@ -0,0 +1,239 @@
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import OperationalError
+from werkzeug.utils import secure_filename
+
+from .models import db, UploadJob
+
+# Threads processing uploads in one application process
+DEFAULT_WORKERS = 1
+
+# A running job without heartbeat for this long is taken over by another worker, seconds
+DEFAULT_STALE_SECONDS = 300
+
+_lock = threading.Lock()
+
+
+def _utcnow():
+    # Naive UTC, as stored by db.func.now() in SQLite
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _runner(app):
+    with _lock:
+        runner = app.extensions.get('adcalc_jobs')
+        if runner is None:
+            runner = app.extensions['adcalc_jobs'] = {
+                'executor': ThreadPoolExecutor(
+                    max_workers=app.config.get('UPLOAD_JOB_WORKERS', DEFAULT_WORKERS),
+                    thread_name_prefix='upload-job',
+                ),
+                'futures': {},
+                'retries': {},
+            }
+    return runner
+
+
+def _submit(app, job_id):
+    runner = _runner(app)
+    runner['futures'][job_id] = runner['executor'].submit(run_job, app, job_id)
+
+
+def submit_upload(file):
+    """Save an uploaded Excel file, create a queued job and start it in the background"""
+    folder = current_app.config.get('UPLOAD_FOLDER') or os.path.join(current_app.instance_path, 'uploads')
+    os.makedirs(folder, exist_ok=True)
+    filename = secure_filename(file.filename) or 'upload.xlsx'
+    path = os.path.join(folder, f"{uuid.uuid4().hex}_{filename}")
+    file.save(path)
+
+    job = UploadJob(filename=filename, path=path, status='queued')
+    db.session.add(job)
+    db.session.commit()
+    _submit(current_app._get_current_object(), job.id)
+    return job
+
+
+def wait_for_job(job_id, timeout=None):
+    """Block until a job submitted by this process finishes.
+    A job left to another worker is not waited for, see _retry_when_stale"""
+    future = _runner(current_app._get_current_object())['futures'].get(job_id)
+    if future is not None:
+        future.result(timeout)
+
+
+def _claim(job_id):
+    # Atomic: only one worker moves a job to running; dead running jobs are taken over
+    now = _utcnow()
+    stale = now - timedelta(seconds=current_app.config.get('UPLOAD_JOB_STALE_SECONDS', DEFAULT_STALE_SECONDS))
+    claimed = (
+        UploadJob.query
+        .filter(
+            UploadJob.id == job_id,
+            or_(
+                UploadJob.status == 'queued',
+                and_(UploadJob.status == 'running', UploadJob.heartbeat_at < stale),
+            ),
+        )
+        .update(
+            {
+                UploadJob.status: 'running',
+                UploadJob.heartbeat_at: now,
+                UploadJob.started_at: func.coalesce(UploadJob.started_at, now),
+            },
+            synchronize_session=False,
+        )
+    )
+    db.session.commit()
+    return claimed == 1
+
+
+def _retry_when_stale(job_id):
+    # The job is running elsewhere, or its worker died less than the stale window ago.
+    # Resume runs once per process, so try again when the heartbeat goes stale
+    job = db.session.get(UploadJob, job_id)
+    if job is None or job.status != 'running' or job.heartbeat_at is None:
+        return
+    stale_seconds = current_app.config.get('UPLOAD_JOB_STALE_SECONDS', DEFAULT_STALE_SECONDS)
+    delay = (job.heartbeat_at + timedelta(seconds=stale_seconds) - _utcnow()).total_seconds()
+    app = current_app._get_current_object()
+    runner = _runner(app)
+    with _lock:
+        timer = runner['retries'].get(job_id)
+        if timer is not None and timer.is_alive():
+            return
+        # A second more, so the heartbeat is strictly older than the window when claimed
+        timer = runner['retries'][job_id] = threading.Timer(max(delay, 0) + 1, _submit, (app, job_id))
+        timer.daemon = True
+        timer.start()
+
+
+def _finish(job, status, errors=None):
+    job.status = status
+    job.finished_at = _utcnow()
+    if errors is not None:
+        job.errors = json.dumps(errors, ensure_ascii=False)
+    db.session.commit()
+    # Finished jobs are not resumed, so the saved upload is no longer needed
+    try:
+        os.remove(job.path)
+    except OSError:
+        pass
+
+
+def _process(job_id):
+    # pandas is loaded by the first job, not when a worker starts
+    from .excel_import import read_broadcast_excel, prepare_broadcasts, insert_broadcasts
+
+    if not _claim(job_id):
+        _retry_when_stale(job_id)
+        return
+    job = db.session.get(UploadJob, job_id)
+
+    with open(job.path, 'rb') as file:
+        df = read_broadcast_excel(file)
+    records, result = prepare_broadcasts(df)
+    for row, message in result.skipped:
+        current_app.logger.warning(f"{job.filename}, строка {row}: {message}")
+    job.skipped = len(result.skipped)
+    if result.errors:
+        _finish(job, 'failed', result.errors)
+        return
+
+    job.total_rows = len(records)
+    db.session.commit()
+
+    def on_chunk(rows_done, inserted):
+        # Progress is committed in the same transaction as the chunk
+        job.rows_processed = rows_done
+        job.inserted = job.inserted + inserted
+        job.heartbeat_at = _utcnow()
+        db.session.commit()
+
+    insert_broadcasts(records, start=job.rows_processed, on_chunk=on_chunk)
+    _finish(job, 'done')
+
+
+def run_job(app, job_id):
+    """Process one upload job inside its own application context"""
+    with app.app_context():
+        try:
+            _process(job_id)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception(f"Upload job {job_id} failed")
+            job = db.session.get(UploadJob, job_id)
+            if job is not None:
+                _finish(job, 'failed', [[None, str(e)]])
+        finally:
+            db.session.remove()
+
+
+def resume_upload_jobs(app):
+    """Resubmit queued and interrupted jobs, e.g. after a worker restart"""
+    with app.app_context():
+        try:
+            job_ids = [
+                job_id for (job_id,) in
+                db.session.query(UploadJob.id).filter(UploadJob.status.in_(('queued', 'running')))
+            ]
+        except OperationalError:
+            # Job table is not created yet
+            db.session.rollback()
+            return []
+        finally:
+            db.session.remove()
+    for job_id in job_ids:
+        _submit(app, job_id)
+    return job_ids
+
+
+def init_jobs(app):
+    """Resume interrupted jobs on the first request served by this process,
+    so scripts calling create_app() do not pick them up"""
+    if not app.config.get('UPLOAD_JOBS_RESUME', not app.testing):
+        return
+    state = {'resumed': False}
+
+    @app.before_request
+    def _resume_upload_jobs():
+        if state['resumed']:
+            return
+        with _lock:
+            if state['resumed']:
+                return
+            state['resumed'] = True
+        resume_upload_jobs(app)
+
+
+def job_status(job):
+    """JSON-serialisable state of a job with throughput in rows per second"""
+    rows_per_second = None
+    if job.started_at is not None:
+        elapsed = ((job.finished_at or _utcnow()) - job.started_at).total_seconds()
+        if elapsed > 0:
+            rows_per_second = round(job.rows_processed / elapsed, 1)
+    return {
+        'id': job.id,
+        'filename': job.filename,
+        'status': job.status,
+        'total_rows': job.total_rows,
+        'rows_processed': job.rows_processed,
+        'inserted': job.inserted,
+        'skipped': job.skipped,
+        'errors': [
+            {'row': row, 'message': message}
+            for row, message in json.loads(job.errors or '[]')
+        ],
+        'rows_per_second': rows_per_second,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -0,0 +1,160 @@
+"""In-process metrics in the Prometheus text format, served at /metrics.
+
+Values live in the application process: with several gunicorn workers
+every worker reports its own counters, as the scraper sees them per
+instance. Nothing is sent to an external service."""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import Response, current_app, g, has_app_context, request
+
+from .profiling import current_profile
+
+# Upper bounds of the request latency buckets, seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help)
+METRICS = {
+    'adcalc_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status'),
+    'adcalc_http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint'),
+    'adcalc_db_queries_total': ('counter', 'SQL statements issued while serving requests, by endpoint'),
+    'adcalc_db_query_duration_seconds_total': ('counter', 'Time spent in SQL statements by endpoint'),
+    'adcalc_excel_import_rows_total': ('counter', 'Broadcast rows inserted from Excel files'),
+    'adcalc_excel_export_rows_total': ('counter', 'Broadcast rows written to Excel/CSV exports'),
+    'adcalc_cache_requests_total': ('counter', 'Cache lookups by cache name and result (hit/miss)'),
+    'adcalc_cache_hit_ratio': ('gauge', 'Share of cache lookups served from the cache'),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsRegistry:
+    """Counters and histograms keyed by (name, sorted label pairs)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        # key -> [count per bucket, sum, count]
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def value(self, name, **labels):
+        """Current value of a counter, 0 if it was never incremented"""
+        with self.lock:
+            return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def _cache_ratios(self, counters):
+        lookups = defaultdict(lambda: [0, 0])
+        for (name, labels), value in counters.items():
+            if name == 'adcalc_cache_requests_total':
+                labels = dict(labels)
+                lookups[labels['cache']][labels['result'] == 'hit'] += value
+        return {
+            ('adcalc_cache_hit_ratio', (('cache', cache),)): hits / (hits + misses)
+            for cache, (misses, hits) in lookups.items()
+        }
+
+    def render(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(b), s, c) for key, (b, s, c) in self.histograms.items()}
+        values = {**counters, **self._cache_ratios(counters)}
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            if metric_type == 'histogram':
+                for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(self.buckets, buckets):
+                        cumulative += bucket_count
+                        lines.append(f'{name}_bucket{_labels(labels + (("le", repr(bound)),))} {cumulative}')
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {count}')
+                    lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+                    lines.append(f'{name}_count{_labels(labels)} {count}')
+            else:
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def registry(app=None):
+    app = app or current_app
+    return app.extensions.setdefault('adcalc_metrics', MetricsRegistry())
+
+
+def inc(name, value=1, **labels):
+    """Increment a counter of the current application; no-op outside an app context"""
+    if has_app_context():
+        registry().inc(name, value, **labels)
+
+
+def init_metrics(app):
+    """Collect request metrics and serve them at /metrics.
+    With METRICS_TOKEN set, the endpoint requires 'Authorization: Bearer <token>'"""
+    metrics = registry(app)
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        metrics.inc('adcalc_http_requests_total', endpoint=endpoint, method=request.method,
+                    status=str(response.status_code))
+        metrics.observe('adcalc_http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+        profile = current_profile()
+        if profile is not None:
+            metrics.inc('adcalc_db_queries_total', profile.count, endpoint=endpoint)
+            metrics.inc('adcalc_db_query_duration_seconds_total', profile.seconds, endpoint=endpoint)
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus text exposition of the metrics of this process"""
+        token = app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
@@ -1,4 +1,9 @@
+import click
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event, inspect
+from sqlalchemy.schema import Column, CreateIndex
+from sqlalchemy.sql import visitors
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
@@ -72,12 +77,121 @@ class Broadcast(db.Model):
     frequency = db.Column(db.String(50), nullable=True)
     power = db.Column(db.Float, nullable=True)
 
+    # Materialized cost (see utils.calculate_cost), maintained on writes
+    cost = db.Column(db.Float, nullable=False, default=0.0, index=True)
+
     org = db.relationship(
         "Organisation",
         backref=db.backref("broadcasts", passive_deletes=True),
     )
 
+    # Access paths of the hot queries, checked by tests/test_query_plans.py:
+    # broadcasts of a region / organisation (filters, joins, per-district
+    # summaries) and the distinct SMI and district names of the forms
+    __table_args__ = (
+        db.Index("ix_broadcast_region_district", "region_id", "district_name"),
+        db.Index("ix_broadcast_org_district", "org_id", "district_name"),
+        db.Index("ix_broadcast_smi_name", "smi_name"),
+        db.Index("ix_broadcast_district_name", "district_name"),
+        # Sort key of the broadcast list (see broadcast.LIST_SORT_KEYS)
+        db.Index(
+            "ix_broadcast_population",
+            db.func.coalesce(district_population, db.literal_column("0")),
+        ),
+    )
+
     def __repr__(self):
         smi = self.smi_name or "<none>"
         district = self.district_name or "<none>"
         return f"{self.org.name}, {district}, {smi}"
+
+
+class UploadJob(db.Model):
+    """Background Excel upload (see jobs.py). Progress is committed together
+    with every inserted chunk, so an interrupted job resumes where it stopped"""
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    # queued -> running -> done | failed
+    status = db.Column(db.String(20), nullable=False, default="queued", index=True)
+    total_rows = db.Column(db.Integer, nullable=True)
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    inserted = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    # JSON list of [excel_row, message]
+    errors = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.now())
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # Updated with every chunk; a running job without heartbeat is considered dead
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<UploadJob {self.id} {self.status}>"
+
+
+class DataVersion(db.Model):
+    """Single-row counter bumped by every commit that writes organisations,
+    regions or broadcasts (see cache.py). Gives ETags of the JSON APIs and
+    tells a process that another one has changed the data"""
+    __tablename__ = "data_version"
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=db.func.now())
+
+
+# The row is created together with the table
+event.listen(
+    DataVersion.__table__,
+    "after_create",
+    DDL("INSERT INTO data_version (id, version, updated_at) VALUES (1, 0, CURRENT_TIMESTAMP)"),
+)
+
+
+def create_indexes(indexes=None):
+    """Create indexes declared on the models (or the given ones) that an existing
+    database lacks: create_all() adds indexes only together with a new table.
+    IF NOT EXISTS instead of reflection, which skips expression indexes.
+    Indexes on tables or columns a migration has not added yet are skipped;
+    returns their names"""
+    if indexes is None:
+        indexes = [index for table in db.metadata.sorted_tables for index in table.indexes]
+    skipped = []
+    with db.engine.begin() as connection:
+        inspector = inspect(connection)
+        existing = {}
+        for index in indexes:
+            table = index.table.name
+            if table not in existing:
+                existing[table] = (
+                    {column['name'] for column in inspector.get_columns(table)}
+                    if inspector.has_table(table) else set()
+                )
+            columns = {
+                element.name for expression in index.expressions
+                for element in visitors.iterate(expression) if isinstance(element, Column)
+            }
+            if not columns <= existing[table]:
+                skipped.append(index.name)
+                continue
+            connection.execute(CreateIndex(index, if_not_exists=True))
+    return skipped
+
+
+def create_schema():
+    """Create missing tables and indexes. Runs on deploy (flask --app adcalc init-db),
+    not on every application start. Returns the names of indexes left for migrations"""
+    db.create_all()
+    return create_indexes()
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create missing tables and indexes in the configured database."""
+    skipped = create_schema()
+    url = db.engine.url.render_as_string(hide_password=True)
+    if skipped:
+        click.echo(f"Schema of {url} needs migrations (see migrations/), indexes not created: {', '.join(skipped)}")
+    else:
+        click.echo(f"Schema is up to date: {url}")
@@ -1,5 +1,6 @@
-from sqlite3 import IntegrityError
-from flask import Blueprint, logging, render_template, request, redirect, url_for
+from flask import Blueprint, current_app, flash, render_template, request, redirect, url_for
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from .models import db, Organisation, Region, Broadcast
 from .utils import calculate_cost
 from functools import wraps
@@ -26,34 +27,62 @@ def inject_functions():
 @org_bp.route('/list')
 @login_required
 def org_list():
-    # Fetch all organizations from the database
-    organizations = Organisation.query.all()
-    
-    # For every organisation read total smi, total districts, total population and total cost
-    for org in organizations:
-        # Get all broadcasts for this organization
-        broadcasts = Broadcast.query.filter_by(org_id=org.id).all()
-
-        # Calculate total unique SMI names
-        org.total_smi = len({b.smi_name for b in broadcasts if b.smi_name})
-
-        # Calculate total unique districts
-        org.total_districts = len({b.district_name for b in broadcasts if b.district_name})
-
-        # Calculate total population covered by this organization (distinct districts)
-        districts_covered = set()
-        total_population = 0
-        for b in broadcasts:
-            if b.district_name and b.district_name not in districts_covered:
-                if b.district_population:
-                    total_population += b.district_population
-                districts_covered.add(b.district_name)
-        org.total_population = total_population
+    # Population of distinct districts: first broadcast (by id) of every district
+    first_district = (
+        db.session.query(
+            Broadcast.org_id.label('org_id'),
+            Broadcast.district_population.label('population'),
+            func.row_number().over(
+                partition_by=(Broadcast.org_id, Broadcast.district_name),
+                order_by=Broadcast.id,
+            ).label('rn'),
+        )
+        .filter(Broadcast.district_name.isnot(None), Broadcast.district_name != '')
+        .subquery()
+    )
+    population = (
+        db.session.query(
+            first_district.c.org_id,
+            func.sum(first_district.c.population).label('total_population'),
+        )
+        .filter(first_district.c.rn == 1)
+        .group_by(first_district.c.org_id)
+        .subquery()
+    )
+    # Unique SMI, unique districts and total cost per organisation
+    totals = (
+        db.session.query(
+            Broadcast.org_id.label('org_id'),
+            func.count(func.distinct(func.nullif(Broadcast.smi_name, ''))).label('total_smi'),
+            func.count(func.distinct(func.nullif(Broadcast.district_name, ''))).label('total_districts'),
+            func.sum(Broadcast.cost).label('total_cost'),
+        )
+        .group_by(Broadcast.org_id)
+        .subquery()
+    )
 
-        # Calculate total cost for this organization
-        total_cost = sum(calculate_cost(b) for b in broadcasts)
+    rows = (
+        db.session.query(
+            Organisation,
+            func.coalesce(totals.c.total_smi, 0),
+            func.coalesce(totals.c.total_districts, 0),
+            func.coalesce(population.c.total_population, 0),
+            func.coalesce(totals.c.total_cost, 0),
+        )
+        .outerjoin(totals, totals.c.org_id == Organisation.id)
+        .outerjoin(population, population.c.org_id == Organisation.id)
+        .order_by(Organisation.id)
+        .all()
+    )
+
+    organizations = []
+    for org, total_smi, total_districts, total_population, total_cost in rows:
+        org.total_smi = total_smi
+        org.total_districts = total_districts
+        org.total_population = total_population
         org.total_cost = total_cost
-        
+        organizations.append(org)
+
     return render_template('org/org-list.html', organisations=organizations)
 
 
@@ -119,7 +148,10 @@ def org_delete(org_id):
         db.session.delete(org)
         db.session.commit()
     except IntegrityError as e:
-        logging.error(e)
+        # With foreign keys on, an organisation with broadcasts is not deleted
+        db.session.rollback()
+        current_app.logger.error(e)
+        flash(f'Организация «{org.name}» не удалена: сначала удалите её трансляции', 'error')
 
     return redirect(url_for('org.org_list'))
 
@@ -128,11 +160,9 @@ def org_delete(org_id):
 @login_required
 def org_broadcasts(org_id):
     org = Organisation.query.get_or_404(org_id)
-    # Provide existing distinct names for convenience and region list
-    smis = [s[0] for s in db.session.query(Broadcast.smi_name).distinct().all() if s[0]]
-    districts = [d[0] for d in db.session.query(Broadcast.district_name).distinct().all() if d[0]]
+    # SMI and district names are suggested by /api/suggest while typing
     regions = Region.query.all()
-    return render_template('org/org-broadcast.html', organisation=org, smis=smis, districts=districts, regions=regions)
+    return render_template('org/org-broadcast.html', organisation=org, regions=regions)
 
 
 @org_bp.route('/<int:org_id>/broadcast_create', methods=['POST'])
@@ -214,14 +244,10 @@ def broadcast_update(bro_id):
     else:
         # Show the form for updating the broadcast
         org = Organisation.query.get_or_404(broadcast.org_id)
-        smis = [s[0] for s in db.session.query(Broadcast.smi_name).distinct().all() if s[0]]
-        districts = [d[0] for d in db.session.query(Broadcast.district_name).distinct().all() if d[0]]
         regions = Region.query.all()
         return render_template('org/broadcast-update.html', 
                              broadcast=broadcast, 
                              organisation=org, 
-                             smis=smis, 
-                             districts=districts,
                              regions=regions)
 
 
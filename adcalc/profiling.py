@@ -0,0 +1,116 @@
+"""Per-request SQL statistics from engine events: statement count, database
+time and the slowest statements. Reported in the Server-Timing header;
+slow requests are written to the application log with their statements."""
+
+import heapq
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# A request slower than this is logged, milliseconds
+DEFAULT_SLOW_REQUEST_MS = 500
+
+# A request issuing more statements than this is logged too (N+1 queries)
+DEFAULT_SLOW_REQUEST_QUERIES = 100
+
+# Slowest statements kept per request and written to the log
+DEFAULT_SLOWEST_KEPT = 5
+
+# Logged statements are cut to this length
+STATEMENT_LOG_LENGTH = 500
+
+
+class QueryProfile:
+    """SQL statistics of one request"""
+
+    def __init__(self, keep=DEFAULT_SLOWEST_KEPT):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.seconds = 0.0
+        self.keep = keep
+        # Min-heap of (seconds, sequence number, statement)
+        self._slowest = []
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        item = (seconds, self.count, statement)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, item)
+        else:
+            heapq.heappushpop(self._slowest, item)
+
+    @property
+    def slowest(self):
+        """(seconds, statement) of the slowest statements, slowest first"""
+        return [(seconds, statement) for seconds, _, statement in sorted(self._slowest, reverse=True)]
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def current_profile():
+    """Profile of the request being served, None outside requests or when disabled"""
+    return g.get('query_profile') if has_app_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('adcalc_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['adcalc_query_start'].pop()
+    profile = current_profile()
+    if profile is not None:
+        profile.record(statement, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # A failed statement does not reach after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('adcalc_query_start'):
+        connection.info['adcalc_query_start'].pop()
+
+
+def _log_line(seconds, statement):
+    return f"  {seconds * 1000:.1f} ms: {' '.join(statement.split())[:STATEMENT_LOG_LENGTH]}"
+
+
+def init_profiling(app):
+    """Profile SQL of every request unless QUERY_PROFILING is False.
+    SLOW_REQUEST_MS and SLOW_REQUEST_QUERIES set when a request is logged,
+    SLOW_QUERY_LOG_LIMIT how many of its slowest statements are written"""
+    if not app.config.get('QUERY_PROFILING', True):
+        return
+
+    @app.before_request
+    def _start_query_profile():
+        g.query_profile = QueryProfile(app.config.get('SLOW_QUERY_LOG_LIMIT', DEFAULT_SLOWEST_KEPT))
+
+    @app.after_request
+    def _report_query_profile(response):
+        profile = current_profile()
+        if profile is None:
+            return response
+        total_ms = profile.elapsed() * 1000
+        db_ms = profile.seconds * 1000
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={db_ms:.2f};desc="{profile.count} queries", app;dur={total_ms:.2f}',
+        )
+
+        slow_ms = app.config.get('SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS)
+        slow_queries = app.config.get('SLOW_REQUEST_QUERIES', DEFAULT_SLOW_REQUEST_QUERIES)
+        if total_ms > slow_ms or profile.count > slow_queries:
+            lines = [
+                f"Slow request {request.method} {request.full_path.rstrip('?')}: {total_ms:.0f} ms, "
+                f"{profile.count} SQL statements, {db_ms:.0f} ms in the database"
+            ]
+            lines.extend(_log_line(seconds, statement) for seconds, statement in profile.slowest)
+            app.logger.warning('\n'.join(lines))
+        return response
@@ -42,6 +42,7 @@ def region_update(region_id):
     except ValueError:
         return jsonify({'error': 'Invalid rating value'}), 500
     # Обновляем коэффициенты и сохраняем изменения в базе данных
+    # Сохраненная стоимость трансляций региона пересчитывается при сохранении
     region.rating = rating
     db.session.commit()
     return redirect(url_for('region.region_list'))
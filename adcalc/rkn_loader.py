@@ -0,0 +1,396 @@
+"""
+Load the RKN broadcast license register (open data XML) straight into the
+app tables: organisation, broadcast, matched against existing region rows.
+
+    flask --app adcalc load-rkn data/data-20251201T0000-structure-20220404T0000.xml
+
+Records are streamed, filtered by status and licensed activity and written
+in batches. Organisations are upserted by INN/OGRN, grid rows become
+broadcasts of the region with the same (normalised) name. Broadcasts that
+already exist for an organisation are skipped, so the load can be re-run on
+a newer dump.
+"""
+
+import re
+import time
+from collections import OrderedDict
+
+import click
+from flask import current_app
+from sqlalchemy import insert, or_, update
+
+from rkn_fields import FieldSpec, iter_records, iter_rows, safe_float
+from .database import ID_BATCH_SIZE
+from .models import db, Organisation, Region, Broadcast
+from .utils import cost_array
+
+DEFAULT_STATUS = 'действующая'
+DEFAULT_ACTIVITY = 'Радиовещание радиоканала'
+
+# Records per write batch
+LOAD_BATCH_SIZE = 500
+
+# Default sizes of the dedup caches, see RknLoader
+DEFAULT_ORG_CACHE_SIZE = 10000
+DEFAULT_BROADCAST_CACHE_SIZE = 2000
+
+# RKN region names (normalised) that differ from the names in the region table
+REGION_ALIASES = {
+    'российская федерация': 'россия',
+    'москва': 'город москва',
+    'санкт-петербург': 'город санкт-петербург',
+    'севастополь': 'город севастополь',
+    'кемеровская область': 'кемеровская область-кузбасс',
+    'ханты-мансийский автономный округ': 'ханты-мансийский автономный округ-югра',
+}
+
+ORG_FIELDS = ('name', 'inn', 'ogrn', 'address', 'phone', 'email')
+
+# Unique identifiers of an organisation: filled in from the dump, never replaced
+ORG_ID_FIELDS = ('inn', 'ogrn')
+
+RECORD_SPEC = FieldSpec([
+    ('status', None),
+    ('licensed_activity', None),
+    ('org_name', None),
+    ('inn', None),
+    ('ogrn', None),
+    ('address', None),
+    ('phone', None),
+    ('email', None),
+    ('smi_name', None),
+], elements=('grid',))
+
+
+def population(value):
+    """Population of a grid row: thousands of people in RKN, e.g. '60,0' or '1 234,5 тыс'"""
+    value = value.replace('\xa0', ' ').strip()
+    number = safe_float(re.sub(r'(?<=\d) (?=\d)', '', value).split(' ')[0])
+    return None if number is None else int(round(number * 1000))
+
+
+GRID_SPEC = FieldSpec([
+    ('region_name_full', None),
+    ('region_text', None),
+    ('freq', None),
+    ('power', safe_float),
+    ('population', population),
+])
+
+
+def normalize_region_name(name):
+    """Comparable region name: lower case, ё -> е, any dash -> '-', 'г.' -> 'город'"""
+    name = (name or '').lower().replace('ё', 'е')
+    name = re.sub(r'\s*[\u2010-\u2015\u2212-]\s*', '-', name)
+    name = re.sub(r'^г\.\s*', 'город ', name)
+    name = ' '.join(name.split())
+    return REGION_ALIASES.get(name, name)
+
+
+class LRUCache:
+    """Dict with a size limit: the least recently used entries are evicted.
+    max_size None or 0 means unbounded"""
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.data = OrderedDict()
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is not None:
+            self.data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if self.max_size and len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class LoadResult:
+    """Counters of an RKN load"""
+
+    def __init__(self):
+        self.records = 0
+        self.filtered = 0
+        self.orgs_inserted = 0
+        self.orgs_updated = 0
+        self.broadcasts_inserted = 0
+        self.duplicates = 0
+        self.unknown_regions = {}
+        # (org id, 'inn'|'ogrn') -> value from the dump that was not applied
+        self.org_conflicts = {}
+        self.seconds = 0.0
+
+    def report(self):
+        rate = self.records / self.seconds if self.seconds else 0
+        lines = [
+            f"Records: {self.records} ({rate:.0f}/s), filtered out: {self.filtered}",
+            f"Organisations inserted: {self.orgs_inserted}, updated: {self.orgs_updated}",
+            f"Broadcasts inserted: {self.broadcasts_inserted}, already present: {self.duplicates}",
+        ]
+        if self.unknown_regions:
+            skipped = sum(self.unknown_regions.values())
+            names = sorted(self.unknown_regions, key=self.unknown_regions.get, reverse=True)[:10]
+            lines.append(f"Grid rows with unknown region: {skipped} ({', '.join(names)})")
+        if self.org_conflicts:
+            conflicts = [
+                f"{org_id}: {field} {value}" for (org_id, field), value in list(self.org_conflicts.items())[:10]
+            ]
+            lines.append(f"Conflicting INN/OGRN, kept as is: {len(self.org_conflicts)} ({', '.join(conflicts)})")
+        return '\n'.join(lines)
+
+
+class RknLoader:
+    """Streams filtered RKN records into organisation and broadcast.
+
+    Dedup caches:
+     - org_cache: ('inn'|'ogrn'|'name', value) -> (org id, org fields), up to
+       org_cache_size keys; misses are looked up in the database per batch
+     - broadcast_cache: org id -> keys of its broadcasts, for up to
+       broadcast_cache_size organisations; loaded per batch on a miss
+    """
+
+    def __init__(self, status=DEFAULT_STATUS, activity=DEFAULT_ACTIVITY, batch_size=None,
+                 org_cache_size=None, broadcast_cache_size=None):
+        config = current_app.config
+        self.status = status
+        self.activity = activity
+        self.batch_size = batch_size or LOAD_BATCH_SIZE
+        self.org_cache = LRUCache(
+            org_cache_size if org_cache_size is not None
+            else config.get('RKN_ORG_CACHE_SIZE', DEFAULT_ORG_CACHE_SIZE)
+        )
+        self.broadcast_cache = LRUCache(
+            broadcast_cache_size if broadcast_cache_size is not None
+            else config.get('RKN_BROADCAST_CACHE_SIZE', DEFAULT_BROADCAST_CACHE_SIZE)
+        )
+        self.regions = {
+            normalize_region_name(name): (region_id, rating)
+            for region_id, name, rating in db.session.query(Region.id, Region.name, Region.rating)
+        }
+        self.result = LoadResult()
+
+    def load(self, xml_path):
+        """Load all matching records of the file, committing after every batch"""
+        started = time.perf_counter()
+        batch = []
+        for record_elem in iter_records(xml_path):
+            self.result.records += 1
+            values, elements = RECORD_SPEC.extract_with_elements(record_elem)
+            record = RECORD_SPEC.to_dict(values)
+            if record['status'] != self.status or record['licensed_activity'] != self.activity:
+                self.result.filtered += 1
+                continue
+            record['grid'] = [GRID_SPEC.to_dict(GRID_SPEC.extract(row)) for row in iter_rows(elements.get('grid'))]
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+        self.result.seconds = time.perf_counter() - started
+        return self.result
+
+    def write_batch(self, records):
+        org_ids = self.upsert_organisations(records)
+        self.insert_broadcasts(records, org_ids)
+        db.session.commit()
+
+    # -------- Organisations -------- #
+    @staticmethod
+    def _org_keys(record):
+        keys = [(field, record[field]) for field in ORG_ID_FIELDS if record[field]]
+        # Without INN and OGRN the name is the only identity we have
+        return keys or [('name', record['org_name'])]
+
+    @staticmethod
+    def _org_fields(record):
+        return {
+            'name': record['org_name'],
+            'inn': record['inn'] or None,
+            'ogrn': record['ogrn'] or None,
+            'address': record['address'] or None,
+            'phone': record['phone'] or None,
+            'email': record['email'] or None,
+        }
+
+    @staticmethod
+    def _index_keys(fields):
+        return [(field, fields[field]) for field in ('inn', 'ogrn', 'name') if fields.get(field)]
+
+    def _cache_org(self, org_id, fields):
+        for key in self._index_keys(fields):
+            self.org_cache.put(key, (org_id, fields))
+
+    def _fetch_orgs(self, keys):
+        # One query per batch for the keys missing from the cache
+        found = {}
+        by_field = {'inn': set(), 'ogrn': set(), 'name': set()}
+        for field, value in keys:
+            by_field[field].add(value)
+        conditions = [
+            getattr(Organisation, field).in_(sorted(values)[start:start + ID_BATCH_SIZE])
+            for field, values in by_field.items()
+            for start in range(0, len(values), ID_BATCH_SIZE)
+        ]
+        if not conditions:
+            return found
+        columns = [getattr(Organisation, field) for field in ORG_FIELDS]
+        for org_id, *values in db.session.query(Organisation.id, *columns).filter(or_(*conditions)):
+            fields = dict(zip(ORG_FIELDS, values))
+            self._cache_org(org_id, fields)
+            found.update(dict.fromkeys(self._index_keys(fields), (org_id, fields)))
+        return found
+
+    def upsert_organisations(self, records):
+        """Org id of every record; new organisations are inserted, changed ones updated"""
+        # Organisations of the batch by key, kept apart from the cache,
+        # which may evict them while the batch is processed
+        keys = {key for record in records for key in self._org_keys(record)}
+        known = {key: self.org_cache.get(key) for key in keys}
+        missing = {key for key, org in known.items() if org is None}
+        if missing:
+            known.update(self._fetch_orgs(missing))
+
+        org_ids = []
+        new_orgs = OrderedDict()
+        # Every key of a pending new organisation -> its first key
+        pending = {}
+        updates = {}
+        for record in records:
+            fields = self._org_fields(record)
+            keys = self._org_keys(record)
+            cached = next(filter(None, map(known.get, keys)), None)
+            if cached is None:
+                # Same organisation may appear several times in a batch
+                key = next((pending[key] for key in keys if key in pending), keys[0])
+                new_orgs.setdefault(key, fields)
+                pending.update(dict.fromkeys(keys, key))
+                org_ids.append(key)
+                continue
+            org_id, current = cached
+            # Empty values in the dump do not erase what we have
+            merged = dict(current)
+            for name, value in fields.items():
+                if not value or value == current[name]:
+                    continue
+                if name in ORG_ID_FIELDS:
+                    owner = known.get((name, value))
+                    if current[name] or (owner is not None and owner[0] != org_id) or (name, value) in pending:
+                        # Another value on record, or the value belongs to another organisation
+                        self.result.org_conflicts[org_id, name] = value
+                        continue
+                merged[name] = value
+            if merged != current:
+                updates[org_id] = dict(merged, id=org_id)
+                self._cache_org(org_id, merged)
+                known.update(dict.fromkeys(self._index_keys(merged), (org_id, merged)))
+            org_ids.append(org_id)
+
+        if updates:
+            db.session.execute(update(Organisation), list(updates.values()))
+            self.result.orgs_updated += len(updates)
+
+        inserted = {}
+        if new_orgs:
+            rows = db.session.execute(
+                insert(Organisation).returning(Organisation.id, sort_by_parameter_order=True),
+                list(new_orgs.values()),
+            ).all()
+            for (key, fields), (org_id,) in zip(new_orgs.items(), rows):
+                inserted[key] = org_id
+                self._cache_org(org_id, fields)
+                # A new organisation has no broadcasts yet
+                self.broadcast_cache.put(org_id, set())
+            self.result.orgs_inserted += len(new_orgs)
+        return [inserted.get(org_id, org_id) if isinstance(org_id, tuple) else org_id for org_id in org_ids]
+
+    # -------- Broadcasts -------- #
+    @staticmethod
+    def _broadcast_key(region_id, district_name, smi_name, frequency):
+        return region_id, district_name or None, smi_name or None, frequency or None
+
+    def _fetch_broadcast_keys(self, org_ids):
+        keys = {org_id: set() for org_id in org_ids}
+        org_ids = sorted(org_ids)
+        for start in range(0, len(org_ids), ID_BATCH_SIZE):
+            rows = db.session.query(
+                Broadcast.org_id, Broadcast.region_id, Broadcast.district_name,
+                Broadcast.smi_name, Broadcast.frequency,
+            ).filter(Broadcast.org_id.in_(org_ids[start:start + ID_BATCH_SIZE]))
+            for org_id, *key in rows:
+                keys[org_id].add(self._broadcast_key(*key))
+        for org_id, org_keys in keys.items():
+            self.broadcast_cache.put(org_id, org_keys)
+
+    def insert_broadcasts(self, records, org_ids):
+        missing = {org_id for org_id in org_ids if org_id not in self.broadcast_cache}
+        if missing:
+            self._fetch_broadcast_keys(missing)
+
+        rows = []
+        for record, org_id in zip(records, org_ids):
+            existing = self.broadcast_cache.get(org_id)
+            if existing is None:
+                # Evicted within this batch by a small cache size
+                self._fetch_broadcast_keys({org_id})
+                existing = self.broadcast_cache.get(org_id)
+            for grid_row in record['grid']:
+                region = self.regions.get(normalize_region_name(grid_row['region_name_full']))
+                if region is None:
+                    name = grid_row['region_name_full'] or '<none>'
+                    self.result.unknown_regions[name] = self.result.unknown_regions.get(name, 0) + 1
+                    continue
+                region_id, rating = region
+                key = self._broadcast_key(region_id, grid_row['region_text'], record['smi_name'], grid_row['freq'])
+                if key in existing:
+                    self.result.duplicates += 1
+                    continue
+                existing.add(key)
+                rows.append({
+                    'org_id': org_id,
+                    'region_id': region_id,
+                    'smi_name': key[2],
+                    'district_name': key[1],
+                    'district_population': grid_row['population'],
+                    'frequency': key[3],
+                    'power': grid_row['power'],
+                    'region_rating': rating,
+                })
+
+        if rows:
+            # Bulk insert skips the mapper events, so the cost is set here
+            costs = cost_array(
+                [None] * len(rows),
+                [row['district_population'] for row in rows],
+                [row.pop('region_rating') for row in rows],
+            )
+            for row, cost in zip(rows, costs.tolist()):
+                row['cost'] = cost
+            db.session.execute(insert(Broadcast), rows)
+            self.result.broadcasts_inserted += len(rows)
+
+
+@click.command('load-rkn')
+@click.argument('xml_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--status', default=DEFAULT_STATUS, show_default=True, help='License status to load')
+@click.option('--activity', default=DEFAULT_ACTIVITY, show_default=True, help='Licensed activity to load')
+@click.option('--batch-size', type=int, default=LOAD_BATCH_SIZE, show_default=True, help='Records per write batch')
+@click.option('--org-cache-size', type=int, default=None,
+              help=f'Organisation cache keys, 0 - unbounded [default: RKN_ORG_CACHE_SIZE or {DEFAULT_ORG_CACHE_SIZE}]')
+@click.option('--broadcast-cache-size', type=int, default=None,
+              help='Organisations with cached broadcast keys, 0 - unbounded '
+                   f'[default: RKN_BROADCAST_CACHE_SIZE or {DEFAULT_BROADCAST_CACHE_SIZE}]')
+def load_rkn_command(xml_path, status, activity, batch_size, org_cache_size, broadcast_cache_size):
+    """Load RKN broadcast licenses from XML_PATH into organisations and broadcasts."""
+    loader = RknLoader(status, activity, batch_size, org_cache_size, broadcast_cache_size)
+    result = loader.load(xml_path)
+    click.echo(result.report())
@@ -0,0 +1,57 @@
+"""PRAGMA profile applied to every new SQLite connection.
+
+WAL lets readers go on while an upload is being written, busy_timeout makes
+a writer wait for the lock held by another gunicorn worker instead of
+failing at once with "database is locked". synchronous=NORMAL is safe in
+WAL mode: a power loss may lose the last commits but never corrupts the
+database."""
+
+from sqlalchemy import event
+
+from .models import db
+
+# PRAGMA -> value, in the order they are applied. busy_timeout goes first:
+# switching to WAL needs a lock another connection may hold
+DEFAULT_PRAGMAS = {
+    'busy_timeout': 5000,               # ms
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,     # bytes
+    'cache_size': -64 * 1024,           # negative: KiB, i.e. 64 MiB per connection
+    'foreign_keys': 'ON',
+}
+
+
+def pragmas(app):
+    """Effective profile: DEFAULT_PRAGMAS updated with SQLITE_PRAGMAS, None values dropped.
+    Empty when SQLITE_PRAGMAS is not configured"""
+    overrides = app.config.get('SQLITE_PRAGMAS')
+    if overrides is None:
+        return {}
+    profile = {**DEFAULT_PRAGMAS, **overrides}
+    return {name: value for name, value in profile.items() if value is not None}
+
+
+def _apply(profile, dbapi_connection):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in profile.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def init_sqlite_tuning(app):
+    """Apply the PRAGMA profile on connect to every SQLite engine of the app.
+    Must run before the first connection is made"""
+    profile = pragmas(app)
+    if not profile:
+        return
+
+    def on_connect(dbapi_connection, connection_record):
+        _apply(profile, dbapi_connection)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', on_connect)
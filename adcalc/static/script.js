@@ -0,0 +1,34 @@
+// Подсказки для полей с data-suggest-url: список <datalist> поля
+// заполняется ответом /api/suggest/... по мере ввода
+document.addEventListener('DOMContentLoaded', function () {
+  document.querySelectorAll('input[data-suggest-url]').forEach(function (input) {
+    var datalist = document.getElementById(input.getAttribute('list'));
+    var timer = null;
+    var lastQuery = null;
+
+    function load() {
+      var query = input.value.trim();
+      if (query === lastQuery) {
+        return;
+      }
+      lastQuery = query;
+      fetch(input.dataset.suggestUrl + '?q=' + encodeURIComponent(query))
+        .then(function (response) { return response.ok ? response.json() : []; })
+        .then(function (names) {
+          datalist.innerHTML = '';
+          names.forEach(function (name) {
+            var option = document.createElement('option');
+            option.value = name;
+            datalist.appendChild(option);
+          });
+        })
+        .catch(function () {});
+    }
+
+    input.addEventListener('focus', load);
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(load, 200);
+    });
+  });
+});
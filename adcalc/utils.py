@@ -1,4 +1,10 @@
+from bisect import bisect_left
+
+import numpy as np
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Query, Session, object_session
 from .models import db, Region, Broadcast
+from .cache import cached
 from flask import current_app
 
 
@@ -20,4 +26,232 @@ def calculate_cost(broadcast):
     except Exception as e:
         print(f"Error calculating cost: {e}")
         return 0
-    
\ No newline at end of file
+
+
+def cost_array(smi_rating, district_population, region_rating):
+    """Векторный расчет стоимости по массивам столбцов.
+    Пропущенные значения (None/NaN) дают стоимость 0, как в calculate_cost"""
+    smi_rating = np.asarray(smi_rating, dtype=float)
+    district_population = np.asarray(district_population, dtype=float)
+    region_rating = np.asarray(region_rating, dtype=float)
+
+    cost = (smi_rating / 100.0) * district_population * region_rating
+    return np.where(np.isnan(cost), 0.0, cost)
+
+
+def calculate_costs(broadcasts):
+    """Пакетный аналог calculate_cost для запроса или списка трансляций.
+    Возвращает словарь {broadcast.id: стоимость}"""
+    if isinstance(broadcasts, Query):
+        # Рейтинг региона берется подзапросом, чтобы не конфликтовать с join-ами запроса
+        region_rating = (
+            select(Region.rating)
+            .where(Region.id == Broadcast.region_id)
+            .scalar_subquery()
+        )
+        rows = broadcasts.with_entities(
+            Broadcast.id,
+            Broadcast.smi_rating,
+            Broadcast.district_population,
+            region_rating,
+        ).all()
+        if not rows:
+            return {}
+        ids, smi_rating, district_population, rating = zip(*rows)
+    else:
+        broadcasts = [b for b in broadcasts if b is not None]
+        if not broadcasts:
+            return {}
+        ids = [b.id for b in broadcasts]
+        smi_rating = [b.smi_rating for b in broadcasts]
+        district_population = [b.district_population for b in broadcasts]
+
+        # Рейтинги регионов: из уже загруженных связей, остальные - одним запросом
+        regions = [inspect(b).attrs.region.loaded_value for b in broadcasts]
+        missing = {
+            b.region_id for b, region in zip(broadcasts, regions)
+            if not isinstance(region, Region) and b.region_id is not None
+        }
+        ratings = {}
+        if missing:
+            ratings = dict(
+                db.session.query(Region.id, Region.rating)
+                .filter(Region.id.in_(missing))
+                .all()
+            )
+        rating = [
+            region.rating if isinstance(region, Region) else ratings.get(b.region_id)
+            for b, region in zip(broadcasts, regions)
+        ]
+
+    costs = cost_array(smi_rating, district_population, rating)
+    return dict(zip(ids, costs.tolist()))
+
+
+def cost_expression(region_rating=None):
+    """SQL-выражение стоимости трансляции для UPDATE и агрегатов.
+    По умолчанию рейтинг региона берется коррелированным подзапросом"""
+    if region_rating is None:
+        region_rating = (
+            select(Region.rating)
+            .where(Region.id == Broadcast.region_id)
+            .scalar_subquery()
+        )
+    return (
+        func.coalesce(Broadcast.smi_rating, 0) / 100.0
+        * func.coalesce(Broadcast.district_population, 0)
+        * func.coalesce(region_rating, 0)
+    )
+
+
+def refresh_costs(region_id=None):
+    """Пересчитывает сохраненную стоимость трансляций одним UPDATE.
+    Если region_id не указан, пересчитываются все трансляции"""
+    db.session.flush()
+    query = Broadcast.query
+    if region_id is not None:
+        query = query.filter(Broadcast.region_id == region_id)
+    updated = query.update(
+        {Broadcast.cost: cost_expression()}, synchronize_session=False
+    )
+
+    # Загруженные объекты получат новое значение при следующем обращении
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Broadcast):
+            db.session.expire(obj, ['cost'])
+    return updated
+
+
+def _load_region_summaries():
+    # Население уникальных районов: первая (по id) трансляция каждого района региона
+    first_district = (
+        db.session.query(
+            Broadcast.region_id.label('region_id'),
+            Broadcast.district_population.label('population'),
+            func.row_number().over(
+                partition_by=(Broadcast.region_id, Broadcast.district_name),
+                order_by=Broadcast.id,
+            ).label('rn'),
+        )
+        .filter(Broadcast.district_name.isnot(None), Broadcast.district_name != '')
+        .subquery()
+    )
+    population = dict(
+        db.session.query(first_district.c.region_id, func.sum(first_district.c.population))
+        .filter(first_district.c.rn == 1)
+        .group_by(first_district.c.region_id)
+        .all()
+    )
+    rows = (
+        db.session.query(Broadcast.region_id, func.sum(Broadcast.cost), func.count(Broadcast.id))
+        .group_by(Broadcast.region_id)
+        .all()
+    )
+
+    summaries = {}
+    total = {'region_cost': 0, 'broadcast_count': 0, 'population': 0}
+    for region_id, region_cost, broadcast_count in rows:
+        summary = {
+            'region_cost': region_cost or 0,
+            'broadcast_count': broadcast_count,
+            'population': population.get(region_id) or 0,
+        }
+        summaries[region_id] = summary
+        for key in total:
+            total[key] += summary[key]
+    summaries[0] = total
+    return summaries
+
+
+def region_summary(region_id):
+    """Сводка по региону из кэша: стоимость, число трансляций и население районов.
+    region_id == 0 - сводка по всем регионам (Россия)"""
+    summaries = cached('region_summaries', _load_region_summaries)
+    return summaries.get(region_id, {'region_cost': 0, 'broadcast_count': 0, 'population': 0})
+
+
+# Число подсказок по умолчанию
+SUGGEST_LIMIT = 20
+
+
+def _load_broadcast_names():
+    # Различные названия СМИ и районов, отсортированные по ключу поиска
+    names = {}
+    for kind, column in (('smi', Broadcast.smi_name), ('district', Broadcast.district_name)):
+        values = [value for (value,) in db.session.query(column).distinct() if value]
+        names[kind] = sorted((value.casefold(), value) for value in values)
+    return names
+
+
+def suggest_names(kind, prefix, limit=SUGGEST_LIMIT):
+    """Подсказки из кэша: до limit названий СМИ (kind='smi') или районов
+    (kind='district'), начинающихся с prefix без учета регистра"""
+    names = cached('broadcast_names', _load_broadcast_names)[kind]
+    key = prefix.strip().casefold()
+    result = []
+    for i in range(bisect_left(names, (key,)), len(names)):
+        name_key, name = names[i]
+        if not name_key.startswith(key) or len(result) >= limit:
+            break
+        result.append(name)
+    return result
+
+
+_COST_FIELDS = ('smi_rating', 'district_population', 'region_id')
+
+
+def _set_cost(connection, target):
+    region = inspect(target).attrs.region.loaded_value
+    if isinstance(region, Region) and region.id is not None \
+            and str(region.id) == str(target.region_id):
+        rating = region.rating
+    else:
+        # Views assign region_id from form data as a string, which PostgreSQL
+        # does not compare with an integer column
+        try:
+            region_id = int(target.region_id)
+        except (TypeError, ValueError):
+            region_id = target.region_id
+        rating = connection.execute(
+            select(Region.rating).where(Region.id == region_id)
+        ).scalar()
+    target.cost = float(
+        cost_array(target.smi_rating, target.district_population, rating)
+    )
+
+
+@event.listens_for(Broadcast, 'before_insert')
+def _broadcast_before_insert(mapper, connection, target):
+    _set_cost(connection, target)
+
+
+@event.listens_for(Broadcast, 'before_update')
+def _broadcast_before_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in _COST_FIELDS):
+        _set_cost(connection, target)
+
+
+@event.listens_for(Region, 'after_update')
+def _region_after_update(mapper, connection, target):
+    # Сохраненная стоимость трансляций зависит от коэффициента региона,
+    # поэтому пересчитывается при любом его изменении (форма, init_db, скрипты)
+    if not inspect(target).attrs.rating.history.has_changes():
+        return
+    connection.execute(
+        update(Broadcast.__table__)
+        .where(Broadcast.region_id == target.id)
+        .values(cost=cost_expression(target.rating))
+    )
+    session = object_session(target)
+    if session is not None:
+        session.info['adcalc_costs_changed'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _expire_changed_costs(session, flush_context):
+    # Загруженные объекты получат новое значение при следующем обращении
+    if session.info.pop('adcalc_costs_changed', False):
+        for obj in list(session.identity_map.values()):
+            if isinstance(obj, Broadcast):
+                session.expire(obj, ['cost'])
@@ -0,0 +1,9 @@
+"""Benchmarks of the hot paths on a synthetic national dataset.
+
+Usage: run from project root.
+
+Example:
+    python -m benchmarks --save
+    python -m benchmarks --compare
+    python -m benchmarks --orgs 500 --broadcasts 20000 --only org_list broadcast_list_first_page
+"""
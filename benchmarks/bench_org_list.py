@@ -0,0 +1,109 @@
+"""
+Benchmark: /org/list on 1k organisations / 50k broadcasts.
+
+Usage: run from project root.
+
+Example:
+    python benchmarks/bench_org_list.py
+    python benchmarks/bench_org_list.py --orgs 1000 --broadcasts 50000 --repeat 5
+
+The script fills a temporary SQLite database with the synthetic dataset
+of benchmarks/dataset.py and reports the number of SQL statements and latency of:
+ - the current aggregate-query implementation of `org.org_list`
+ - the previous per-organisation (N+1) implementation, for comparison
+"""
+
+import sys
+import os
+import tempfile
+import time
+
+# Add parent directory to path so we can import adcalc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from adcalc import create_app
+from adcalc.models import db, Organisation, Broadcast
+from benchmarks.dataset import populate
+
+
+def legacy_org_list():
+    """Previous implementation: one broadcast query per organisation"""
+    organizations = Organisation.query.all()
+    for org in organizations:
+        broadcasts = Broadcast.query.filter_by(org_id=org.id).all()
+        org.total_smi = len({b.smi_name for b in broadcasts if b.smi_name})
+        org.total_districts = len({b.district_name for b in broadcasts if b.district_name})
+        districts_covered = set()
+        total_population = 0
+        for b in broadcasts:
+            if b.district_name and b.district_name not in districts_covered:
+                if b.district_population:
+                    total_population += b.district_population
+                districts_covered.add(b.district_name)
+        org.total_population = total_population
+        org.total_cost = sum(b.cost for b in broadcasts)
+    return organizations
+
+
+def measure(fn, repeat):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    timings = []
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        for _ in range(repeat):
+            statements.clear()
+            db.session.expire_all()
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    return len(statements), min(timings), sum(timings) / len(timings)
+
+
+def run(orgs=1000, broadcasts=50000, repeat=3, legacy=True):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'SECRET_KEY': 'bench',
+        })
+        with app.app_context():
+            db.create_all()
+            start = time.perf_counter()
+            user_id = populate(orgs, broadcasts)
+            print(f"Populated {orgs} organisations / {broadcasts} broadcasts "
+                  f"in {time.perf_counter() - start:.2f}s\n")
+
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['user_id'] = user_id
+
+            def view():
+                rv = client.get('/org/list')
+                assert rv.status_code == 200
+
+            results = [('org_list (aggregate query)', measure(view, repeat))]
+            if legacy:
+                results.append(('legacy per-org loop', measure(legacy_org_list, repeat)))
+
+            print(f"{'implementation':<30}{'queries':>10}{'best, s':>12}{'mean, s':>12}")
+            for name, (queries, best, mean) in results:
+                print(f"{name:<30}{queries:>10}{best:>12.3f}{mean:>12.3f}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    p = argparse.ArgumentParser()
+    p.add_argument('--orgs', type=int, default=1000, help='Number of organisations')
+    p.add_argument('--broadcasts', type=int, default=50000, help='Number of broadcasts')
+    p.add_argument('--repeat', type=int, default=3, help='Timed runs per implementation')
+    p.add_argument('--no-legacy', action='store_true', help='Skip the legacy N+1 implementation')
+    args = p.parse_args()
+    run(args.orgs, args.broadcasts, args.repeat, legacy=not args.no_legacy)
@@ -0,0 +1,115 @@
+"""
+Seeded synthetic national dataset for the benchmarks.
+
+Regions and their ratings are those of init_db.py (read from its source,
+importing the script would configure the app from the environment). Organisations
+own broadcasts with a long tail: a few national networks hold a large share
+of them. SMI names are drawn from a pool with skewed popularity and every
+region has its own set of districts, so the DISTINCT / GROUP BY queries see
+realistic cardinalities. The same seed always gives the same rows.
+"""
+
+import ast
+import os
+import random
+
+from sqlalchemy import insert
+
+from adcalc.models import db, Organisation, Region, Broadcast, User
+from adcalc.utils import cost_array
+
+INIT_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'init_db.py')
+
+DEFAULT_ORGS = 3000
+DEFAULT_BROADCASTS = 100_000
+DEFAULT_SEED = 42
+
+# Distinct SMI names and districts per region
+SMI_POOL = 2000
+DISTRICTS_PER_REGION = (20, 80)
+
+# Rows per INSERT statement while populating
+INSERT_BATCH = 10_000
+
+
+def load_regions(path=INIT_DB):
+    """regions_data of init_db.py: [{'id', 'name', 'rating'}], id 0 is Russia as a whole"""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+                isinstance(target, ast.Name) and target.id == 'regions_data' for target in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f'regions_data not found in {path}')
+
+
+def generate(orgs=DEFAULT_ORGS, broadcasts=DEFAULT_BROADCASTS, seed=DEFAULT_SEED):
+    """Rows of region, organisation and broadcast (without cost) as lists of dicts"""
+    rnd = random.Random(seed)
+    regions = load_regions()
+    region_ids = [region['id'] for region in regions if region['id'] != 0]
+    # Populous regions get more broadcasts
+    region_weights = [rnd.paretovariate(1.5) for _ in region_ids]
+
+    districts = {}
+    for region_id in region_ids:
+        districts[region_id] = [
+            (f'Район {region_id}-{i}', int(rnd.lognormvariate(10.5, 1.0)))
+            for i in range(1, rnd.randint(*DISTRICTS_PER_REGION) + 1)
+        ]
+
+    organisation_rows = [{
+        'id': i,
+        'name': f'Организация {i}',
+        'inn': f'{7700000000 + i}',
+        'ogrn': f'{1027700000000 + i}',
+        'arv_member': rnd.random() < 0.3,
+    } for i in range(1, orgs + 1)]
+    org_ids = [row['id'] for row in organisation_rows]
+    org_weights = [rnd.paretovariate(1.2) for _ in org_ids]
+
+    smi_names = [f'Радио {i}' for i in range(1, SMI_POOL + 1)]
+    smi_weights = [1.0 / i for i in range(1, SMI_POOL + 1)]
+
+    org_column = rnd.choices(org_ids, org_weights, k=broadcasts)
+    region_column = rnd.choices(region_ids, region_weights, k=broadcasts)
+    smi_column = rnd.choices(smi_names, smi_weights, k=broadcasts)
+    broadcast_rows = []
+    for org_id, region_id, smi_name in zip(org_column, region_column, smi_column):
+        district_name, population = rnd.choice(districts[region_id])
+        broadcast_rows.append({
+            'org_id': org_id,
+            'region_id': region_id,
+            'smi_name': smi_name,
+            'smi_rating': round(rnd.uniform(0.1, 5.0), 2),
+            'smi_male_proportion': round(rnd.uniform(0.3, 0.7), 2),
+            'district_name': district_name,
+            'district_population': population,
+            'frequency': f'{rnd.uniform(87.5, 108):.1f}',
+            'power': rnd.choice([0.1, 0.25, 0.5, 1.0, 2.0, 5.0]),
+        })
+    return regions, organisation_rows, broadcast_rows
+
+
+def populate(orgs=DEFAULT_ORGS, broadcasts=DEFAULT_BROADCASTS, seed=DEFAULT_SEED):
+    """Fill the (empty) database of the current app; returns the id of a benchmark user"""
+    regions, organisation_rows, broadcast_rows = generate(orgs, broadcasts, seed)
+    db.session.execute(insert(Region), regions)
+    db.session.execute(insert(Organisation), organisation_rows)
+
+    ratings = {region['id']: region['rating'] for region in regions}
+    costs = cost_array(
+        [row['smi_rating'] for row in broadcast_rows],
+        [row['district_population'] for row in broadcast_rows],
+        [ratings[row['region_id']] for row in broadcast_rows],
+    )
+    for row, cost in zip(broadcast_rows, costs.tolist()):
+        row['cost'] = cost
+    for start in range(0, len(broadcast_rows), INSERT_BATCH):
+        db.session.execute(insert(Broadcast), broadcast_rows[start:start + INSERT_BATCH])
+
+    user = User(username='bench', email='bench@example.com')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
@@ -0,0 +1,308 @@
+"""
+Benchmarks of the hot paths on a seeded synthetic dataset (see dataset.py).
+
+Every benchmark is timed `repeat` times after one warm-up run; the number of
+SQL statements of the last run is recorded too. Results can be saved as a
+JSON baseline and compared with a previous one: a benchmark regresses when
+its median time grows by more than the tolerance (and by more than
+min_delta seconds, so millisecond noise is not reported), or when it issues
+more SQL statements than before.
+
+Baselines are machine-specific, compare runs made on the same host.
+"""
+
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import pandas as pd
+from sqlalchemy import delete, event, func, select
+
+from adcalc import create_app
+from adcalc.broadcast import _cursor
+from adcalc.cache import invalidate
+from adcalc.models import db, Organisation, Region, Broadcast
+from adcalc.utils import calculate_cost, calculate_costs
+
+from . import dataset
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+DEFAULT_BASELINE = os.path.join(BASELINE_DIR, 'baseline.json')
+
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_MIN_DELTA = 0.005
+
+# Rows of the uploaded Excel file
+UPLOAD_ROWS = 2000
+
+# Broadcasts loaded for the per-object calculate_cost benchmark
+CALCULATE_COST_ROWS = 10_000
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Worker start in a fresh interpreter: import of the package and create_app()
+STARTUP_SCRIPT = """
+import sys
+from adcalc import create_app
+create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': sys.argv[1], 'SECRET_KEY': 'bench'})
+"""
+
+
+class Benchmark:
+    """A timed callable; setup() runs before every run and is not timed"""
+
+    def __init__(self, name, run, setup=None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+
+
+def _get(client, url):
+    def run():
+        rv = client.get(url)
+        assert rv.status_code == 200, (url, rv.status_code)
+        rv.get_data()
+    return run
+
+
+def _start_process(uri):
+    def run():
+        subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, uri], cwd=PROJECT_ROOT, check=True)
+    return run
+
+
+def _upload_file(rows, seed):
+    rnd = random.Random(seed)
+    org_ids = db.session.scalars(select(Organisation.id)).all()
+    region_ids = db.session.scalars(select(Region.id).where(Region.id != 0)).all()
+    excel_file = BytesIO()
+    pd.DataFrame([{
+        'org_id': rnd.choice(org_ids),
+        'smi_name': f'Загрузка {i}',
+        'smi_rating': round(rnd.uniform(0.1, 5.0), 2),
+        'smi_male_proportion': 0.5,
+        'district_name': f'Район загрузки {i % 50}',
+        'district_population': rnd.randint(1_000, 500_000),
+        'region_id': rnd.choice(region_ids),
+        'frequency': f'{rnd.uniform(87.5, 108):.1f}',
+        'power': 1.0,
+    } for i in range(rows)]).to_excel(excel_file, index=False)
+    return excel_file.getvalue()
+
+
+def benchmarks(client, seed):
+    """Benchmarks of the populated database, in run order"""
+    largest_region = db.session.execute(
+        select(Broadcast.region_id).group_by(Broadcast.region_id)
+        .order_by(func.count().desc()).limit(1)
+    ).scalar_one()
+    middle = Broadcast.query.order_by(Broadcast.cost, Broadcast.id).offset(Broadcast.query.count() // 2).first()
+    deep_page = f'/broadcast/list?sort=cost&after={_cursor(middle, "cost")}'
+
+    last_id = db.session.scalar(select(func.max(Broadcast.id)))
+    upload = _upload_file(UPLOAD_ROWS, seed)
+
+    def remove_uploaded():
+        db.session.execute(delete(Broadcast).where(Broadcast.id > last_id))
+        db.session.commit()
+
+    def upload_excel():
+        rv = client.post('/broadcast/upload_excel',
+                         data={'excel_file': (BytesIO(upload), 'bench.xlsx')},
+                         content_type='multipart/form-data')
+        assert rv.status_code == 302, rv.status_code
+        assert db.session.scalar(select(func.count()).where(Broadcast.id > last_id)) == UPLOAD_ROWS
+
+    def cold_cache():
+        invalidate()
+
+    def calculate_cost_objects():
+        broadcasts = (Broadcast.query.options(db.joinedload(Broadcast.region))
+                      .order_by(Broadcast.id).limit(CALCULATE_COST_ROWS).all())
+        return [calculate_cost(b) for b in broadcasts]
+
+    def calculate_costs_query():
+        return calculate_costs(Broadcast.query)
+
+    return [
+        Benchmark('startup', _start_process(db.engine.url.render_as_string(hide_password=False))),
+        Benchmark('api_organisations_detailed', _get(client, '/api/organisations-detailed'), setup=cold_cache),
+        Benchmark('api_organisations_detailed_cached', _get(client, '/api/organisations-detailed')),
+        Benchmark('org_list', _get(client, '/org/list')),
+        Benchmark('broadcast_list_first_page', _get(client, '/broadcast/list')),
+        Benchmark('broadcast_list_deep_page_by_cost', _get(client, deep_page)),
+        Benchmark('region_coverage', _get(client, '/region/coverage')),
+        Benchmark('api_region_broadcasts_cold', _get(client, f'/api/region/{largest_region}/broadcasts'),
+                  setup=cold_cache),
+        Benchmark('api_region_broadcasts_cached', _get(client, f'/api/region/{largest_region}/broadcasts')),
+        Benchmark('excel_upload', upload_excel, setup=remove_uploaded),
+        Benchmark('excel_download', _get(client, '/broadcast/download_excel')),
+        Benchmark('csv_download', _get(client, '/broadcast/download_excel?format=csv')),
+        Benchmark('calculate_cost', calculate_cost_objects),
+        Benchmark('calculate_costs', calculate_costs_query),
+    ]
+
+
+def measure(benchmark, repeat):
+    """{'queries', 'best', 'median', 'mean'} of one benchmark, times in seconds"""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    timings = []
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        # The first run warms up the caches of SQLite and SQLAlchemy
+        for _ in range(repeat + 1):
+            if benchmark.setup:
+                benchmark.setup()
+            db.session.expire_all()
+            statements.clear()
+            start = time.perf_counter()
+            benchmark.run()
+            timings.append(time.perf_counter() - start)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    timings = timings[1:]
+    return {
+        'queries': len(statements),
+        'best': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+    }
+
+
+def run(orgs=dataset.DEFAULT_ORGS, broadcasts=dataset.DEFAULT_BROADCASTS, seed=dataset.DEFAULT_SEED,
+        repeat=DEFAULT_REPEAT, only=None):
+    """Populate a temporary database and run the benchmarks; returns the report dict"""
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            'SECRET_KEY': 'bench',
+            'QUERY_PROFILING': False,
+        })
+        with app.app_context():
+            db.create_all()
+            start = time.perf_counter()
+            user_id = dataset.populate(orgs, broadcasts, seed)
+            print(f"Populated {orgs} organisations / {broadcasts} broadcasts "
+                  f"in {time.perf_counter() - start:.2f}s\n")
+
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['user_id'] = user_id
+
+            print(f"{'benchmark':<36}{'queries':>8}{'best, s':>10}{'median':>10}{'mean':>10}")
+            results = {}
+            for benchmark in benchmarks(client, seed):
+                if only and benchmark.name not in only:
+                    continue
+                results[benchmark.name] = measure(benchmark, repeat)
+                result = results[benchmark.name]
+                print(f"{benchmark.name:<36}{result['queries']:>8}"
+                      f"{result['best']:>10.4f}{result['median']:>10.4f}{result['mean']:>10.4f}")
+            db.session.remove()
+            db.engine.dispose()
+
+    return {
+        'meta': {
+            'orgs': orgs,
+            'broadcasts': broadcasts,
+            'seed': seed,
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def save(report, path=DEFAULT_BASELINE):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path=DEFAULT_BASELINE):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE, min_delta=DEFAULT_MIN_DELTA):
+    """Regressions of report against baseline as a list of messages"""
+    regressions = []
+    for name, result in report['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        limit = previous['median'] * (1 + tolerance)
+        if result['median'] > limit and result['median'] - previous['median'] > min_delta:
+            regressions.append(
+                f"{name}: median {result['median']:.4f}s, baseline {previous['median']:.4f}s "
+                f"(+{result['median'] / previous['median'] - 1:.0%}, tolerance {tolerance:.0%})"
+            )
+        if result['queries'] > previous['queries']:
+            regressions.append(f"{name}: {result['queries']} SQL statements, baseline {previous['queries']}")
+    return regressions
+
+
+def dataset_mismatch(report, baseline):
+    """Dataset parameters that differ between the runs"""
+    return [
+        f"{key}: {baseline['meta'].get(key)} -> {report['meta'][key]}"
+        for key in ('orgs', 'broadcasts', 'seed')
+        if baseline['meta'].get(key) != report['meta'][key]
+    ]
+
+
+def main(argv=None):
+    import argparse
+
+    p = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.strip().split('\n')[0])
+    p.add_argument('--orgs', type=int, default=dataset.DEFAULT_ORGS, help='Number of organisations')
+    p.add_argument('--broadcasts', type=int, default=dataset.DEFAULT_BROADCASTS, help='Number of broadcasts')
+    p.add_argument('--seed', type=int, default=dataset.DEFAULT_SEED, help='Seed of the dataset generator')
+    p.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Timed runs per benchmark')
+    p.add_argument('--only', nargs='+', metavar='NAME', help='Run only these benchmarks')
+    p.add_argument('--save', nargs='?', const=DEFAULT_BASELINE, metavar='FILE',
+                   help='Save results as a baseline (default: benchmarks/baselines/baseline.json)')
+    p.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, metavar='FILE',
+                   help='Compare with a baseline and exit with status 1 on regressions')
+    p.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                   help='Allowed relative growth of the median time (default: %(default)s)')
+    p.add_argument('--min-delta', type=float, default=DEFAULT_MIN_DELTA,
+                   help='Ignore slowdowns smaller than this, seconds (default: %(default)s)')
+    args = p.parse_args(argv)
+
+    baseline = load(args.compare) if args.compare else None
+    report = run(args.orgs, args.broadcasts, args.seed, args.repeat, args.only)
+
+    if args.save:
+        save(report, args.save)
+        print(f"\nBaseline saved to {args.save}")
+
+    if baseline is not None:
+        for message in dataset_mismatch(report, baseline):
+            print(f"\nWarning: dataset differs from the baseline, {message}")
+        regressions = compare(report, baseline, args.tolerance, args.min_delta)
+        if regressions:
+            print('\nRegressions:')
+            for message in regressions:
+                print(f'  {message}')
+            return 1
+        print(f"\nNo regressions against {args.compare}")
+    return 0
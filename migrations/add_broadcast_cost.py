@@ -0,0 +1,56 @@
+"""
+Migration script: add materialized `cost` column to the `broadcast` table.
+
+Usage: run from project root with the same environment used to run the app.
+
+Make a backup of your database before running this script.
+
+Example:
+    cp broadcasts.db broadcasts.db.bkp
+    python migrations/add_broadcast_cost.py
+
+The script will:
+ - add column `cost` (float NOT NULL DEFAULT 0) to `broadcast`
+ - create index `ix_broadcast_cost`
+ - fill `cost` for every broadcast from smi_rating, district_population
+   and the rating of its region
+"""
+
+import sys
+import os
+
+# Add parent directory to path so we can import adcalc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adcalc import create_app
+from adcalc.models import db, Broadcast, create_indexes
+from adcalc.utils import refresh_costs
+from sqlalchemy import inspect, text
+
+
+def run():
+    app = create_app()
+    with app.app_context():
+        try:
+            columns = {c['name'] for c in inspect(db.engine).get_columns('broadcast')}
+            if 'cost' not in columns:
+                # Column type in the dialect of the configured database
+                column_type = Broadcast.__table__.c.cost.type.compile(dialect=db.engine.dialect)
+                db.session.execute(text(
+                    f"ALTER TABLE broadcast ADD COLUMN cost {column_type} NOT NULL DEFAULT 0"
+                ))
+                db.session.commit()
+                print('✓ Added column `cost`')
+            create_indexes([index for index in Broadcast.__table__.indexes if index.name == 'ix_broadcast_cost'])
+
+            updated = refresh_costs()
+            db.session.commit()
+            print(f"\n✓ Migration completed successfully! Updated {updated} broadcasts")
+        except Exception as e:
+            db.session.rollback()
+            print(f"\n✗ Migration failed: {e}")
+            raise
+
+
+if __name__ == '__main__':
+    run()
@@ -16,6 +16,9 @@ The script will:
  - (optionally) drop the `smi` and `district` tables
 
 Note: adjust DB path in app config if needed.
+
+Only SQLite databases created before the tables were merged need this;
+a database created on another backend already has the merged schema.
 """
 
 import sys
@@ -32,6 +35,9 @@ from sqlalchemy import text
 def run(drop_source_tables=False):
     app = create_app()
     with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            print(f"Nothing to do: {db.engine.dialect.name} database has no legacy SQLite schema")
+            return
         conn = db.engine.connect()
         trans = conn.begin()
         
@@ -0,0 +1,133 @@
+"""
+Declarative field mapping for RKN broadcast license XML.
+
+A FieldSpec lists the fields of one target table with their converters and
+extracts them from an element in a single pass over its children, matching
+fully qualified tags instead of resolving 'rkn:...' paths for every field.
+Shared by the RKN loader (adcalc/rkn_loader.py) and the standalone importers
+in tmp/. Depends on the standard library only and lives outside the adcalc
+package, so the importers and their worker processes do not load Flask.
+"""
+
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+RKN_NAMESPACE = 'http://rsoc.ru/opendata/7705846236-LicBroadcast'
+
+
+def tag(name: str) -> str:
+    """Fully qualified tag of an element in the RKN namespace."""
+    return f'{{{RKN_NAMESPACE}}}{name}'
+
+
+ROW_TAG = tag('row')
+RECORD_TAG = tag('record')
+
+
+def iter_records(xml_path: str) -> Iterator[ET.Element]:
+    """Stream rkn:record elements one at a time.
+
+    The file is read with iterparse, so memory stays bounded on multi-gigabyte
+    dumps: each record is yielded as soon as its closing tag is parsed and is
+    cleared (and detached from the root) once the caller has processed it.
+    """
+    context = ET.iterparse(xml_path, events=('start', 'end'))
+    _, root = next(context)
+    for event, elem in context:
+        if event == 'end' and elem.tag == RECORD_TAG:
+            yield elem
+            # Drop the processed record and the root's reference to it
+            elem.clear()
+            root.clear()
+
+
+def get_text(element: Optional[ET.Element], default: str = "") -> str:
+    """Safely get text from XML element."""
+    if element is not None and element.text:
+        return element.text.strip()
+    return default
+
+
+def safe_date(date_str: str) -> Optional[str]:
+    """Convert date string to proper format or return None."""
+    if not date_str or date_str.lower() == 'none':
+        return None
+    try:
+        # Try to parse and validate date
+        datetime.strptime(date_str, '%Y-%m-%d')
+        return date_str
+    except ValueError:
+        return None
+
+
+def safe_int(value_str: str) -> Optional[int]:
+    """Convert string to integer or return None."""
+    if not value_str:
+        return None
+    try:
+        return int(value_str)
+    except ValueError:
+        return None
+
+
+def safe_float(value_str: str) -> Optional[float]:
+    """Convert string to float or return None."""
+    if not value_str:
+        return None
+    try:
+        return float(value_str.replace(',', '.'))
+    except ValueError:
+        return None
+
+
+Converter = Optional[Callable[[str], Any]]
+
+
+class FieldSpec:
+    """Fields of one target table: (name, converter) pairs in column order.
+
+    A converter receives the stripped element text ('' when the element is
+    missing or empty); None keeps the text as is. elements lists child
+    elements (e.g. 'grid') returned as is by extract_with_elements.
+    """
+
+    def __init__(self, fields: Sequence[Tuple[str, Converter]], elements: Iterable[str] = ()):
+        self.names = tuple(name for name, _ in fields)
+        self.converters = tuple(converter for _, converter in fields)
+        self.positions = {tag(name): position for position, name in enumerate(self.names)}
+        self.elements = {tag(name): name for name in elements}
+
+    def extract(self, elem: ET.Element) -> tuple:
+        """Field values of elem in column order."""
+        return self.extract_with_elements(elem)[0]
+
+    def extract_with_elements(self, elem: ET.Element) -> Tuple[tuple, Dict[str, ET.Element]]:
+        """Field values and the requested child elements, in one pass over the children."""
+        texts = [None] * len(self.names)
+        elements = {}
+        for child in elem:
+            position = self.positions.get(child.tag)
+            if position is not None:
+                # The first occurrence wins, as with find()
+                if texts[position] is None:
+                    texts[position] = child.text.strip() if child.text else ""
+            elif child.tag in self.elements:
+                elements.setdefault(self.elements[child.tag], child)
+        values = tuple(
+            (text or "") if converter is None else converter(text or "")
+            for text, converter in zip(texts, self.converters)
+        )
+        return values, elements
+
+    def to_dict(self, values: tuple) -> Dict[str, Any]:
+        return dict(zip(self.names, values))
+
+
+def iter_rows(elem: Optional[ET.Element]) -> Iterator[ET.Element]:
+    """rkn:row children of a table element such as rkn:grid."""
+    if elem is None:
+        return
+    for child in elem:
+        if child.tag == ROW_TAG:
+            yield child
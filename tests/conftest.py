@@ -5,16 +5,44 @@ import pytest
 # Add the project root to Python path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from sqlalchemy import create_engine
+from sqlalchemy.exc import SQLAlchemyError
+
 from adcalc import create_app
 from adcalc.models import db
 
 
+def _probe_test_database():
+    """Keep TEST_DATABASE_URL (e.g. a local PostgreSQL) only when it accepts connections,
+    so the test apps fall back to in-memory SQLite otherwise"""
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        return
+    try:
+        engine = create_engine(url)
+        with engine.connect():
+            pass
+        engine.dispose()
+    except (SQLAlchemyError, ImportError) as e:
+        print(f"TEST_DATABASE_URL is not available, using SQLite: {e}")
+        del os.environ['TEST_DATABASE_URL']
+
+
+_probe_test_database()
+
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
+
+def pytest_report_header(config):
+    return f"database: {DATABASE_URI}"
+
+
 @pytest.fixture
 def app():
     """Create application for testing"""
     app = create_app({
         'TESTING': True,
-        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
         'COST_PER_PERSON': 5
     })
     
@@ -10,6 +10,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from adcalc import create_app
 from adcalc.models import db, Organisation, Region, Broadcast, User
 
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
 
 @pytest.fixture
 def app():
@@ -17,7 +19,7 @@ def app():
     app = create_app(
         {
             "TESTING": True,
-            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            "SQLALCHEMY_DATABASE_URI": DATABASE_URI,
             "COST_PER_PERSON": 5,
             "SECRET_KEY": "test-secret-key",
             "EMAIL_WHITELIST": "test@example.com"
@@ -82,7 +84,8 @@ def app():
         db.session.commit()
 
         yield app
-
+        db.session.remove()
+        db.drop_all()
 
 
 @pytest.fixture
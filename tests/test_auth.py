@@ -8,13 +8,15 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from adcalc import create_app
 from adcalc.models import db, User
 
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
 
 @pytest.fixture
 def app():
     """Create application for testing"""
     app = create_app({
         'TESTING': True,
-        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
         'SECRET_KEY': 'test-secret-key',
         'COST_PER_PERSON': 5
     })
@@ -16,12 +16,15 @@ Fixture costs (COST_PER_PERSON is unused here; formula is smi_rating/100 * popul
 import pytest
 import sys
 import os
+from sqlalchemy import event
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from adcalc import create_app
 from adcalc.models import db, Organisation, Region, Broadcast
-from adcalc.utils import calculate_cost
+from adcalc.utils import calculate_cost, calculate_costs, refresh_costs
+
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
 
 
 # ---------------------------------------------------------------------------
@@ -44,7 +47,7 @@ GRAND_TOTAL = ORG1_COST + ORG2_COST   # 1200.0
 def app():
     app = create_app({
         "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "SQLALCHEMY_DATABASE_URI": DATABASE_URI,
         "COST_PER_PERSON": COST_PER_PERSON,
         "SECRET_KEY": "test-secret-key",
         "EMAIL_WHITELIST": "test@example.com",
@@ -87,6 +90,8 @@ def app():
         db.session.commit()
 
         yield app
+        db.session.remove()
+        db.drop_all()
 
 
 @pytest.fixture
@@ -145,6 +150,103 @@ class TestCalculateCost:
             assert calculate_cost(None) == 0
 
 
+class TestCalculateCosts:
+    def test_query_matches_calculate_cost(self, app):
+        with app.app_context():
+            costs = calculate_costs(Broadcast.query)
+            assert len(costs) == 4
+            for b in Broadcast.query.all():
+                assert abs(costs[b.id] - calculate_cost(b)) < 0.001
+
+    def test_filtered_query(self, app):
+        with app.app_context():
+            region2 = Region.query.filter_by(name="Регион 2").first()
+            costs = calculate_costs(Broadcast.query.filter_by(region_id=region2.id))
+            assert abs(sum(costs.values()) - ORG2_COST) < 0.001
+
+    def test_list_of_broadcasts(self, app):
+        with app.app_context():
+            broadcasts = Broadcast.query.all()
+            costs = calculate_costs(broadcasts)
+            assert abs(sum(costs.values()) - GRAND_TOTAL) < 0.001
+
+    def test_missing_values_give_zero(self, app):
+        with app.app_context():
+            region = Region(name="Без рейтинга", rating=None)
+            db.session.add(region)
+            db.session.commit()
+            org = Organisation.query.first()
+            db.session.add_all([
+                Broadcast(org_id=org.id, region_id=region.id, smi_rating=1.0,
+                          district_population=10_000),
+                Broadcast(org_id=org.id, region_id=Region.query.first().id, smi_rating=None,
+                          district_population=10_000),
+            ])
+            db.session.commit()
+            costs = calculate_costs(Broadcast.query)
+            assert len(costs) == 6
+            assert abs(sum(costs.values()) - GRAND_TOTAL) < 0.001
+
+    @pytest.mark.skipif(not DATABASE_URI.startswith('sqlite'), reason='needs a database without foreign key checks')
+    def test_missing_region_gives_zero(self, app):
+        with app.app_context():
+            org = Organisation.query.first()
+            db.session.add(Broadcast(org_id=org.id, region_id=999, smi_rating=1.0,
+                                     district_population=10_000))
+            db.session.commit()
+            costs = calculate_costs(Broadcast.query)
+            assert len(costs) == 5
+            assert abs(sum(costs.values()) - GRAND_TOTAL) < 0.001
+
+    def test_empty_input(self, app):
+        with app.app_context():
+            assert calculate_costs([]) == {}
+            assert calculate_costs(Broadcast.query.filter_by(region_id=999)) == {}
+
+
+class TestMaterializedCost:
+    def test_cost_stored_on_insert(self, app):
+        with app.app_context():
+            for b in Broadcast.query.all():
+                assert abs(b.cost - calculate_cost(b)) < 0.001
+
+    def test_cost_updated_with_broadcast_fields(self, app):
+        with app.app_context():
+            b = Broadcast.query.filter_by(smi_name="СМИ 1", district_name="Район 1").first()
+            b.smi_rating = 3.0
+            db.session.commit()
+            assert abs(b.cost - 3.0 / 100 * 10_000 * 1.0) < 0.001
+
+            region2 = Region.query.filter_by(name="Регион 2").first()
+            b.region_id = region2.id
+            db.session.commit()
+            assert abs(b.cost - 3.0 / 100 * 10_000 * 1.5) < 0.001
+
+    def test_region_rating_change_updates_costs(self, app):
+        """Рейтинг, измененный без refresh_costs (init_db, merge), тоже пересчитывает стоимость"""
+        with app.app_context():
+            region1 = Region.query.filter_by(name="Регион 1").first()
+            b = Broadcast.query.filter_by(region_id=region1.id).order_by(Broadcast.id).first()
+            assert abs(b.cost - B1_COST) < 0.001
+            db.session.merge(Region(id=region1.id, name=region1.name, rating=0.4))
+            db.session.commit()
+            assert abs(b.cost - 0.4 * B1_COST) < 0.001
+            total = db.session.query(db.func.sum(Broadcast.cost)).scalar()
+            assert abs(total - (0.4 * ORG1_COST + ORG2_COST)) < 0.001
+
+    def test_refresh_costs_for_region(self, app):
+        with app.app_context():
+            region1 = Region.query.filter_by(name="Регион 1").first()
+            region1.rating = 2.0
+            assert refresh_costs(region1.id) == 2
+            db.session.commit()
+            costs = sorted(b.cost for b in Broadcast.query.filter_by(region_id=region1.id))
+            assert abs(costs[0] - 2 * B1_COST) < 0.001
+            assert abs(costs[1] - 2 * B2_COST) < 0.001
+            total = db.session.query(db.func.sum(Broadcast.cost)).scalar()
+            assert abs(total - (2 * ORG1_COST + ORG2_COST)) < 0.001
+
+
 # ---------------------------------------------------------------------------
 # API response shape
 # ---------------------------------------------------------------------------
@@ -194,6 +296,46 @@ class TestApiOrganisationsDetailed:
         assert abs(org2["cost"] - ORG2_COST) < 0.001
 
 
+    def test_org_without_broadcasts_listed(self, app, client):
+        with app.app_context():
+            db.session.add(Organisation(name="Организация 3"))
+            db.session.commit()
+        data = api_data(client)
+        org3 = get_org(data, "Организация 3")
+        assert org3["broadcasts"] == []
+        assert org3["cost"] == 0
+
+    def test_query_count_does_not_grow_with_organisations(self, app, client):
+        """The endpoint is built from a constant number of SQL statements."""
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            api_data(client)
+            baseline = len(statements)
+
+            region = Region.query.first()
+            for i in range(10):
+                org = Organisation(name=f"Доп. организация {i}")
+                db.session.add(org)
+                db.session.flush()
+                db.session.add(Broadcast(
+                    org_id=org.id, region_id=region.id, smi_name="СМИ 3",
+                    smi_rating=1.0, district_name="Район 3", district_population=1_000,
+                ))
+            db.session.commit()
+
+            statements.clear()
+            data = api_data(client)
+            assert len(data) == 12
+            assert len(statements) == baseline
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count)
+
+
 # ---------------------------------------------------------------------------
 # Per-broadcast budget share: broadcast_share = (b.cost / totalCost) * budget
 # ---------------------------------------------------------------------------
@@ -317,3 +459,75 @@ class TestPerBroadcastBudgetShare:
         assert abs(share_b2 - B2_COST) < 0.001   # 200
         assert abs(share_b3 - B3_COST) < 0.001   # 300
         assert abs(share_b2 + share_b3 - budget) < 0.001
+
+
+# ---------------------------------------------------------------------------
+# Server-side allocation: POST /api/budget/allocate
+# ---------------------------------------------------------------------------
+
+def allocate(client, **payload):
+    return client.post("/api/budget/allocate", json=payload)
+
+
+def broadcast_id(app, smi_name, district_name):
+    with app.app_context():
+        return Broadcast.query.filter_by(smi_name=smi_name, district_name=district_name).first().id
+
+
+class TestBudgetAllocateApi:
+    def test_all_orgs_selected(self, client):
+        data = api_data(client)
+        resp = allocate(client, budget=GRAND_TOTAL, org_ids=[o["id"] for o in data])
+        assert resp.status_code == 200
+        result = resp.get_json()
+        assert abs(result["total_cost"] - GRAND_TOTAL) < 0.001
+        assert abs(sum(o["share"] for o in result["organisations"]) - GRAND_TOTAL) < 0.001
+        org1 = get_org(result["organisations"], "Организация 1")
+        org2 = get_org(result["organisations"], "Организация 2")
+        assert abs(org1["share"] - ORG1_COST) < 0.001
+        assert abs(org2["share"] - ORG2_COST) < 0.001
+        shares = sorted(b["share"] for o in result["organisations"] for b in o["broadcasts"])
+        for share, expected in zip(shares, [B1_COST, B2_COST, B3_COST, B4_COST]):
+            assert abs(share - expected) < 0.001
+
+    def test_cross_org_broadcast_selection(self, app, client):
+        """b2 (cost=200) and b3 (cost=300) with budget 500 get 200 and 300."""
+        b2 = broadcast_id(app, "СМИ 2", "Район 1")
+        b3 = broadcast_id(app, "СМИ 1", "Район 2")
+        result = allocate(client, budget=500, broadcast_ids=[b2, b3]).get_json()
+        assert abs(result["total_cost"] - (B2_COST + B3_COST)) < 0.001
+        assert len(result["organisations"]) == 2
+        shares = {b["id"]: b["share"] for o in result["organisations"] for b in o["broadcasts"]}
+        assert abs(shares[b2] - B2_COST) < 0.001
+        assert abs(shares[b3] - B3_COST) < 0.001
+
+    def test_org_and_broadcast_selection_overlap(self, app, client):
+        """A broadcast selected both directly and through its org is counted once."""
+        data = api_data(client)
+        org1 = get_org(data, "Организация 1")
+        b1 = broadcast_id(app, "СМИ 1", "Район 1")
+        result = allocate(client, budget=3_000, org_ids=[org1["id"]], broadcast_ids=[b1]).get_json()
+        assert abs(result["total_cost"] - ORG1_COST) < 0.001
+        assert len(result["organisations"][0]["broadcasts"]) == 2
+        assert abs(result["organisations"][0]["share"] - 3_000) < 0.001
+
+    def test_invalid_budget(self, client):
+        assert allocate(client, org_ids=[1]).status_code == 400
+        assert allocate(client, budget="abc", org_ids=[1]).status_code == 400
+        assert allocate(client, budget=-5, org_ids=[1]).status_code == 400
+
+    def test_empty_selection(self, client):
+        assert allocate(client, budget=100).status_code == 400
+        assert allocate(client, budget=100, broadcast_ids="1").status_code == 400
+
+    @pytest.mark.parametrize("ids", [[True], [False], [1.9], ["1"], [None], [2 ** 63], [-2 ** 63 - 1]])
+    def test_invalid_ids(self, client, ids):
+        resp = allocate(client, budget=100, org_ids=ids)
+        assert resp.status_code == 400
+        assert resp.get_json()["error"] == "ids must be integers"
+        assert allocate(client, budget=100, broadcast_ids=ids).status_code == 400
+
+    def test_zero_cost_selection(self, client):
+        resp = allocate(client, budget=100, broadcast_ids=[999])
+        assert resp.status_code == 400
+        assert "error" in resp.get_json()
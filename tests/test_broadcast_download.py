@@ -9,13 +9,15 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from adcalc import create_app
 from adcalc.models import db, Organisation, Region, Broadcast, User
 
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
 
 @pytest.fixture
 def app():
     """Create application for testing"""
     app = create_app({
         'TESTING': True,
-        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
         'COST_PER_PERSON': 5,
         'SECRET_KEY': 'test-secret-key'
     })
@@ -99,3 +101,92 @@ def test_broadcast_download_excel_with_data(client):
     assert df.loc[0, 'region_id'] == reg_id
     assert df.loc[0, 'smi_name'] == 'SMI'
     assert df.loc[0, 'district_population'] == 1000
+
+
+def _create_broadcasts(count):
+    org = Organisation(name='Организация')
+    reg = Region(name='Reg1', rating=1.0)
+    db.session.add_all([org, reg])
+    db.session.commit()
+    db.session.add_all([
+        Broadcast(
+            org_id=org.id,
+            region_id=reg.id,
+            smi_name=f'СМИ {i}',
+            smi_rating=1.0,
+            district_name=f'Район {i}',
+            district_population=100 * (i + 1),
+            frequency='100.1',
+        )
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def test_broadcast_download_excel_many_rows(client, monkeypatch):
+    """Rows fetched in several batches all end up in the spreadsheet in id order"""
+    from adcalc import broadcast as broadcast_module
+    monkeypatch.setattr(broadcast_module, 'EXPORT_BATCH_SIZE', 7)
+    monkeypatch.setattr(broadcast_module, 'EXPORT_CHUNK_SIZE', 512)
+    with client.application.app_context():
+        _create_broadcasts(25)
+
+    rv = client.get('/broadcast/download_excel')
+    assert rv.status_code == 200
+    import pandas as pd
+    df = pd.read_excel(BytesIO(rv.data), sheet_name='table')
+    assert len(df) == 25
+    assert df['smi_name'].tolist() == [f'СМИ {i}' for i in range(25)]
+    assert df['price'].tolist() == [float(i + 1) for i in range(25)]
+
+
+def test_broadcast_download_excel_closed_without_reading(client, monkeypatch):
+    """The temporary xlsx file is closed even if the client never reads the body"""
+    from adcalc import broadcast as broadcast_module
+    files = []
+    temporary_file = broadcast_module.tempfile.TemporaryFile
+
+    def track(*args, **kwargs):
+        files.append(temporary_file(*args, **kwargs))
+        return files[-1]
+
+    monkeypatch.setattr(broadcast_module.tempfile, 'TemporaryFile', track)
+    app = client.application
+    with app.test_request_context('/broadcast/download_excel'):
+        from flask import session
+        session['user_id'] = 1
+        rv = app.full_dispatch_request()
+    assert rv.status_code == 200
+    assert not files[0].closed
+    # The WSGI server closes the response of a client that went away
+    rv.close()
+    assert files[0].closed
+
+
+def test_broadcast_download_csv(client, monkeypatch):
+    """GET /broadcast/download_excel?format=csv streams a CSV with the same columns"""
+    from adcalc import broadcast as broadcast_module
+    monkeypatch.setattr(broadcast_module, 'EXPORT_BATCH_SIZE', 4)
+    with client.application.app_context():
+        _create_broadcasts(10)
+
+    rv = client.get('/broadcast/download_excel?format=csv')
+    assert rv.status_code == 200
+    assert rv.mimetype == 'text/csv'
+    assert 'broadcasts.csv' in rv.headers['Content-Disposition']
+    import pandas as pd
+    df = pd.read_csv(BytesIO(rv.data), encoding='utf-8-sig')
+    assert list(df.columns) == broadcast_module.EXPORT_COLUMNS
+    assert len(df) == 10
+    assert df.loc[0, 'org_name'] == 'Организация'
+    assert df.loc[9, 'district_population'] == 1000
+    assert df.loc[9, 'price'] == 10.0
+
+
+def test_broadcast_download_csv_empty(client):
+    rv = client.get('/broadcast/download_excel?format=csv')
+    assert rv.status_code == 200
+    assert rv.data.decode('utf-8-sig').strip() == ','.join(
+        ['org_id', 'org_name', 'region_id', 'smi_name', 'smi_rating',
+         'smi_male_proportion', 'district_name', 'district_population',
+         'frequency', 'power', 'price'])
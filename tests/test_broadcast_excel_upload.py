@@ -10,13 +10,15 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from adcalc import create_app
 from adcalc.models import db, Organisation, Region, Broadcast, User
 
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
 
 @pytest.fixture
 def app():
     """Create application for testing"""
     app = create_app({
         'TESTING': True,
-        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
         'COST_PER_PERSON': 5, 
         'SECRET_KEY': 'test-secret-key'
     })
@@ -302,3 +304,118 @@ def test_broadcast_upload_excel_with_nulls(client):
     assert broadcasts[0].smi_name is None
     assert broadcasts[0].smi_rating is None
     assert broadcasts[0].district_population is None
+
+
+def _upload(client, df):
+    excel_file = BytesIO()
+    df.to_excel(excel_file, index=False)
+    excel_file.seek(0)
+    return client.post(
+        '/broadcast/upload_excel',
+        data={'excel_file': (excel_file, 'test.xlsx')},
+        content_type='multipart/form-data'
+    )
+
+
+def _flashes(client):
+    with client.session_transaction() as session:
+        return session.get('_flashes', [])
+
+
+def test_broadcast_upload_excel_error_report(client):
+    """POST /broadcast/upload_excel – every invalid row is reported, nothing is inserted"""
+    org = _create_organisation("Test Org")
+    region = _create_region("Test Region")
+
+    import pandas as pd
+    df = pd.DataFrame({
+        'org_id': [org.id, 9999, org.id, 'abc'],
+        'smi_name': ['SMI 1', 'SMI 2', 'SMI 3', 'SMI 4'],
+        'smi_rating': [10.0, 1.0, 'высокий', 1.0],
+        'smi_male_proportion': [0.3, 0.3, 0.3, 0.3],
+        'district_name': ['D1', 'D2', 'D3', 'D4'],
+        'district_population': [5000, 5000, 5000, 5000],
+        'region_id': [region.id, region.id, region.id, region.id],
+        'frequency': ['9.5', '9.5', '9.5', '9.5'],
+        'power': [1.0, 1.0, 1.0, 1.0]
+    })
+    rv = _upload(client, df)
+    assert rv.status_code == 302
+    assert Broadcast.query.count() == 0
+
+    category, message = _flashes(client)[-1]
+    assert category == 'error'
+    assert 'ошибок: 3' in message
+    assert 'Строка 3: Не найдена организация с ID 9999' in message
+    assert 'Строка 4: Поле smi_rating должно содержать только числовые значения: высокий' in message
+    assert 'Строка 5: org_id должен быть целым числом: abc' in message
+
+
+def test_broadcast_upload_excel_skips_rows_without_required_fields(client):
+    """Rows without org_id, region_id or frequency are skipped, the rest is imported"""
+    org = _create_organisation("Test Org")
+    region = _create_region("Test Region")
+
+    import pandas as pd
+    df = pd.DataFrame({
+        'org_id': [org.id, None, org.id],
+        'smi_name': ['SMI 1', 'SMI 2', 'SMI 3'],
+        'smi_rating': [10.0, 1.0, 1.0],
+        'smi_male_proportion': [0.3, 0.3, 0.3],
+        'district_name': ['D1', 'D2', 'D3'],
+        'district_population': [5000, 5000, 5000],
+        'region_id': [region.id, region.id, region.id],
+        'frequency': ['9.5', '9.5', None],
+        'power': [1.0, 1.0, 1.0]
+    })
+    rv = _upload(client, df)
+    assert rv.status_code == 302
+    assert [b.smi_name for b in Broadcast.query.all()] == ['SMI 1']
+    assert _flashes(client)[-1] == ('success', 'Файл успешно загружен, импортировано 1 записей')
+
+
+def test_broadcast_upload_excel_bulk_insert_in_chunks(client, monkeypatch):
+    """Large uploads are inserted in chunks with a constant number of lookups and stored cost"""
+    from adcalc import excel_import
+    monkeypatch.setattr(excel_import, 'IMPORT_CHUNK_SIZE', 50)
+    orgs = [_create_organisation(f"Org {i}") for i in range(3)]
+    region = _create_region("Test Region", rating=2.0)
+
+    import pandas as pd
+    n = 230
+    df = pd.DataFrame({
+        'org_id': [orgs[i % 3].id for i in range(n)],
+        'smi_name': [f'SMI {i}' for i in range(n)],
+        'smi_rating': [1.0] * n,
+        'smi_male_proportion': [0.5] * n,
+        'district_name': [f'D {i}' for i in range(n)],
+        'district_population': [1000 + i for i in range(n)],
+        'region_id': [region.id] * n,
+        'frequency': [100.5] * n,
+        'power': [None] * n
+    })
+
+    from sqlalchemy import event
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        rv = _upload(client, df)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert rv.status_code == 302
+
+    inserts = [s for s in statements if s.startswith('INSERT INTO broadcast')]
+    selects = [s for s in statements if s.startswith('SELECT')]
+    assert len(inserts) == 5
+    assert len(selects) <= 2
+
+    broadcasts = Broadcast.query.order_by(Broadcast.id).all()
+    assert len(broadcasts) == n
+    assert broadcasts[0].frequency == '100.5'
+    assert broadcasts[0].power is None
+    assert broadcasts[-1].district_population == 1000 + n - 1
+    assert broadcasts[-1].cost == pytest.approx((1000 + n - 1) / 100 * 2.0)
@@ -0,0 +1,187 @@
+# tests/test_broadcast_list.py
+import pytest
+import re
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from adcalc import create_app
+from adcalc.broadcast import list_broadcasts
+from adcalc.models import db, Organisation, Region, Broadcast, User
+
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
+
+@pytest.fixture
+def app():
+    """Create application for testing"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+    with app.app_context():
+        db.create_all()
+
+        regions = [Region(name="Регион 1", rating=1.0), Region(name="Регион 2", rating=2.0)]
+        orgs = [Organisation(name="Организация 1"), Organisation(name="Организация 2")]
+        db.session.add_all(regions + orgs)
+        db.session.commit()
+        # Costs and populations repeat, so that ties are broken by id
+        db.session.add_all([
+            Broadcast(
+                org_id=orgs[i % 2].id, region_id=regions[i % 3 == 0].id,
+                smi_name=f"СМИ {i % 4}", smi_rating=1.0, district_name=f"Район {i}",
+                district_population=None if i % 10 == 0 else 1000 * (i % 7),
+            )
+            for i in range(120)
+        ])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create authenticated test client"""
+    user = User(username='testuser', email='test@example.com')
+    user.set_password('testpass')
+    db.session.add(user)
+    db.session.commit()
+
+    test_client = app.test_client()
+    with test_client:
+        test_client.post('/auth/login', data={
+            'username': 'testuser',
+            'password': 'testpass'
+        })
+    return test_client
+
+
+@pytest.fixture
+def statements(app):
+    """Collect SQL statements executed during the test"""
+    collected = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        collected.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    yield collected
+    event.remove(db.engine, 'before_cursor_execute', count)
+
+
+def _walk(per_page=7, **kwargs):
+    """All pages from the first one following next cursors"""
+    pages = [list_broadcasts(per_page=per_page, **kwargs)]
+    while pages[-1].next_cursor:
+        pages.append(list_broadcasts(per_page=per_page, after=pages[-1].next_cursor, **kwargs))
+    return pages
+
+
+def _ids(page):
+    return [b.id for b in page.items]
+
+
+def test_pages_by_id(app):
+    pages = _walk()
+    ids = [i for page in pages for i in _ids(page)]
+    assert ids == sorted(b.id for b in Broadcast.query.all())
+    assert [len(page.items) for page in pages] == [7] * 17 + [1]
+    assert pages[0].prev_cursor is None
+    assert pages[-1].next_cursor is None
+
+
+@pytest.mark.parametrize('sort, key', [
+    ('cost', lambda b: b.cost),
+    ('population', lambda b: b.district_population or 0),
+])
+@pytest.mark.parametrize('descending', [False, True])
+def test_pages_by_sort_key(app, sort, key, descending):
+    broadcasts = Broadcast.query.all()
+    expected = sorted(broadcasts, key=lambda b: (key(b), b.id), reverse=descending)
+
+    pages = _walk(sort=sort, descending=descending)
+    assert [i for page in pages for i in _ids(page)] == [b.id for b in expected]
+
+
+@pytest.mark.parametrize('sort', ['id', 'cost', 'population'])
+def test_previous_pages(app, sort):
+    pages = _walk(sort=sort, descending=True)
+    for previous, page in zip(pages, pages[1:]):
+        back = list_broadcasts(sort=sort, descending=True, per_page=7, before=page.prev_cursor)
+        assert _ids(back) == _ids(previous)
+        assert back.next_cursor == previous.next_cursor
+        assert back.prev_cursor == previous.prev_cursor
+
+
+def test_filters(app):
+    org = Organisation.query.filter_by(name="Организация 2").one()
+    region = Region.query.filter_by(name="Регион 2").one()
+    filters = {Broadcast.org_id: org.id, Broadcast.region_id: region.id, Broadcast.smi_name: "СМИ 3"}
+
+    ids = [i for page in _walk(filters=filters, per_page=2) for i in _ids(page)]
+    expected = Broadcast.query.filter_by(org_id=org.id, region_id=region.id, smi_name="СМИ 3").order_by(Broadcast.id)
+    assert ids == [b.id for b in expected]
+    assert ids
+
+
+def test_malformed_cursor_starts_from_first_page(app):
+    assert _ids(list_broadcasts(sort='cost', after='abc', per_page=5)) == \
+        _ids(list_broadcasts(sort='cost', per_page=5))
+
+
+def test_list_view_single_joined_query(client, statements):
+    rv = client.get('/broadcast/list?sort=cost&order=desc')
+    assert rv.status_code == 200
+
+    broadcast_queries = [s for s in statements if re.search(r'\bFROM broadcast\b', s)]
+    assert len(broadcast_queries) == 1
+    assert 'JOIN organisation' in broadcast_queries[0]
+    assert 'JOIN region' in broadcast_queries[0]
+    assert not any('count(' in s.lower() for s in statements)
+
+
+@pytest.mark.skipif(not DATABASE_URI.startswith('sqlite'), reason='needs a database without foreign key checks')
+def test_broadcasts_without_org_or_region_are_listed(client):
+    db.session.add_all([
+        Broadcast(org_id=999, region_id=Region.query.first().id, smi_name="Без организации", smi_rating=1.0),
+        Broadcast(org_id=Organisation.query.first().id, region_id=999, smi_name="Без региона", smi_rating=1.0),
+    ])
+    db.session.commit()
+
+    items = [b for page in _walk() for b in page.items]
+    assert len(items) == 122
+    assert {b.smi_name for b in items if b.org is None or b.region is None} == {"Без организации", "Без региона"}
+
+    rv = client.get('/broadcast/list?sort=id&order=desc')
+    assert rv.status_code == 200
+    html = rv.get_data(as_text=True)
+    assert "Без организации" in html
+    assert "Без региона" in html
+
+
+def test_list_view_pages_keep_filters(client):
+    region = Region.query.filter_by(name="Регион 1").one()
+    rv = client.get(f'/broadcast/list?region_id={region.id}&sort=population')
+    html = rv.get_data(as_text=True)
+    links = re.findall(r'href="(/broadcast/list\?[^"]*after=[^"]+)"', html)
+    assert links
+    next_url = links[0].replace('&amp;', '&')
+    assert f'region_id={region.id}' in next_url
+    assert 'sort=population' in next_url
+
+    rv = client.get(next_url)
+    assert rv.status_code == 200
+    assert 'before=' in rv.get_data(as_text=True)
+
+
+def test_list_view_filter_by_smi(client):
+    rv = client.get('/broadcast/list?smi=СМИ 1')
+    html = rv.get_data(as_text=True)
+    assert 'Район 1<' in html
+    assert 'Район 2<' not in html
@@ -0,0 +1,66 @@
+# tests/test_database.py
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from adcalc import create_app
+from adcalc.database import DEFAULT_DATABASE_URI, DEFAULT_POOL, database_uri, engine_options
+from adcalc.models import db
+
+
+def test_database_uri_from_environment():
+    assert database_uri({}) == DEFAULT_DATABASE_URI
+    assert database_uri({'DATABASE_URL': ''}) == DEFAULT_DATABASE_URI
+    assert database_uri({'DATABASE_URL': 'postgresql+psycopg://u:p@db/adcalc'}) == 'postgresql+psycopg://u:p@db/adcalc'
+    assert database_uri({'DATABASE_URL': 'postgres://u:p@db/adcalc'}) == 'postgresql://u:p@db/adcalc'
+
+
+def test_engine_options_defaults_and_overrides():
+    assert engine_options('postgresql://u:p@db/adcalc', {}) == DEFAULT_POOL
+    assert engine_options('sqlite:///broadcasts.db', {}) == DEFAULT_POOL
+
+    options = engine_options('postgresql://u:p@db/adcalc', {
+        'DB_POOL_SIZE': '20',
+        'DB_MAX_OVERFLOW': '0',
+        'DB_POOL_RECYCLE': '600',
+        'DB_POOL_PRE_PING': 'false',
+        'DB_POOL_TIMEOUT': '',
+    })
+    assert options['pool_size'] == 20
+    assert options['max_overflow'] == 0
+    assert options['pool_recycle'] == 600
+    assert options['pool_pre_ping'] is False
+    assert options['pool_timeout'] == DEFAULT_POOL['pool_timeout']
+
+
+def test_engine_options_in_memory_sqlite():
+    assert engine_options('sqlite://', {}) == {}
+    assert engine_options('sqlite:///:memory:', {'DB_POOL_SIZE': '20'}) == {}
+
+
+def test_create_app_uses_database_url(tmp_path, monkeypatch):
+    # The production config also sets up file logging in the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'env.db'}")
+    monkeypatch.setenv('DB_POOL_SIZE', '3')
+    monkeypatch.setenv('DB_POOL_RECYCLE', '60')
+
+    app = create_app()
+    try:
+        assert app.config['SQLALCHEMY_DATABASE_URI'] == f"sqlite:///{tmp_path / 'env.db'}"
+        with app.app_context():
+            pool = db.engine.pool
+            assert pool.size() == 3
+            assert pool._recycle == 60
+            assert pool._pre_ping is True
+            db.session.execute(text('SELECT 1'))
+            db.session.remove()
+            db.engine.dispose()
+        assert (tmp_path / 'env.db').exists()
+    finally:
+        for handler in app.logger.handlers[:]:
+            app.logger.removeHandler(handler)
+            handler.close()
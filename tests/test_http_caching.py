@@ -0,0 +1,214 @@
+# tests/test_http_caching.py
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, update
+from adcalc import create_app
+from adcalc.models import db, DataVersion, Organisation, Region, Broadcast, User, UploadJob
+
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
+
+@pytest.fixture
+def app():
+    """Create application for testing"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+    with app.app_context():
+        db.create_all()
+
+        region = Region(name="Регион 1", rating=2.0)
+        org = Organisation(name="Организация 1")
+        db.session.add_all([region, org])
+        db.session.commit()
+        db.session.add_all([
+            Broadcast(org_id=org.id, region_id=region.id, smi_name=f"СМИ {i}", smi_rating=1.0,
+                      district_name=f"Район {i}", district_population=1000)
+            for i in range(3)
+        ])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create test client"""
+    return app.test_client()
+
+
+@pytest.fixture
+def statements(app):
+    """Collect SQL statements executed during the test"""
+    collected = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        collected.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    yield collected
+    event.remove(db.engine, 'before_cursor_execute', count)
+
+
+def _version():
+    db.session.expire_all()
+    return db.session.get(DataVersion, 1).version
+
+
+def _region_url():
+    return f"/api/region/{Region.query.first().id}/broadcasts"
+
+
+@pytest.mark.parametrize('url', ['/api/organisations-detailed', '/api/region/0/broadcasts'])
+def test_etag_and_not_modified(client, statements, url):
+    rv = client.get(url)
+    assert rv.status_code == 200
+    assert rv.headers['ETag']
+    assert rv.headers['Last-Modified']
+    assert rv.headers['Cache-Control'] == 'no-cache'
+    assert rv.content_type == 'application/json'
+
+    statements.clear()
+    rv = client.get(url, headers={'If-None-Match': rv.headers['ETag']})
+    assert rv.status_code == 304
+    assert rv.data == b''
+    # Served from the response cache without touching the database
+    assert statements == []
+
+
+def test_if_modified_since(client):
+    rv = client.get('/api/organisations-detailed')
+    rv = client.get('/api/organisations-detailed', headers={'If-Modified-Since': rv.headers['Last-Modified']})
+    assert rv.status_code == 304
+
+
+def test_payload_unchanged(client):
+    data = client.get('/api/organisations-detailed').get_json()
+    assert data == client.get('/api/organisations-detailed').get_json()
+    assert data[0]['name'] == "Организация 1"
+    assert len(data[0]['broadcasts']) == 3
+    assert client.get('/api/region/0/broadcasts').get_json()['broadcast_count'] == 3
+
+
+def test_write_changes_version_and_etag(client):
+    url = _region_url()
+    etag = client.get(url).headers['ETag']
+    version = _version()
+
+    org = Organisation.query.first()
+    db.session.add(Broadcast(org_id=org.id, region_id=Region.query.first().id, smi_rating=1.0,
+                             district_name="Район 9", district_population=1000))
+    db.session.commit()
+    assert _version() == version + 1
+
+    rv = client.get(url, headers={'If-None-Match': etag})
+    assert rv.status_code == 200
+    assert rv.headers['ETag'] != etag
+    assert rv.get_json()['broadcast_count'] == 4
+
+
+def test_organisation_rename_changes_response(client):
+    etag = client.get('/api/organisations-detailed').headers['ETag']
+    Organisation.query.first().name = "Переименованная"
+    db.session.commit()
+    rv = client.get('/api/organisations-detailed', headers={'If-None-Match': etag})
+    assert rv.status_code == 200
+    assert rv.get_json()[0]['name'] == "Переименованная"
+
+
+def test_bulk_statement_bumps_version(client):
+    version = _version()
+    db.session.execute(update(Broadcast).values(cost=1.0))
+    db.session.commit()
+    assert _version() == version + 1
+    assert client.get('/api/region/0/broadcasts').get_json()['region_cost'] == 3.0
+
+
+def test_one_bump_per_commit(client):
+    version = _version()
+    region = Region.query.first()
+    region.rating = 3.0
+    db.session.flush()
+    Organisation.query.first().name = "Другая"
+    db.session.commit()
+    assert _version() == version + 1
+
+
+def test_other_writes_and_rollback_keep_version(client):
+    version = _version()
+    user = User(username='testuser', email='test@example.com')
+    user.set_password('testpass')
+    db.session.add_all([user, UploadJob(filename='a.xlsx', path='/tmp/a.xlsx')])
+    db.session.commit()
+    assert _version() == version
+
+    Organisation.query.first().name = "Отмена"
+    db.session.flush()
+    db.session.rollback()
+    assert _version() == version
+
+
+def test_version_bumped_by_another_process(app, client):
+    """Another worker's commit is seen once DATA_VERSION_TTL has passed"""
+    app.config['DATA_VERSION_TTL'] = 0
+    url = _region_url()
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    # Writes of another process: no session events here, only its version bump
+    with db.engine.begin() as conn:
+        conn.execute(Broadcast.__table__.delete())
+        conn.execute(update(DataVersion.__table__).values(version=DataVersion.__table__.c.version + 1))
+
+    rv = client.get(url, headers={'If-None-Match': etag})
+    assert rv.status_code == 200
+    # The region summaries cached by this process were dropped too
+    assert rv.get_json()['broadcast_count'] == 0
+
+
+def test_version_trusted_within_ttl(app, client, statements):
+    client.get('/api/organisations-detailed')
+    client.get('/api/region/0/broadcasts')
+    statements.clear()
+    client.get('/api/organisations-detailed')
+    client.get('/api/region/0/broadcasts')
+    assert statements == []
+
+
+def test_database_without_data_version_table():
+    """A database upgraded without flask init-db: writes and the cached API keep working"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
+        'SECRET_KEY': 'test-secret-key'
+    })
+    with app.app_context():
+        db.create_all()
+        DataVersion.__table__.drop(db.engine)
+        try:
+            client = app.test_client()
+            org = Organisation(name="Организация 1")
+            db.session.add(org)
+            db.session.commit()
+            rv = client.get('/api/organisations-detailed')
+            assert rv.status_code == 200
+            assert rv.headers['ETag']
+            assert client.get('/api/organisations-detailed',
+                              headers={'If-None-Match': rv.headers['ETag']}).status_code == 304
+
+            org.name = "Переименованная"
+            db.session.commit()
+            rv = client.get('/api/organisations-detailed', headers={'If-None-Match': rv.headers['ETag']})
+            assert rv.status_code == 200
+            assert rv.get_json()[0]['name'] == "Переименованная"
+        finally:
+            db.session.remove()
+            db.drop_all()
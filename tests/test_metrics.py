@@ -0,0 +1,168 @@
+# tests/test_metrics.py
+import pytest
+import re
+import sys
+import os
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from adcalc import create_app
+from adcalc.metrics import MetricsRegistry, registry
+from adcalc.models import db, Organisation, Region, Broadcast, User
+
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
+
+@pytest.fixture
+def app():
+    """Create application for testing"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+    with app.app_context():
+        db.create_all()
+
+        region = Region(name="Регион 1", rating=2.0)
+        org = Organisation(name="Организация 1")
+        db.session.add_all([region, org])
+        db.session.commit()
+        db.session.add_all([
+            Broadcast(org_id=org.id, region_id=region.id, smi_name=f"СМИ {i}", smi_rating=1.0,
+                      district_name=f"Район {i}", district_population=1000)
+            for i in range(3)
+        ])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create authenticated test client"""
+    user = User(username='testuser', email='test@example.com')
+    user.set_password('testpass')
+    db.session.add(user)
+    db.session.commit()
+
+    test_client = app.test_client()
+    with test_client:
+        test_client.post('/auth/login', data={
+            'username': 'testuser',
+            'password': 'testpass'
+        })
+    return test_client
+
+
+def _metrics(client):
+    """Samples of /metrics as {'name{labels}': value}"""
+    rv = client.get('/metrics')
+    assert rv.status_code == 200
+    assert rv.content_type.startswith('text/plain; version=0.0.4')
+    samples = {}
+    for line in rv.get_data(as_text=True).splitlines():
+        if line and not line.startswith('#'):
+            key, value = line.rsplit(' ', 1)
+            samples[key] = float(value)
+    return samples
+
+
+def test_registry_render_format():
+    metrics = MetricsRegistry(buckets=(0.1, 1.0))
+    metrics.inc('adcalc_http_requests_total', endpoint='a', method='GET', status='200')
+    metrics.inc('adcalc_http_requests_total', 2, endpoint='a', method='GET', status='200')
+    for value in (0.05, 0.1, 0.5, 3.0):
+        metrics.observe('adcalc_http_request_duration_seconds', value, endpoint='a"b')
+
+    text = metrics.render()
+    assert '# TYPE adcalc_http_requests_total counter' in text
+    assert 'adcalc_http_requests_total{endpoint="a",method="GET",status="200"} 3' in text
+    assert '# TYPE adcalc_http_request_duration_seconds histogram' in text
+    assert 'adcalc_http_request_duration_seconds_bucket{endpoint="a\\"b",le="0.1"} 2' in text
+    assert 'adcalc_http_request_duration_seconds_bucket{endpoint="a\\"b",le="1.0"} 3' in text
+    assert 'adcalc_http_request_duration_seconds_bucket{endpoint="a\\"b",le="+Inf"} 4' in text
+    assert 'adcalc_http_request_duration_seconds_sum{endpoint="a\\"b"} 3.65' in text
+    assert 'adcalc_http_request_duration_seconds_count{endpoint="a\\"b"} 4' in text
+
+
+def test_request_counts_latency_and_queries(app, client):
+    # Every request builds its response instead of reusing the cached one
+    app.config['CACHE_TTL'] = 0
+    for _ in range(3):
+        client.get('/api/organisations-detailed')
+    client.get('/no-such-page')
+
+    samples = _metrics(client)
+    endpoint = 'endpoint="api.api_organisations_detailed"'
+    assert samples[f'adcalc_http_requests_total{{{endpoint},method="GET",status="200"}}'] == 3
+    assert samples[f'adcalc_http_request_duration_seconds_count{{{endpoint}}}'] == 3
+    assert samples[f'adcalc_http_request_duration_seconds_bucket{{{endpoint},le="+Inf"}}'] == 3
+    assert samples[f'adcalc_http_request_duration_seconds_sum{{{endpoint}}}'] > 0
+    assert samples[f'adcalc_db_queries_total{{{endpoint}}}'] >= 3
+    assert samples[f'adcalc_db_query_duration_seconds_total{{{endpoint}}}'] > 0
+    assert samples['adcalc_http_requests_total{endpoint="unknown",method="GET",status="404"}'] == 1
+
+
+def test_cache_hit_ratio(client):
+    region = Region.query.first()
+    for _ in range(4):
+        client.get(f'/api/region/{region.id}/broadcasts')
+
+    client.get('/api/region/0/broadcasts')
+
+    samples = _metrics(client)
+    # Repeated requests are served from the response cache
+    assert samples['adcalc_cache_requests_total{cache="responses",result="miss"}'] == 2
+    assert samples['adcalc_cache_requests_total{cache="responses",result="hit"}'] == 3
+    assert samples['adcalc_cache_hit_ratio{cache="responses"}'] == 0.6
+    # The second response is built from the cached region summaries
+    assert samples['adcalc_cache_requests_total{cache="region_summaries",result="miss"}'] == 1
+    assert samples['adcalc_cache_requests_total{cache="region_summaries",result="hit"}'] == 1
+    assert samples['adcalc_cache_hit_ratio{cache="region_summaries"}'] == 0.5
+
+
+def test_excel_export_and_import_rows(client):
+    client.get('/broadcast/download_excel?format=csv').get_data()
+    client.get('/broadcast/download_excel').get_data()
+
+    org = Organisation.query.first()
+    region = Region.query.first()
+    excel_file = BytesIO()
+    pd.DataFrame([{
+        'org_id': org.id, 'smi_name': f'Новое СМИ {i}', 'smi_rating': 1.0, 'smi_male_proportion': 0.5,
+        'district_name': 'Район', 'district_population': 100, 'region_id': region.id,
+        'frequency': '100.0', 'power': 1.0,
+    } for i in range(5)]).to_excel(excel_file, index=False)
+    excel_file.seek(0)
+    client.post('/broadcast/upload_excel', data={'excel_file': (excel_file, 'test.xlsx')},
+                content_type='multipart/form-data')
+    assert Broadcast.query.count() == 8
+
+    samples = _metrics(client)
+    assert samples['adcalc_excel_export_rows_total'] == 6
+    assert samples['adcalc_excel_import_rows_total'] == 5
+
+
+def test_metrics_are_per_app(app, client):
+    client.get('/api/organisations-detailed')
+    other = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SECRET_KEY': 'test-secret-key'
+    })
+    assert registry(other) is not registry(app)
+    assert not registry(other).counters
+
+
+def test_metrics_token(app, client):
+    app.config['METRICS_TOKEN'] = 'secret'
+    assert client.get('/metrics').status_code == 401
+    rv = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert rv.status_code == 200
+    assert re.search(r'^# TYPE adcalc_db_queries_total counter$', rv.get_data(as_text=True), re.M)
@@ -0,0 +1,162 @@
+# tests/test_profiling.py
+import logging
+import pytest
+import re
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from adcalc import create_app
+from adcalc.models import db, Organisation, Region, Broadcast, User
+from adcalc.profiling import QueryProfile
+
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
+
+@pytest.fixture
+def app():
+    """Create application for testing"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create authenticated test client"""
+    user = User(username='testuser', email='test@example.com')
+    user.set_password('testpass')
+    db.session.add(user)
+    db.session.commit()
+
+    test_client = app.test_client()
+    with test_client:
+        test_client.post('/auth/login', data={
+            'username': 'testuser',
+            'password': 'testpass'
+        })
+    return test_client
+
+
+@pytest.fixture
+def statements(app):
+    """Collect SQL statements executed during the test"""
+    collected = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        collected.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    yield collected
+    event.remove(db.engine, 'before_cursor_execute', count)
+
+
+def _add_orgs(count, broadcasts_per_org=3):
+    region = Region.query.first()
+    if region is None:
+        region = Region(name="Регион", rating=1.0)
+        db.session.add(region)
+    orgs = [Organisation(name=f"Организация {i}") for i in range(count)]
+    db.session.add_all(orgs)
+    db.session.flush()
+    db.session.add_all([
+        Broadcast(org_id=org.id, region_id=region.id, smi_name=f"СМИ {i}",
+                  district_name=f"Район {i}", district_population=1000, smi_rating=1.0)
+        for org in orgs for i in range(broadcasts_per_org)
+    ])
+    db.session.commit()
+
+
+def _server_timing(response):
+    header = response.headers['Server-Timing']
+    match = re.fullmatch(r'db;dur=([\d.]+);desc="(\d+) queries", app;dur=([\d.]+)', header)
+    assert match, header
+    return float(match.group(1)), int(match.group(2)), float(match.group(3))
+
+
+def test_query_profile_keeps_slowest():
+    profile = QueryProfile(keep=2)
+    for seconds, statement in ((0.1, 'a'), (0.5, 'b'), (0.2, 'c'), (0.05, 'd')):
+        profile.record(statement, seconds)
+    assert profile.count == 4
+    assert profile.seconds == pytest.approx(0.85)
+    assert profile.slowest == [(0.5, 'b'), (0.2, 'c')]
+
+
+def test_server_timing_counts_request_statements(client, statements):
+    _add_orgs(2)
+    statements.clear()
+    rv = client.get('/api/organisations-detailed')
+    assert rv.status_code == 200
+
+    db_ms, count, total_ms = _server_timing(rv)
+    assert count == len(statements) > 0
+    assert 0 < db_ms <= total_ms
+
+
+def test_org_list_statement_count_does_not_grow_with_orgs(client):
+    """N+1 guard: the organisation list issues the same number of statements for 2 and 20 orgs"""
+    _add_orgs(2)
+    _, few, _ = _server_timing(client.get('/org/list'))
+    _add_orgs(18)
+    _, many, _ = _server_timing(client.get('/org/list'))
+    assert few == many
+
+
+def test_slow_request_is_logged_with_statements(app, client, caplog):
+    app.config['SLOW_REQUEST_MS'] = 0
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        client.get('/api/organisations-detailed?x=1')
+
+    records = [r.getMessage() for r in caplog.records if r.getMessage().startswith('Slow request')]
+    assert len(records) == 1
+    lines = records[0].split('\n')
+    assert lines[0].startswith('Slow request GET /api/organisations-detailed?x=1: ')
+    assert any('FROM organisation' in line for line in lines[1:])
+
+
+def test_request_with_many_statements_is_logged(app, client, caplog):
+    _add_orgs(2)
+    app.config['SLOW_REQUEST_QUERIES'] = 0
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        client.get('/org/list')
+    assert any(r.getMessage().startswith('Slow request GET /org/list') for r in caplog.records)
+
+
+def test_fast_request_is_not_logged(app, client, caplog):
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        client.get('/api/organisations-detailed')
+    assert not any(r.getMessage().startswith('Slow request') for r in caplog.records)
+
+
+def test_failed_statement_does_not_break_timing(app, client):
+    with pytest.raises(Exception):
+        db.session.execute(db.text('SELECT * FROM missing_table'))
+    db.session.rollback()
+    rv = client.get('/api/organisations-detailed')
+    assert rv.status_code == 200
+    assert _server_timing(rv)[1] > 0
+
+
+def test_profiling_disabled():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SECRET_KEY': 'test-secret-key',
+        'QUERY_PROFILING': False,
+    })
+    with app.app_context():
+        db.create_all()
+        rv = app.test_client().get('/api/organisations-detailed')
+        assert rv.status_code == 200
+        assert 'Server-Timing' not in rv.headers
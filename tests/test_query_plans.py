@@ -0,0 +1,197 @@
+# tests/test_query_plans.py
+"""EXPLAIN QUERY PLAN of every broadcast query the hot pages run:
+none of them may fall back to a full scan of the broadcast table.
+The plans are SQLite's, so this module stays on in-memory SQLite
+when the rest of the suite runs on TEST_DATABASE_URL"""
+import pytest
+import re
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, inspect, text
+from adcalc import create_app
+from adcalc.models import db, Organisation, Region, Broadcast, User, create_indexes, create_schema
+from adcalc.utils import refresh_costs
+
+# 'SCAN broadcast' without USING INDEX (older SQLite: 'SCAN TABLE broadcast'),
+# or an AUTOMATIC index SQLite builds from a full scan for a single query
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?broadcast\b(?!.*\bUSING\b)|\bbroadcast USING AUTOMATIC\b')
+
+
+@pytest.fixture
+def app():
+    """Create application for testing"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+    with app.app_context():
+        db.create_all()
+
+        region = Region(name='Регион 1', rating=1.0)
+        org = Organisation(name='Организация 1')
+        db.session.add_all([region, org])
+        db.session.commit()
+        db.session.add_all([
+            Broadcast(org_id=org.id, region_id=region.id, smi_name=f'СМИ {i}', smi_rating=1.0,
+                      district_name=f'Район {i % 3}', district_population=1000)
+            for i in range(10)
+        ])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create authenticated test client"""
+    user = User(username='testuser', email='test@example.com')
+    user.set_password('testpass')
+    db.session.add(user)
+    db.session.commit()
+
+    test_client = app.test_client()
+    with test_client:
+        test_client.post('/auth/login', data={
+            'username': 'testuser',
+            'password': 'testpass'
+        })
+    return test_client
+
+
+def _broadcast_statements(action):
+    """Run action() and return (statement, parameters) of the queries that read broadcast"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if re.search(r'\bbroadcast\b', statement) and not executemany \
+                and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        action()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert statements, 'no broadcast queries captured'
+    return statements
+
+
+def _full_scans(statements):
+    connection = db.session.connection()
+    scans = []
+    for statement, parameters in statements:
+        plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+        details = [row[-1] for row in plan]
+        if any(FULL_SCAN.search(detail) for detail in details):
+            scans.append((statement, details))
+    return scans
+
+
+def _assert_no_full_scan(action):
+    scans = _full_scans(_broadcast_statements(action))
+    assert not scans, '\n\n'.join(f"{statement}\n  {details}" for statement, details in scans)
+
+
+def test_full_scan_is_detected(app):
+    """The check itself: without the indexes the DISTINCT query scans the table"""
+    for index in Broadcast.__table__.indexes:
+        index.drop(db.engine)
+    statements = _broadcast_statements(lambda: db.session.query(Broadcast.smi_name).distinct().all())
+    assert _full_scans(statements)
+
+
+def test_create_indexes_adds_missing_indexes(app):
+    """Databases created before the indexes were declared get them from create_schema() (flask init-db)"""
+    for index in Broadcast.__table__.indexes:
+        if index.name in ('ix_broadcast_smi_name', 'ix_broadcast_population'):
+            index.drop(db.engine)
+
+    create_indexes()
+
+    names = {name for (name,) in db.session.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'broadcast'"))}
+    assert {index.name for index in Broadcast.__table__.indexes} <= names
+
+
+def test_create_indexes_skips_columns_of_pending_migrations(app):
+    """A database from before the cost column: init-db skips its index instead of failing,
+    add_broadcast_cost creates just that index"""
+    db.session.execute(text('DROP INDEX ix_broadcast_cost'))
+    db.session.execute(text('ALTER TABLE broadcast DROP COLUMN cost'))
+    db.session.execute(text('DROP TABLE upload_job'))
+    db.session.commit()
+
+    assert create_schema() == ['ix_broadcast_cost']
+    assert inspect(db.engine).has_table('upload_job')
+
+    db.session.execute(text('ALTER TABLE broadcast ADD COLUMN cost FLOAT NOT NULL DEFAULT 0'))
+    db.session.commit()
+    cost_index = [index for index in Broadcast.__table__.indexes if index.name == 'ix_broadcast_cost']
+    assert create_indexes(cost_index) == []
+    assert create_indexes() == []
+
+
+def test_distinct_smi_and_district_names(app):
+    def action():
+        db.session.query(Broadcast.smi_name).distinct().all()
+        db.session.query(Broadcast.district_name).distinct().all()
+    _assert_no_full_scan(action)
+
+
+def test_broadcasts_of_region(app):
+    region = Region.query.first()
+    _assert_no_full_scan(lambda: db.session.query(Broadcast).filter(Broadcast.region_id == region.id).all())
+
+
+def test_broadcasts_of_organisation(app):
+    org = Organisation.query.first()
+    db.session.expire(org)
+    _assert_no_full_scan(lambda: list(org.broadcasts))
+
+
+def test_refresh_costs_of_region(app):
+    region = Region.query.first()
+    _assert_no_full_scan(lambda: refresh_costs(region.id))
+
+
+def test_region_summary_api(app, client):
+    _assert_no_full_scan(lambda: client.get('/api/region/0/broadcasts').get_json())
+
+
+def test_organisations_detailed_api(app, client):
+    _assert_no_full_scan(lambda: client.get('/api/organisations-detailed'))
+
+
+def test_budget_allocate_api(app, client):
+    org = Organisation.query.first()
+    _assert_no_full_scan(lambda: client.post('/api/budget/allocate', json={'budget': 1000, 'org_ids': [org.id]}))
+
+
+def test_org_list(app, client):
+    _assert_no_full_scan(lambda: client.get('/org/list'))
+
+
+def test_broadcast_forms(app, client):
+    broadcast = Broadcast.query.first()
+
+    def action():
+        for url in ('/broadcast/create', f'/broadcast/{broadcast.id}/update',
+                    f'/org/broadcast/{broadcast.id}/update', f'/org/{broadcast.org_id}/broadcasts'):
+            assert client.get(url).status_code == 200
+    _assert_no_full_scan(action)
+
+
+@pytest.mark.parametrize('sort', ['id', 'cost', 'population'])
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_broadcast_list_pages(app, client, sort, order):
+    """Later pages seek by the cursor. The first page in id order reads the
+    table in rowid order up to LIMIT, which the plan reports as a SCAN"""
+    cursor = Broadcast.query.order_by(Broadcast.id).first().id if sort == 'id' else f'{1.0!r}:1'
+    _assert_no_full_scan(lambda: client.get(f'/broadcast/list?sort={sort}&order={order}&after={cursor}'))
+    _assert_no_full_scan(lambda: client.get(f'/broadcast/list?sort={sort}&order={order}&before={cursor}'))
@@ -0,0 +1,146 @@
+# tests/test_region_summary_cache.py
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from adcalc import create_app
+from adcalc.models import db, Organisation, Region, Broadcast, User
+from adcalc.utils import refresh_costs
+
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
+
+@pytest.fixture
+def app():
+    """Create application for testing"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
+        'COST_PER_PERSON': 5,
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+    with app.app_context():
+        db.create_all()
+
+        region1 = Region(name="Регион 1", rating=1.0)
+        region2 = Region(name="Регион 2", rating=1.5)
+        org = Organisation(name="Организация 1")
+        db.session.add_all([region1, region2, org])
+        db.session.commit()
+
+        db.session.add_all([
+            # cost 100, 200 and 300
+            Broadcast(org_id=org.id, region_id=region1.id, smi_name="СМИ 1", smi_rating=1.0,
+                      district_name="Район 1", district_population=10_000),
+            Broadcast(org_id=org.id, region_id=region1.id, smi_name="СМИ 2", smi_rating=2.0,
+                      district_name="Район 1", district_population=10_000),
+            Broadcast(org_id=org.id, region_id=region2.id, smi_name="СМИ 1", smi_rating=1.0,
+                      district_name="Район 2", district_population=20_000),
+        ])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def statements(app):
+    """Collect SQL statements executed during the test"""
+    collected = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        collected.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    yield collected
+    event.remove(db.engine, "before_cursor_execute", count)
+
+
+def _summary(client, reg_id):
+    rv = client.get(f"/api/region/{reg_id}/broadcasts")
+    assert rv.status_code == 200
+    return rv.get_json()
+
+
+def test_region_summary_values(client):
+    region1 = Region.query.filter_by(name="Регион 1").first()
+    data = _summary(client, region1.id)
+    assert abs(data["region_cost"] - 300.0) < 0.001
+    assert data["broadcast_count"] == 2
+    assert data["population"] == 10_000
+
+
+def test_russia_summary_aggregates_all_regions(client):
+    data = _summary(client, 0)
+    assert abs(data["region_cost"] - 600.0) < 0.001
+    assert data["broadcast_count"] == 3
+    assert data["population"] == 30_000
+
+
+def test_region_without_broadcasts(client):
+    data = _summary(client, 999)
+    assert data == {"region_cost": 0, "broadcast_count": 0, "population": 0}
+
+
+def test_summary_served_from_cache(client, statements):
+    region1 = Region.query.filter_by(name="Регион 1").first()
+    statements.clear()
+    _summary(client, 0)
+    assert statements
+    statements.clear()
+    _summary(client, 0)
+    _summary(client, region1.id)
+    assert statements == []
+
+
+def test_cache_invalidated_on_broadcast_insert(client):
+    region1 = Region.query.filter_by(name="Регион 1").first()
+    assert _summary(client, region1.id)["broadcast_count"] == 2
+    org = Organisation.query.first()
+    db.session.add(Broadcast(org_id=org.id, region_id=region1.id, smi_rating=1.0,
+                             district_name="Район 3", district_population=5_000))
+    db.session.commit()
+    data = _summary(client, region1.id)
+    assert data["broadcast_count"] == 3
+    assert abs(data["region_cost"] - 350.0) < 0.001
+    assert data["population"] == 15_000
+
+
+def test_cache_invalidated_on_broadcast_delete(client):
+    assert _summary(client, 0)["broadcast_count"] == 3
+    db.session.delete(Broadcast.query.first())
+    db.session.commit()
+    assert _summary(client, 0)["broadcast_count"] == 2
+
+
+def test_cache_invalidated_on_region_rating_change(client):
+    region2 = Region.query.filter_by(name="Регион 2").first()
+    assert abs(_summary(client, region2.id)["region_cost"] - 300.0) < 0.001
+    region2.rating = 3.0
+    refresh_costs(region2.id)
+    db.session.commit()
+    assert abs(_summary(client, region2.id)["region_cost"] - 600.0) < 0.001
+
+
+def test_cache_invalidated_on_bulk_update(client):
+    assert _summary(client, 0)["broadcast_count"] == 3
+    Broadcast.query.update({Broadcast.cost: 1.0}, synchronize_session=False)
+    db.session.commit()
+    assert abs(_summary(client, 0)["region_cost"] - 3.0) < 0.001
+
+
+def test_cache_expires_after_ttl(app, client):
+    app.config["CACHE_TTL"] = 0
+    assert _summary(client, 0)["broadcast_count"] == 3
+    with db.engine.begin() as conn:
+        conn.execute(Broadcast.__table__.delete())
+    assert _summary(client, 0)["broadcast_count"] == 0
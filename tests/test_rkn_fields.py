@@ -0,0 +1,159 @@
+# tests/test_rkn_fields.py
+import pytest
+import sys
+import os
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rkn_fields import (
+    RKN_NAMESPACE, FieldSpec, iter_records, iter_rows, safe_date, safe_float, safe_int, tag,
+)
+
+
+def _record(license_num, smi_name, rows=(), extra=''):
+    grid = ''.join(
+        f'<rkn:row><rkn:region_name_full>{region}</rkn:region_name_full>'
+        f'<rkn:freq>{freq}</rkn:freq></rkn:row>'
+        for region, freq in rows
+    )
+    return (
+        f'<rkn:record><rkn:license_num>{license_num}</rkn:license_num>'
+        f'<rkn:smi_name>{smi_name}</rkn:smi_name>{extra}<rkn:grid>{grid}</rkn:grid></rkn:record>'
+    )
+
+
+def _xml(tmp_path, records, name='rkn.xml', tail='</rkn:register>'):
+    path = tmp_path / name
+    path.write_text(
+        f'<?xml version="1.0" encoding="utf-8"?>\n<rkn:register xmlns:rkn="{RKN_NAMESPACE}">'
+        + ''.join(records) + tail,
+        encoding='utf-8',
+    )
+    return str(path)
+
+
+@pytest.fixture
+def dump(tmp_path):
+    return _xml(tmp_path, [
+        _record('Л001', 'Радио 1', [('Московская область', '100,1 МГц'), ('Тверская область', '101,0 МГц')]),
+        _record('Л002', 'Радио 2', [('Московская область', '102,0 МГц')]),
+        _record('Л003', 'Радио 3'),
+    ])
+
+
+def _text(elem, name):
+    return elem.find(tag(name)).text
+
+
+# ---------- iter_records ----------
+
+def test_iter_records_yields_records_in_file_order(dump):
+    seen = []
+    for record in iter_records(dump):
+        assert record.tag == tag('record')
+        rows = record.find(tag('grid')).findall(tag('row'))
+        seen.append((_text(record, 'license_num'), _text(record, 'smi_name'), len(rows)))
+    assert seen == [('Л001', 'Радио 1', 2), ('Л002', 'Радио 2', 1), ('Л003', 'Радио 3', 0)]
+
+
+def test_iter_records_clears_processed_records(dump):
+    """A record is emptied once the caller moves on, so memory does not grow with the file"""
+    records = iter_records(dump)
+    first = next(records)
+    assert len(first) == 3
+    next(records)
+    assert len(first) == 0
+    assert first.text is None
+
+
+def test_iter_records_streams_before_end_of_file(tmp_path):
+    """Records before a broken tail are yielded before the parse error is raised"""
+    path = _xml(tmp_path, [_record('Л001', 'Радио 1'), _record('Л002', 'Радио 2')],
+                tail='<rkn:record><rkn:license_num>Л003</rkn:broken>')
+    seen = []
+    with pytest.raises(ET.ParseError):
+        for record in iter_records(path):
+            seen.append(_text(record, 'license_num'))
+    assert seen == ['Л001', 'Л002']
+
+
+def test_iter_records_ignores_nested_rows(dump):
+    """Only rkn:record elements are yielded, not their rkn:row children"""
+    assert len(list(iter_records(dump))) == 3
+
+
+# ---------- FieldSpec ----------
+
+SPEC = FieldSpec([
+    ('license_num', None),
+    ('smi_name', None),
+    ('org_id', safe_int),
+    ('license_date', safe_date),
+], elements=('grid', 'granting'))
+
+
+def _element(xml):
+    return ET.fromstring(f'<rkn:record xmlns:rkn="{RKN_NAMESPACE}">{xml}</rkn:record>')
+
+
+def test_field_spec_extracts_in_column_order():
+    record = _element(
+        '<rkn:license_date>2020-01-15</rkn:license_date><rkn:smi_name>  Радио 1 </rkn:smi_name>'
+        '<rkn:org_id>42</rkn:org_id><rkn:license_num>Л001</rkn:license_num>'
+    )
+    assert SPEC.names == ('license_num', 'smi_name', 'org_id', 'license_date')
+    assert SPEC.extract(record) == ('Л001', 'Радио 1', 42, '2020-01-15')
+    assert SPEC.to_dict(SPEC.extract(record))['org_id'] == 42
+
+
+def test_field_spec_missing_and_invalid_fields():
+    """Missing fields are '' (or what the converter makes of ''), bad values become None"""
+    record = _element('<rkn:org_id>abc</rkn:org_id><rkn:license_date>2020-13-01</rkn:license_date>')
+    assert SPEC.extract(record) == ('', '', None, None)
+    assert SPEC.extract(_element('<rkn:smi_name/>')) == ('', '', None, None)
+
+
+def test_field_spec_first_occurrence_wins():
+    record = _element('<rkn:smi_name>Первое</rkn:smi_name><rkn:smi_name>Второе</rkn:smi_name>')
+    assert SPEC.extract(record)[1] == 'Первое'
+
+
+def test_field_spec_ignores_other_namespaces_and_nested_fields():
+    record = _element(
+        '<smi_name>Без пространства имен</smi_name>'
+        '<rkn:grid><rkn:row><rkn:smi_name>Вложенное</rkn:smi_name></rkn:row></rkn:grid>'
+    )
+    assert SPEC.extract(record) == ('', '', None, None)
+
+
+def test_field_spec_returns_requested_elements():
+    record = _element(
+        '<rkn:license_num>Л001</rkn:license_num>'
+        '<rkn:granting><rkn:date>2020-01-15</rkn:date></rkn:granting>'
+        '<rkn:grid><rkn:row><rkn:freq>100,1</rkn:freq></rkn:row><rkn:other/>'
+        '<rkn:row><rkn:freq>101,0</rkn:freq></rkn:row></rkn:grid>'
+        '<rkn:renewal/>'
+    )
+    values, elements = SPEC.extract_with_elements(record)
+    assert values[0] == 'Л001'
+    assert sorted(elements) == ['granting', 'grid']
+    rows = list(iter_rows(elements['grid']))
+    assert [FieldSpec([('freq', safe_float)]).extract(row) for row in rows] == [(100.1,), (101.0,)]
+    assert list(iter_rows(elements.get('programm_concept'))) == []
+
+
+@pytest.mark.parametrize('value, expected', [('2020-01-15', '2020-01-15'), ('', None), ('None', None),
+                                             ('15.01.2020', None)])
+def test_safe_date(value, expected):
+    assert safe_date(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [('7', 7), ('', None), ('7.5', None), ('x', None)])
+def test_safe_int(value, expected):
+    assert safe_int(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [('1,5', 1.5), ('2.25', 2.25), ('', None), ('x', None)])
+def test_safe_float(value, expected):
+    assert safe_float(value) == expected
@@ -0,0 +1,210 @@
+# tests/test_rkn_loader.py
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adcalc import create_app
+from adcalc.models import db, Organisation, Region, Broadcast
+from adcalc.rkn_loader import RknLoader, normalize_region_name, population
+
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
+NS = 'http://rsoc.ru/opendata/7705846236-LicBroadcast'
+
+
+@pytest.fixture
+def app():
+    """Create application for testing"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Region(name='Московская область', rating=2.0),
+            Region(name='Кабардино‑Балкарская Республика', rating=1.0),
+        ])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def _row(region, district, freq, population='10,0', power='1'):
+    return (
+        f'<rkn:row><rkn:region_name_full>{region}</rkn:region_name_full>'
+        f'<rkn:region_text>{district}</rkn:region_text><rkn:freq>{freq}</rkn:freq>'
+        f'<rkn:power>{power}</rkn:power><rkn:population>{population}</rkn:population></rkn:row>'
+    )
+
+
+def _record(inn, smi_name, rows, name=None, status='действующая',
+            activity='Радиовещание радиоканала', phone='', ogrn=None):
+    return (
+        f'<rkn:record><rkn:org_name>{name or "Радио " + inn}</rkn:org_name>'
+        f'<rkn:inn>{inn}</rkn:inn><rkn:ogrn>{ogrn or "1" + inn}</rkn:ogrn><rkn:phone>{phone}</rkn:phone>'
+        f'<rkn:licensed_activity>{activity}</rkn:licensed_activity><rkn:status>{status}</rkn:status>'
+        f'<rkn:smi_name>{smi_name}</rkn:smi_name><rkn:grid>{"".join(rows)}</rkn:grid></rkn:record>'
+    )
+
+
+def _xml(tmp_path, records, name='rkn.xml'):
+    path = tmp_path / name
+    path.write_text(
+        f'<?xml version="1.0" encoding="utf-8"?>\n<rkn:register xmlns:rkn="{NS}">'
+        + ''.join(records) + '</rkn:register>',
+        encoding='utf-8',
+    )
+    return str(path)
+
+
+@pytest.fixture
+def dump(tmp_path):
+    return _xml(tmp_path, [
+        _record('7700000001', 'Радио 1', [
+            _row('Московская область', 'г. Подольск', '100,1 МГц', '1 234,5 тыс'),
+            _row('Кабардино-Балкарская Республика', 'г. Нальчик', '101,0 МГц'),
+            _row('Тверская область', 'г. Тверь', '102,0 МГц'),
+        ]),
+        _record('7700000001', 'Радио 2', [_row('Московская область', 'г. Клин', '103,0 МГц')]),
+        _record('7700000002', 'Радио 3', [_row('Московская область', 'г. Клин', '104,0 МГц')]),
+        _record('7700000003', 'Радио 4', [_row('Московская область', 'г. Дмитров', '105,0 МГц')],
+                status='аннулирована'),
+        _record('7700000004', 'ТВ 1', [_row('Московская область', 'г. Дмитров', '106,0 МГц')],
+                activity='Телевизионное вещание'),
+    ])
+
+
+def test_normalize_region_name():
+    assert normalize_region_name('Кабардино‑Балкарская Республика') == \
+        normalize_region_name('Кабардино - Балкарская  республика')
+    assert normalize_region_name('Кемеровская область — Кузбасс') == \
+        normalize_region_name('Кемеровская область')
+    assert normalize_region_name('г. Москва') == normalize_region_name('Москва') == 'город москва'
+
+
+def test_population():
+    assert population('60,0') == 60000
+    assert population('1 234,5 тыс') == 1234500
+    assert population('') is None
+
+
+def test_load_rkn(app, dump):
+    result = RknLoader().load(dump)
+
+    assert result.records == 5
+    assert result.filtered == 2
+    assert result.orgs_inserted == 2
+    assert result.broadcasts_inserted == 4
+    assert result.unknown_regions == {'Тверская область': 1}
+
+    assert sorted(org.inn for org in Organisation.query.all()) == ['7700000001', '7700000002']
+    broadcast = Broadcast.query.filter_by(district_name='г. Подольск').one()
+    assert broadcast.org.inn == '7700000001'
+    assert broadcast.region.name == 'Московская область'
+    assert broadcast.smi_name == 'Радио 1'
+    assert broadcast.frequency == '100,1 МГц'
+    assert broadcast.power == 1.0
+    assert broadcast.district_population == 1234500
+    assert broadcast.cost == 0
+    assert Broadcast.query.filter_by(district_name='г. Нальчик').one().region.rating == 1.0
+
+
+def test_load_rkn_again_skips_existing(app, dump):
+    RknLoader().load(dump)
+    result = RknLoader().load(dump)
+
+    assert result.orgs_inserted == 0
+    assert result.orgs_updated == 0
+    assert result.broadcasts_inserted == 0
+    assert result.duplicates == 4
+    assert Organisation.query.count() == 2
+    assert Broadcast.query.count() == 4
+
+
+def test_load_rkn_updates_existing_organisation(app, tmp_path):
+    org = Organisation(name='Старое имя', inn='7700000001', email='old@example.com', arv_member=True)
+    db.session.add(org)
+    db.session.commit()
+
+    path = _xml(tmp_path, [_record('7700000001', 'Радио 1', [_row('Московская область', 'г. Клин', '100,0 МГц')],
+                                   name='Новое имя', phone='+7 495')])
+    result = RknLoader().load(path)
+
+    assert result.orgs_inserted == 0
+    assert result.orgs_updated == 1
+    org = Organisation.query.one()
+    assert org.name == 'Новое имя'
+    assert org.ogrn == '17700000001'
+    assert org.phone == '+7 495'
+    # Values missing from the dump are kept
+    assert org.email == 'old@example.com'
+    assert org.arv_member
+    assert Broadcast.query.one().org_id == org.id
+
+
+def test_load_rkn_keeps_existing_inn_and_ogrn(app, tmp_path):
+    """INN and OGRN are only filled in; conflicting values are reported, not applied"""
+    first = Organisation(name='Радио 1', inn='7700000001', ogrn='1000000000001')
+    second = Organisation(name='Радио 2', inn='7700000002')
+    third = Organisation(name='Радио 3', inn='7700000003', ogrn='1000000000003')
+    db.session.add_all([first, second, third])
+    db.session.commit()
+
+    row = _row('Московская область', 'г. Клин', '100,0 МГц')
+    path = _xml(tmp_path, [
+        # OGRN of another organisation
+        _record('7700000002', 'Радио 2', [row], name='Радио 2', ogrn='1000000000003'),
+        # Different OGRN on record
+        _record('7700000001', 'Радио 1', [row], name='Радио 1', ogrn='1000000000009'),
+    ])
+    result = RknLoader().load(path)
+
+    assert result.org_conflicts == {
+        (second.id, 'ogrn'): '1000000000003',
+        (first.id, 'ogrn'): '1000000000009',
+    }
+    assert 'Conflicting INN/OGRN, kept as is: 2' in result.report()
+    assert result.orgs_inserted == 0
+    assert [(org.inn, org.ogrn) for org in Organisation.query.order_by(Organisation.id)] == [
+        ('7700000001', '1000000000001'), ('7700000002', None), ('7700000003', '1000000000003'),
+    ]
+    assert Broadcast.query.count() == 2
+
+
+def test_load_rkn_small_caches(app, tmp_path):
+    """Evictions from tiny caches do not create duplicates"""
+    records = [
+        _record(f'77000000{i % 7:02d}', f'Радио {i % 5}', [_row('Московская область', f'Пункт {i % 3}', '100,0 МГц')])
+        for i in range(60)
+    ]
+    path = _xml(tmp_path, records)
+    RknLoader(batch_size=4, org_cache_size=2, broadcast_cache_size=1).load(path)
+    result = RknLoader(batch_size=4, org_cache_size=2, broadcast_cache_size=1).load(path)
+
+    assert Organisation.query.count() == 7
+    # Distinct (org, smi, district) combinations of the records
+    expected = {(i % 7, i % 5, i % 3) for i in range(60)}
+    assert Broadcast.query.count() == len(expected)
+    assert result.broadcasts_inserted == 0
+
+
+def test_load_rkn_command(app, dump):
+    result = app.test_cli_runner().invoke(args=['load-rkn', dump, '--batch-size', '1'])
+
+    assert result.exit_code == 0, result.output
+    assert 'Broadcasts inserted: 4' in result.output
+    assert 'Тверская область' in result.output
+    assert Broadcast.query.count() == 4
+
+
+def test_load_rkn_command_filters(app, dump):
+    result = app.test_cli_runner().invoke(args=['load-rkn', dump, '--activity', 'Телевизионное вещание'])
+
+    assert result.exit_code == 0, result.output
+    assert [b.smi_name for b in Broadcast.query.all()] == ['ТВ 1']
@@ -0,0 +1,210 @@
+# tests/test_sqlite_tuning.py
+import pytest
+import threading
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from adcalc import create_app
+from adcalc.excel_import import insert_broadcasts
+from adcalc.models import db, Organisation, Region, Broadcast, User
+from adcalc.sqlite_tuning import DEFAULT_PRAGMAS
+
+
+def _create_app(tmp_path, pragmas):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'tuning.db'}",
+        'SECRET_KEY': 'test-secret-key',
+        'SQLITE_PRAGMAS': pragmas,
+    })
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Create application on a database file with the default profile"""
+    app = _create_app(tmp_path, {})
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    """Create authenticated test client"""
+    user = User(username='testuser', email='test@example.com')
+    user.set_password('testpass')
+    db.session.add(user)
+    db.session.commit()
+
+    test_client = app.test_client()
+    with test_client:
+        test_client.post('/auth/login', data={
+            'username': 'testuser',
+            'password': 'testpass'
+        })
+    return test_client
+
+
+def _pragma(name):
+    return db.session.execute(text(f'PRAGMA {name}')).scalar()
+
+
+def _seed():
+    region = Region(name="Регион 1", rating=1.0)
+    org = Organisation(name="Организация 1")
+    db.session.add_all([region, org])
+    db.session.flush()
+    db.session.add_all([
+        Broadcast(org_id=org.id, region_id=region.id, smi_name=f"СМИ {i}", smi_rating=1.0,
+                  district_name=f"Район {i}", district_population=1000)
+        for i in range(10)
+    ])
+    db.session.commit()
+    return org.id, region.id
+
+
+def _records(org_id, region_id, count):
+    return pd.DataFrame([{
+        'org_id': org_id, 'region_id': region_id, 'smi_name': f'Импорт {i}', 'smi_rating': 1.0,
+        'smi_male_proportion': 0.5, 'district_name': f'Район импорта {i}', 'district_population': 1000,
+        'frequency': '100.0', 'power': 1.0, 'cost': 10.0,
+    } for i in range(count)])
+
+
+def _read_during_import(app, org_id, region_id, rows=20000):
+    """Count broadcasts while another thread is in the middle of an uncommitted bulk import.
+    Returns (count seen by the reader, count after the import)"""
+    records = _records(org_id, region_id, rows)
+    in_progress = threading.Event()
+    resume = threading.Event()
+    errors = []
+
+    def import_in_background():
+        with app.app_context():
+            def on_chunk(rows_done, inserted):
+                if rows_done == len(records):
+                    in_progress.set()
+                    resume.wait(10)
+            try:
+                insert_broadcasts(records, chunk_size=1000, on_chunk=on_chunk)
+                db.session.commit()
+            except Exception as e:
+                errors.append(e)
+                in_progress.set()
+            finally:
+                db.session.remove()
+
+    writer = threading.Thread(target=import_in_background)
+    writer.start()
+    try:
+        assert in_progress.wait(10)
+        with app.app_context():
+            try:
+                seen = db.session.query(Broadcast).count()
+            finally:
+                db.session.remove()
+    finally:
+        resume.set()
+        writer.join(10)
+    assert not errors
+    with app.app_context():
+        return seen, db.session.query(Broadcast).count()
+
+
+def test_default_profile_is_applied(app):
+    assert _pragma('journal_mode') == 'wal'
+    assert _pragma('busy_timeout') == DEFAULT_PRAGMAS['busy_timeout']
+    assert _pragma('synchronous') == 1  # NORMAL
+    assert _pragma('mmap_size') == DEFAULT_PRAGMAS['mmap_size']
+    assert _pragma('cache_size') == DEFAULT_PRAGMAS['cache_size']
+    assert _pragma('foreign_keys') == 1
+
+
+def test_profile_overrides(tmp_path):
+    app = _create_app(tmp_path, {'foreign_keys': None, 'synchronous': 'FULL', 'busy_timeout': 100})
+    with app.app_context():
+        assert _pragma('foreign_keys') == 0
+        assert _pragma('synchronous') == 2  # FULL
+        assert _pragma('busy_timeout') == 100
+        assert _pragma('journal_mode') == 'wal'
+        db.engine.dispose()
+
+
+def test_no_profile_without_config():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SECRET_KEY': 'test-secret-key',
+    })
+    with app.app_context():
+        assert _pragma('foreign_keys') == 0
+        assert _pragma('synchronous') == 2  # FULL, the SQLite default
+
+
+def test_reads_continue_during_bulk_import(app, client):
+    seen, after = _read_during_import(app, *_seed())
+    # The reader is not blocked and sees the last committed state
+    assert seen == 10
+    assert after == 10 + 20000
+
+
+def test_reads_continue_during_upload_request(app, client):
+    records = _records(*_seed(), 5000)
+    in_progress = threading.Event()
+    resume = threading.Event()
+
+    def import_in_background():
+        with app.app_context():
+            def on_chunk(rows_done, inserted):
+                in_progress.set()
+                resume.wait(10)
+            insert_broadcasts(records, chunk_size=5000, on_chunk=on_chunk)
+            db.session.commit()
+            db.session.remove()
+
+    writer = threading.Thread(target=import_in_background)
+    writer.start()
+    try:
+        assert in_progress.wait(10)
+        started = time.perf_counter()
+        rv = client.get('/api/organisations-detailed')
+        elapsed = time.perf_counter() - started
+    finally:
+        resume.set()
+        writer.join(10)
+    assert rv.status_code == 200
+    assert len(rv.get_json()[0]['broadcasts']) == 10
+    assert elapsed < DEFAULT_PRAGMAS['busy_timeout'] / 1000
+
+
+def test_rollback_journal_blocks_readers(tmp_path):
+    """Counterpart of the WAL test: without WAL a large uncommitted import locks readers out"""
+    app = _create_app(tmp_path, {'journal_mode': 'DELETE', 'busy_timeout': 100, 'cache_size': 10})
+    with app.app_context():
+        db.create_all()
+        ids = _seed()
+        db.session.remove()
+    with pytest.raises(OperationalError, match='database is locked'):
+        _read_during_import(app, *ids)
+    with app.app_context():
+        db.engine.dispose()
+
+
+def test_org_with_broadcasts_is_kept_with_foreign_keys(client):
+    org_id, _ = _seed()
+    rv = client.post(f"/org/{org_id}/delete", follow_redirects=True)
+    assert rv.status_code == 200
+    assert "Организация «Организация 1» не удалена: сначала удалите её трансляции" in rv.get_data(as_text=True)
+    assert db.session.get(Organisation, org_id) is not None
+    assert db.session.query(Broadcast).count() == 10
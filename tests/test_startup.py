@@ -0,0 +1,63 @@
+# tests/test_startup.py
+import pytest
+import subprocess
+import sys
+import os
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from sqlalchemy import inspect
+from adcalc import create_app
+from adcalc.models import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Create application on a database file without creating the schema"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'startup.db'}",
+        'SECRET_KEY': 'test-secret-key'
+    })
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def _tables_and_indexes(app):
+    with app.app_context():
+        inspector = inspect(db.engine)
+        tables = set(inspector.get_table_names())
+        indexes = {index['name'] for index in inspector.get_indexes('broadcast')} if 'broadcast' in tables else set()
+        return tables, indexes
+
+
+def test_create_app_does_not_touch_the_schema(app, tmp_path):
+    assert not (tmp_path / 'startup.db').exists()
+    assert _tables_and_indexes(app) == (set(), set())
+
+
+def test_init_db_command(app):
+    result = app.test_cli_runner().invoke(args=['init-db'])
+    assert result.exit_code == 0, result.output
+    assert 'Schema is up to date' in result.output
+
+    tables, indexes = _tables_and_indexes(app)
+    assert {'organisation', 'region', 'broadcast', 'user', 'upload_job'} <= tables
+    assert {'ix_broadcast_region_district', 'ix_broadcast_cost'} <= indexes
+
+    # Idempotent on an existing database
+    assert app.test_cli_runner().invoke(args=['init-db']).exit_code == 0
+
+
+def test_startup_does_not_import_excel_libraries():
+    script = (
+        "import sys\n"
+        "from adcalc import create_app\n"
+        "create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SECRET_KEY': 'x'})\n"
+        "print(sorted(name for name in ('pandas', 'openpyxl') if name in sys.modules))\n"
+    )
+    output = subprocess.run([sys.executable, '-c', script], cwd=PROJECT_ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]'
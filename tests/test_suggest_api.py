@@ -0,0 +1,140 @@
+# tests/test_suggest_api.py
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from adcalc import create_app
+from adcalc.models import db, Organisation, Region, Broadcast, User
+
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
+
+@pytest.fixture
+def app():
+    """Create application for testing"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+    with app.app_context():
+        db.create_all()
+
+        region = Region(name="Регион 1", rating=1.0)
+        org = Organisation(name="Организация 1")
+        db.session.add_all([region, org])
+        db.session.commit()
+
+        names = [
+            ("Радио Маяк", "Тверь"),
+            ("радио Вера", "Торжок"),
+            ("Радио Маяк", "Тверь"),
+            ("Европа Плюс", "Ржев"),
+            (None, None),
+            ("", ""),
+        ]
+        db.session.add_all([
+            Broadcast(org_id=org.id, region_id=region.id, smi_name=smi, district_name=district)
+            for smi, district in names
+        ])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create authenticated test client"""
+    user = User(username='testuser', email='test@example.com')
+    user.set_password('testpass')
+    db.session.add(user)
+    db.session.commit()
+
+    test_client = app.test_client()
+    with test_client:
+        test_client.post('/auth/login', data={
+            'username': 'testuser',
+            'password': 'testpass'
+        })
+    return test_client
+
+
+@pytest.fixture
+def statements(app):
+    """Collect SQL statements executed during the test"""
+    collected = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        collected.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    yield collected
+    event.remove(db.engine, 'before_cursor_execute', count)
+
+
+def test_suggest_smi_prefix_ignores_case(client):
+    rv = client.get('/api/suggest/smi?q=рад')
+    assert rv.status_code == 200
+    assert rv.get_json() == ["радио Вера", "Радио Маяк"]
+
+
+def test_suggest_district(client):
+    assert client.get('/api/suggest/district?q=т').get_json() == ["Тверь", "Торжок"]
+    assert client.get('/api/suggest/district?q=Тв').get_json() == ["Тверь"]
+    assert client.get('/api/suggest/district?q=Москва').get_json() == []
+
+
+def test_suggest_without_query_lists_all_names(client):
+    assert client.get('/api/suggest/smi').get_json() == ["Европа Плюс", "радио Вера", "Радио Маяк"]
+
+
+def test_suggest_limit(client):
+    assert client.get('/api/suggest/smi?q=&limit=2').get_json() == ["Европа Плюс", "радио Вера"]
+    assert len(client.get('/api/suggest/smi?limit=0').get_json()) == 1
+
+
+def test_suggest_unknown_list(client):
+    assert client.get('/api/suggest/frequency?q=1').status_code == 404
+
+
+def test_suggest_requires_login(app):
+    rv = app.test_client().get('/api/suggest/smi?q=р')
+    assert rv.status_code == 401
+
+
+def test_suggest_served_from_cache(client, statements):
+    client.get('/api/suggest/smi?q=р')
+    statements.clear()
+    client.get('/api/suggest/smi?q=е')
+    client.get('/api/suggest/district?q=т')
+    assert not any('broadcast' in statement for statement in statements)
+
+
+def test_suggest_cache_invalidated_on_broadcast_write(client):
+    assert client.get('/api/suggest/smi?q=авто').get_json() == []
+    broadcast = Broadcast.query.filter_by(smi_name="Европа Плюс").one()
+    db.session.add(Broadcast(org_id=broadcast.org_id, region_id=broadcast.region_id,
+                             smi_name="Авторадио", district_name="Кимры"))
+    db.session.commit()
+    assert client.get('/api/suggest/smi?q=авто').get_json() == ["Авторадио"]
+
+    broadcast.district_name = "Кашин"
+    db.session.commit()
+    assert client.get('/api/suggest/district?q=к').get_json() == ["Кашин", "Кимры"]
+
+
+def test_forms_do_not_render_name_lists(client):
+    broadcast = Broadcast.query.filter_by(smi_name="Европа Плюс").one()
+    for url in ('/broadcast/create', f'/broadcast/{broadcast.id}/update',
+                f'/org/{broadcast.org_id}/broadcasts', f'/org/broadcast/{broadcast.id}/update'):
+        rv = client.get(url)
+        assert rv.status_code == 200
+        html = rv.get_data(as_text=True)
+        assert '/api/suggest/smi' in html
+        assert '/api/suggest/district' in html
+        assert 'value="Радио Маяк"' not in html
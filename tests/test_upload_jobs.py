@@ -0,0 +1,251 @@
+# tests/test_upload_jobs.py
+import pytest
+import sys
+import os
+import json
+from io import BytesIO
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from adcalc import create_app
+from adcalc import excel_import, jobs
+from adcalc.models import db, Organisation, Region, Broadcast, User, UploadJob
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Create application for testing.
+    Jobs run in a worker thread, so the database is a file, not a shared :memory: connection"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'jobs.db'}",
+        'SECRET_KEY': 'test-secret-key',
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        # Takeovers scheduled for jobs of other workers must not outlive the test
+        for timer in jobs._runner(app)['retries'].values():
+            timer.cancel()
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """Create authenticated test client"""
+    user = User(username='testuser', email='test@example.com')
+    user.set_password('testpass')
+    db.session.add(user)
+    db.session.commit()
+
+    test_client = app.test_client()
+    with test_client:
+        test_client.post('/auth/login', data={
+            'username': 'testuser',
+            'password': 'testpass'
+        })
+    return test_client
+
+
+@pytest.fixture
+def org_region(app):
+    org = Organisation(name='Test Org')
+    region = Region(name='Test Region', rating=2.0)
+    db.session.add_all([org, region])
+    db.session.commit()
+    return org.id, region.id
+
+
+def _excel(rows):
+    excel_file = BytesIO()
+    pd.DataFrame(rows).to_excel(excel_file, index=False)
+    excel_file.seek(0)
+    return excel_file
+
+
+def _rows(org_id, region_id, count):
+    return [{
+        'org_id': org_id,
+        'smi_name': f'SMI {i}',
+        'smi_rating': 10.0,
+        'smi_male_proportion': 0.5,
+        'district_name': f'District {i}',
+        'district_population': 1000,
+        'region_id': region_id,
+        'frequency': '100.0',
+        'power': 1.0,
+    } for i in range(count)]
+
+
+def _submit(client, excel_file, filename='test.xlsx'):
+    return client.post(
+        '/broadcast/upload_jobs',
+        data={'excel_file': (excel_file, filename)},
+        content_type='multipart/form-data'
+    )
+
+
+def _job_file(app, rows):
+    path = os.path.join(app.config['UPLOAD_FOLDER'], 'pending.xlsx')
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(_excel(rows).getvalue())
+    return path
+
+
+def test_upload_job_processes_file_in_background(client, org_region, monkeypatch):
+    """POST /broadcast/upload_jobs returns 202 with a job; status shows progress when done"""
+    monkeypatch.setattr(excel_import, 'IMPORT_CHUNK_SIZE', 10)
+    rv = _submit(client, _excel(_rows(*org_region, 25)))
+    assert rv.status_code == 202
+    data = json.loads(rv.data)
+    assert rv.headers['Location'] == data['status_url'] == f"/broadcast/upload_jobs/{data['id']}"
+
+    jobs.wait_for_job(data['id'], timeout=30)
+
+    rv = client.get(data['status_url'])
+    assert rv.status_code == 200
+    status = json.loads(rv.data)
+    assert status['status'] == 'done'
+    assert status['total_rows'] == 25
+    assert status['rows_processed'] == 25
+    assert status['inserted'] == 25
+    assert status['errors'] == []
+    assert status['rows_per_second'] is not None
+    assert status['finished_at'] is not None
+
+    assert Broadcast.query.count() == 25
+    assert Broadcast.query.first().cost == pytest.approx(10.0 / 100 * 1000 * 2.0)
+    # Processed file is removed
+    assert os.listdir(client.application.config['UPLOAD_FOLDER']) == []
+
+
+def test_upload_job_with_errors_fails_without_inserting(client, org_region):
+    """Validation errors mark the job as failed and nothing is inserted"""
+    rows = _rows(*org_region, 3)
+    rows[1]['org_id'] = 999
+    rv = _submit(client, _excel(rows))
+    job_id = json.loads(rv.data)['id']
+    jobs.wait_for_job(job_id, timeout=30)
+
+    status = json.loads(client.get(f'/broadcast/upload_jobs/{job_id}').data)
+    assert status['status'] == 'failed'
+    assert status['errors'] == [{'row': 3, 'message': 'Не найдена организация с ID 999'}]
+    assert Broadcast.query.count() == 0
+    # The saved upload is removed for failed jobs too
+    assert os.listdir(client.application.config['UPLOAD_FOLDER']) == []
+
+
+def test_upload_job_bad_columns_fails(client, org_region):
+    rv = _submit(client, _excel([{'wrong': 1}]))
+    job_id = json.loads(rv.data)['id']
+    jobs.wait_for_job(job_id, timeout=30)
+
+    status = json.loads(client.get(f'/broadcast/upload_jobs/{job_id}').data)
+    assert status['status'] == 'failed'
+    assert 'Некорректные названия столбцов' in status['errors'][0]['message']
+
+
+def test_upload_job_without_file(client):
+    rv = client.post('/broadcast/upload_jobs', data={}, content_type='multipart/form-data')
+    assert rv.status_code == 400
+    assert UploadJob.query.count() == 0
+
+
+def test_upload_job_status_not_found(client):
+    rv = client.get('/broadcast/upload_jobs/999')
+    assert rv.status_code == 404
+
+
+def test_upload_job_requires_login(app):
+    rv = app.test_client().get('/broadcast/upload_jobs/1')
+    assert rv.status_code == 302
+
+
+def test_resume_queued_job(app, org_region):
+    """Queued jobs from a previous process are picked up on resume"""
+    job = UploadJob(filename='pending.xlsx', path=_job_file(app, _rows(*org_region, 5)), status='queued')
+    db.session.add(job)
+    db.session.commit()
+
+    assert jobs.resume_upload_jobs(app) == [job.id]
+    jobs.wait_for_job(job.id, timeout=30)
+
+    db.session.refresh(job)
+    assert job.status == 'done'
+    assert job.inserted == 5
+    assert Broadcast.query.count() == 5
+
+
+def test_resume_interrupted_job_continues_from_progress(app, org_region, monkeypatch):
+    """A running job with an old heartbeat is taken over and continues after committed rows"""
+    monkeypatch.setattr(excel_import, 'IMPORT_CHUNK_SIZE', 2)
+    org_id, region_id = org_region
+    rows = _rows(org_id, region_id, 6)
+    # The first chunk was committed before the worker died
+    db.session.add_all([Broadcast(**row) for row in rows[:2]])
+    job = UploadJob(
+        filename='pending.xlsx', path=_job_file(app, rows), status='running',
+        total_rows=6, rows_processed=2, inserted=2,
+        heartbeat_at=jobs._utcnow() - timedelta(hours=1),
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    jobs.resume_upload_jobs(app)
+    jobs.wait_for_job(job.id, timeout=30)
+
+    db.session.refresh(job)
+    assert job.status == 'done'
+    assert job.rows_processed == 6
+    assert job.inserted == 6
+    assert sorted(b.smi_name for b in Broadcast.query.all()) == [f'SMI {i}' for i in range(6)]
+
+
+def test_running_job_is_not_claimed_twice(app, org_region):
+    """A job with a fresh heartbeat belongs to another worker and is left alone"""
+    job = UploadJob(
+        filename='pending.xlsx', path=_job_file(app, _rows(*org_region, 3)), status='running',
+        heartbeat_at=jobs._utcnow(),
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    jobs.resume_upload_jobs(app)
+    jobs.wait_for_job(job.id, timeout=30)
+
+    db.session.refresh(job)
+    assert job.status == 'running'
+    assert Broadcast.query.count() == 0
+
+
+def test_job_interrupted_inside_stale_window_is_taken_over(app, org_region):
+    """A worker restarted before the heartbeat went stale picks the job up once it does"""
+    app.config['UPLOAD_JOB_STALE_SECONDS'] = 0.5
+    job = UploadJob(
+        filename='pending.xlsx', path=_job_file(app, _rows(*org_region, 3)), status='running',
+        heartbeat_at=jobs._utcnow(),
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    jobs.resume_upload_jobs(app)
+    jobs.wait_for_job(job.id, timeout=30)
+    db.session.refresh(job)
+    assert job.status == 'running'
+
+    retry = jobs._runner(app)['retries'][job.id]
+    retry.join(timeout=10)
+    assert not retry.is_alive()
+    jobs.wait_for_job(job.id, timeout=30)
+
+    db.session.refresh(job)
+    assert job.status == 'done'
+    assert job.inserted == 3
+    assert os.listdir(app.config['UPLOAD_FOLDER']) == []
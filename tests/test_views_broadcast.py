@@ -9,13 +9,15 @@ from adcalc import create_app
 from adcalc.models import db, Organisation, Region, Broadcast, User
 from adcalc.utils import calculate_cost
 
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
 
 @pytest.fixture
 def app():
     """Create application for testing"""
     app = create_app({
         'TESTING': True,
-        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SQLALCHEMY_DATABASE_URI': DATABASE_URI,
         'COST_PER_PERSON': 5,
         'SECRET_KEY': 'test-secret-key'
     })
@@ -10,6 +10,8 @@ from adcalc import create_app
 from adcalc.models import db, Organisation, Region, Broadcast, User
 from adcalc.utils import calculate_cost
 
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
 
 # --------------------------------------------------------------------------- #
 #  Fixtures – create app + database + helper functions
@@ -19,7 +21,7 @@ def app():
     """Create a Flask app configured for testing."""
     app = create_app({
         "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "SQLALCHEMY_DATABASE_URI": DATABASE_URI,
         "COST_PER_PERSON": 5,            
         'SECRET_KEY': 'test-secret-key',
     })
@@ -31,9 +33,37 @@ def app():
         db.drop_all()
 
 
+@pytest.fixture
+def fk_app():
+    """App with the production SQLite profile (SQLITE_PRAGMAS {}), so foreign keys are enforced."""
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": DATABASE_URI,
+        'SECRET_KEY': 'test-secret-key',
+        'SQLITE_PRAGMAS': {},
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
 @pytest.fixture
 def client(app):
     """Create test client"""
+    return _login(app)
+
+
+@pytest.fixture
+def fk_client(fk_app):
+    """Create test client of the app with foreign keys enforced"""
+    return _login(fk_app)
+
+
+def _login(app):
+    """Helper – create a test user and return a client logged in as it."""
     with app.app_context():
         # Create a test user
         user = User(username='testuser', email='test@example.com')
@@ -117,6 +147,34 @@ def test_org_list_with_entries(client):
     assert str(expected_cost).encode() in rv.data
 
 
+def test_org_list_totals(client):
+    """GET /org/list – unique SMI/districts, distinct-district population and cost."""
+    reg = _create_region()
+    org = _create_org("Org-Totals")
+    _create_org("Org-Empty")
+    _create_broadcast(org, reg, smi_name="SMI-A", smi_rating=1.0,
+                      district_name="D-A", district_population=2000)
+    _create_broadcast(org, reg, smi_name="SMI-A", smi_rating=1.0,
+                      district_name="D-A", district_population=3000)
+    _create_broadcast(org, reg, smi_name="SMI-B", smi_rating=1.0,
+                      district_name="D-B", district_population=500)
+    _create_broadcast(org, reg, smi_name="", smi_rating=1.0,
+                      district_name="", district_population=700)
+
+    rv = client.get("/org/list")
+    assert rv.status_code == 200
+    html = rv.data.decode("utf-8")
+    row = html[html.index("Org-Totals"):html.index("Org-Empty")]
+    cells = [c.split("</td>")[0].strip() for c in row.split("<td>")[1:]]
+    assert cells[0] == "2"                  # SMI-A, SMI-B
+    assert cells[1] == "2"                  # D-A, D-B
+    assert cells[2] == "2500 т. чел."       # first D-A row + D-B
+    assert cells[3] == "62.0 р."            # (2000 + 3000 + 500 + 700) / 100
+    empty_row = html[html.index("Org-Empty"):]
+    empty_cells = [c.split("</td>")[0].strip() for c in empty_row.split("<td>")[1:]]
+    assert empty_cells[:4] == ["0", "0", "0 т. чел.", "0.0 р."]
+
+
 def test_org_detail_view(client):
     """GET /org/<id> – returns the org detail page."""
     org = _create_org("Org-1")
@@ -175,15 +233,16 @@ def test_org_delete_without_broadcasts(client):
     assert Organisation.query.get(org.id) is None
 
 
-def test_org_delete_with_broadcasts(client):
+def test_org_delete_with_broadcasts(fk_client):
     """Attempt to delete an organisation that has broadcasts """
     reg = _create_region()
     org = _create_org("Org‑With‑Broadcast")
     _create_broadcast(org, reg)
-    rv = client.post(f"/org/{org.id}/delete", follow_redirects=True)
+    rv = fk_client.post(f"/org/{org.id}/delete", follow_redirects=True)
     assert rv.status_code == 200
-    # the view redirects back to the list; the org must still exist
-    assert Organisation.query.get(org.id) is None
+    # ON DELETE RESTRICT keeps the organisation and the user is told why
+    assert Organisation.query.get(org.id) is not None
+    assert "сначала удалите её трансляции" in rv.data.decode("utf-8")
     # message "Организации" is present – confirms we’re still on the list page
     assert "Список организаций" in rv.data.decode("utf-8")
 
@@ -1,8 +1,11 @@
 # tests/test_views_region.py
+import os
 import pytest
 from adcalc import create_app
 from adcalc.models import db, Organisation, Region, Broadcast, User
 
+DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///:memory:')
+
 # --------------------------------------------------------------------------- #
 #  Fixtures – create app + database + helper functions
 # --------------------------------------------------------------------------- #
@@ -11,7 +14,7 @@ def app():
     """Create a Flask app configured for testing."""
     app = create_app({
         "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "SQLALCHEMY_DATABASE_URI": DATABASE_URI,
         "COST_PER_PERSON": 5,            
         'SECRET_KEY': 'test-secret-key',
     })
@@ -80,6 +83,24 @@ def test_region_update_view(client):
     assert updated_region.rating == 2.5
 
 
+def test_region_update_view_refreshes_broadcast_costs(client):
+    """POST /region/<int:region_id>/update recalculates stored broadcast costs."""
+    region = _create_region("Test Region", 1.0)
+    org = Organisation(name="Test Org")
+    db.session.add(org)
+    db.session.commit()
+    broadcast = Broadcast(org_id=org.id, region_id=region.id, smi_rating=10.0,
+                          district_population=1000)
+    db.session.add(broadcast)
+    db.session.commit()
+    assert broadcast.cost == 100.0
+
+    rv = client.post(f"/region/{region.id}/update", data={"rating": "2.5"})
+    assert rv.status_code == 302
+    db.session.expire_all()
+    assert Broadcast.query.get(broadcast.id).cost == 250.0
+
+
 def test_region_update_view_invalid_region(client):
     """POST /region/<int:region_id>/update with invalid region ID returns 404."""
     rv = client.post("/region/999/update", data={"rating": "2.5"})
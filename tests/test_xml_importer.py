@@ -0,0 +1,304 @@
+# tests/test_xml_importer.py
+import pytest
+import sqlite3
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tmp'))
+
+import import_xml_to_db as importer_module
+from import_xml_to_db import BufferedWriter, XMLToDatabaseImporter
+from rkn_fields import RKN_NAMESPACE
+
+
+# ---------- BufferedWriter ----------
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (id INTEGER, name TEXT NOT NULL)')
+    yield conn
+    conn.close()
+
+
+def test_writer_batches_rows(conn):
+    writer = BufferedWriter(conn.cursor(), batch_size=2)
+    writer.register('t', ('id', 'name'))
+    for row in [(1, 'a'), (2, 'b'), (3, 'c')]:
+        writer.add('t', row)
+    # The first two rows were flushed on reaching batch_size
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 2
+    writer.flush()
+    assert conn.execute('SELECT id, name FROM t ORDER BY id').fetchall() == [(1, 'a'), (2, 'b'), (3, 'c')]
+
+
+def test_writer_stores_good_rows_of_failed_batch_once(conn, capsys):
+    """A bad row in a batch: the rows written before it are not inserted twice"""
+    writer = BufferedWriter(conn.cursor())
+    writer.register('t', ('id', 'name'))
+    for row in [(1, 'a'), (2, 'b'), (9, None), (3, 'c')]:
+        writer.add('t', row)
+    writer.flush()
+    assert conn.execute('SELECT id, name FROM t ORDER BY rowid').fetchall() == [(1, 'a'), (2, 'b'), (3, 'c')]
+    assert 'Error inserting into t (record 9)' in capsys.readouterr().out
+
+
+def test_writer_keeps_rows_of_earlier_batches(conn):
+    writer = BufferedWriter(conn.cursor())
+    writer.register('t', ('id', 'name'))
+    writer.add('t', (1, 'a'))
+    writer.flush()
+    writer.add('t', (2, None))
+    writer.add('t', (3, 'c'))
+    writer.flush()
+    assert conn.execute('SELECT id FROM t ORDER BY rowid').fetchall() == [(1,), (3,)]
+
+
+def test_writer_does_not_commit(conn):
+    """Rows stay in the caller's transaction, the import commits once at the end"""
+    writer = BufferedWriter(conn.cursor())
+    writer.register('t', ('id', 'name'))
+    writer.add('t', (1, 'a'))
+    writer.add('t', (2, None))
+    writer.flush()
+    assert conn.in_transaction
+    conn.rollback()
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+
+
+# ---------- Import of a synthetic dump ----------
+
+def _schema():
+    """Tables of the importer: records with explicit ids, child rows with their own"""
+    def table(name, columns):
+        return f"CREATE TABLE {name} ({', '.join(('id INTEGER PRIMARY KEY',) + columns)});"
+    return '\n'.join([
+        table('records', importer_module.RECORD_COLUMNS[1:]),
+        table('license_actions', importer_module.LICENSE_ACTION_COLUMNS),
+        table('broadcast_grid', importer_module.BROADCAST_GRID_COLUMNS),
+        table('programm_concept', importer_module.PROGRAMM_CONCEPT_COLUMNS),
+        'CREATE INDEX ix_broadcast_grid_record ON broadcast_grid (record_id);',
+    ])
+
+
+@pytest.fixture
+def schema(tmp_path):
+    path = tmp_path / 'schema.sql'
+    path.write_text(_schema(), encoding='utf-8')
+    return str(path)
+
+
+def _record(license_num, smi_name, rows=(), concept=(), granting='2020-01-15', extra=''):
+    grid = ''.join(
+        f'<rkn:row><rkn:region_name_full>{region}</rkn:region_name_full>'
+        f'<rkn:freq>{freq}</rkn:freq><rkn:transponder>{transponder}</rkn:transponder></rkn:row>'
+        for region, freq, transponder in rows
+    )
+    programm = ''.join(
+        f'<rkn:row><rkn:smi_name>{name}</rkn:smi_name><rkn:percentage>{percentage}</rkn:percentage></rkn:row>'
+        for name, percentage in concept
+    )
+    action = (f'<rkn:granting><rkn:date>{granting}</rkn:date><rkn:reason>Заявление</rkn:reason></rkn:granting>'
+              if granting else '')
+    return (
+        f'<rkn:record><rkn:org_id>{license_num[1:]}</rkn:org_id><rkn:org_name>ООО {smi_name}</rkn:org_name>'
+        f'<rkn:inn>77{license_num[1:]}</rkn:inn><rkn:license_num>{license_num}</rkn:license_num>'
+        f'<rkn:license_date>2020-01-15</rkn:license_date><rkn:smi_name>{smi_name}</rkn:smi_name>'
+        f'<rkn:status>действующая</rkn:status>{extra}{action}'
+        f'<rkn:grid>{grid}</rkn:grid><rkn:programm_concept>{programm}</rkn:programm_concept></rkn:record>'
+    )
+
+
+def _xml(tmp_path, records, name='rkn.xml', prefix='rkn'):
+    """Dump of records; prefix '' puts the RKN namespace on the default one"""
+    declaration = f'xmlns:{prefix}="{RKN_NAMESPACE}"' if prefix else f'xmlns="{RKN_NAMESPACE}"'
+    text = (f'<?xml version="1.0" encoding="utf-8"?>\n'
+            f'<rkn:register {declaration} xmlns:other="http://example.com/other">\n'
+            + '\n'.join(records) + '\n</rkn:register>\n')
+    path = tmp_path / name
+    path.write_text(text.replace('rkn:', f'{prefix}:' if prefix else ''), encoding='utf-8')
+    return str(path)
+
+
+RECORDS = [
+    _record('Л001', 'Радио 1', rows=[('Московская область', '100,1 МГц', '')],
+            concept=[('Радио 1', 100)]),
+    '<!-- <rkn:record><rkn:license_num>Л999</rkn:license_num></rkn:record> -->',
+    _record('Л002', 'Радио 2', rows=[('Тверская область', '101,0 МГц', ''), ('Тверская область', '102,0 МГц', '7')],
+            extra='<!-- </rkn:record> -->'),
+    # A closing tag inside CDATA does not end the record
+    _record('Л003', '<![CDATA[Радио </rkn:record> & FM]]>', rows=[('Московская область', '103,0 МГц', '')],
+            granting=None),
+    _record('Л003', 'Радио 3, вторая лицензия', concept=[('Радио 3', 50), ('Музыка', 50)]),
+    _record('Л004', 'ТВ 1'),
+]
+
+
+@pytest.fixture
+def dump(tmp_path):
+    return _xml(tmp_path, RECORDS)
+
+
+def _import(tmp_path, schema, xml_path, name='rkn.db', workers=1, incremental=False):
+    importer = XMLToDatabaseImporter(str(tmp_path / name), schema)
+    if not (incremental and importer.open_database()):
+        importer.create_database()
+    importer.import_xml(xml_path, workers=workers, incremental=incremental)
+    importer.close()
+    return str(tmp_path / name), importer.stats
+
+
+def _tables(db_path, with_ids=True):
+    """Rows of every importer table in id order; child ids are left out unless with_ids"""
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = {}
+        for table in ('records', 'license_actions', 'broadcast_grid', 'programm_concept'):
+            rows = conn.execute(f'SELECT * FROM {table} ORDER BY id').fetchall()
+            tables[table] = rows if with_ids or table == 'records' else sorted(row[1:] for row in rows)
+        return tables
+    finally:
+        conn.close()
+
+
+def test_sequential_import(tmp_path, schema, dump):
+    tables = _tables(_import(tmp_path, schema, dump)[0])
+    records = [dict(zip(importer_module.RECORD_COLUMNS, row)) for row in tables['records']]
+    assert [(r['id'], r['license_num'], r['smi_name']) for r in records] == [
+        (1, 'Л001', 'Радио 1'),
+        (2, 'Л002', 'Радио 2'),
+        (3, 'Л003', 'Радио </rkn:record> & FM'),
+        (4, 'Л003', 'Радио 3, вторая лицензия'),
+        (5, 'Л004', 'ТВ 1'),
+    ]
+    assert len(tables['broadcast_grid']) == 4
+    assert len(tables['programm_concept']) == 3
+    assert len(tables['license_actions']) == 4
+
+
+def test_parse_record_maps_fields(dump):
+    """Rows of every table come from the field specs, converters applied"""
+    importer = XMLToDatabaseImporter(None, None)
+    record_elem = next(importer.iter_records(dump))
+    record, actions, grid, concept = importer.parse_record(record_elem)
+    fields = dict(zip(importer_module.RECORD_COLUMNS[1:], record))
+    assert fields['org_id'] == 1
+    assert fields['org_name'] == 'ООО Радио 1'
+    assert fields['inn'] == '77001'
+    assert fields['license_date'] == '2020-01-15'
+    assert fields['end_date'] is None
+    assert fields['phone'] == ''
+    assert actions == [('granting', '2020-01-15', 'Заявление', '')]
+    grid_row = dict(zip(importer_module.BROADCAST_GRID_COLUMNS[1:], grid[0]))
+    assert grid_row['region_name_full'] == 'Московская область'
+    assert grid_row['freq'] == '100,1 МГц'
+    assert grid_row['transponder'] is None
+    assert concept == [('Радио 1', '', 100, '')]
+
+
+@pytest.mark.parametrize('prefix', ['rkn', 'ns0', ''])
+def test_parallel_import_matches_sequential(tmp_path, schema, monkeypatch, prefix):
+    """Worker processes give the same rows and ids, whatever the namespace prefix"""
+    # Small blocks: records, comments and CDATA are cut across block boundaries
+    monkeypatch.setattr(importer_module, 'READ_SIZE', 64)
+    dump = _xml(tmp_path, RECORDS, prefix=prefix)
+    sequential = _tables(_import(tmp_path, schema, dump, 'sequential.db')[0])
+    parallel = _tables(_import(tmp_path, schema, dump, 'parallel.db', workers=2)[0])
+    assert parallel == sequential
+    assert len(sequential['records']) == 5
+
+
+@pytest.mark.parametrize('read_size', [7, 64, 1 << 20])
+def test_split_records(dump, read_size, monkeypatch):
+    monkeypatch.setattr(importer_module, 'READ_SIZE', read_size)
+    importer = XMLToDatabaseImporter(None, None)
+    (prolog, namespaces), *records = importer.split_records(dump)
+    assert prolog == b'<?xml version="1.0" encoding="utf-8"?>'
+    assert f'xmlns:rkn="{RKN_NAMESPACE}"'.encode() in namespaces
+    assert b'xmlns:other="http://example.com/other"' in namespaces
+    # The commented out record is skipped, the CDATA one is cut whole
+    assert [record.decode('utf-8') for record in records] == [RECORDS[0]] + RECORDS[2:]
+
+
+def test_split_records_with_large_header(tmp_path, schema, monkeypatch):
+    """The namespace may be declared on a wrapper far from the start of the file"""
+    monkeypatch.setattr(importer_module, 'READ_SIZE', 4096)
+    path = tmp_path / 'wrapped.xml'
+    path.write_text(
+        '<register><!-- ' + 'x' * 100_000 + f' --><ns1:records xmlns:ns1="{RKN_NAMESPACE}">'
+        + ''.join(RECORDS).replace('rkn:', 'ns1:') + '</ns1:records></register>',
+        encoding='utf-8',
+    )
+    importer = XMLToDatabaseImporter(None, None)
+    chunks = list(importer.iter_record_chunks(str(path), 2))
+    assert len(chunks) == 3
+    assert chunks[0].startswith(f'<chunk xmlns:ns1="{RKN_NAMESPACE}"><ns1:record>'.encode())
+    sequential = _tables(_import(tmp_path, schema, str(path), 'sequential.db')[0])
+    assert _tables(_import(tmp_path, schema, str(path), 'parallel.db', workers=2)[0]) == sequential
+    assert len(sequential['records']) == 5
+
+
+# ---------- Incremental import ----------
+
+LICENSE_NUM = importer_module.RECORD_COLUMNS.index('license_num')
+SMI_NAME = importer_module.RECORD_COLUMNS.index('smi_name')
+FREQ = importer_module.BROADCAST_GRID_COLUMNS.index('freq')
+
+def test_incremental_import(tmp_path, schema):
+    """Version B adds, changes and removes one record each, the rest is left alone"""
+    version_a = _xml(tmp_path, RECORDS, 'a.xml')
+    db_path, stats = _import(tmp_path, schema, version_a)
+    assert stats == {'new': 5, 'changed': 0, 'deleted': 0, 'unchanged': 0}
+
+    changed = _record('Л002', 'Радио 2', rows=[('Тверская область', '105,0 МГц', '')])
+    added = _record('Л005', 'Радио 5', rows=[('Тверская область', '106,0 МГц', '')], concept=[('Радио 5', 100)])
+    # Л004 is removed
+    version_b = _xml(tmp_path, [RECORDS[0], changed, RECORDS[3], RECORDS[4], added], 'b.xml')
+    db_path, stats = _import(tmp_path, schema, version_b, incremental=True)
+    assert stats == {'new': 1, 'changed': 1, 'deleted': 1, 'unchanged': 3}
+
+    tables = _tables(db_path, with_ids=False)
+    assert [(row[0], row[LICENSE_NUM], row[SMI_NAME]) for row in tables['records']] == [
+        (1, 'Л001', 'Радио 1'),
+        (2, 'Л002', 'Радио 2'),
+        (3, 'Л003', 'Радио </rkn:record> & FM'),
+        (4, 'Л003', 'Радио 3, вторая лицензия'),
+        (6, 'Л005', 'Радио 5'),
+    ]
+    grid = [(row[0], row[FREQ]) for row in tables['broadcast_grid']]
+    assert grid == [(1, '100,1 МГц'), (2, '105,0 МГц'), (3, '103,0 МГц'), (6, '106,0 МГц')]
+    # Nothing of the removed record is left
+    assert all(row[0] != 5 for table in ('license_actions', 'broadcast_grid', 'programm_concept')
+               for row in tables[table])
+    # Same content as a full import of version B, apart from the record ids
+    full = _tables(_import(tmp_path, schema, version_b, 'full.db')[0], with_ids=False)
+    assert [row[1:] for row in tables['records']] == [row[1:] for row in full['records']]
+    assert {table: [row[1:] for row in rows] for table, rows in tables.items() if table != 'records'} \
+        == {table: [row[1:] for row in rows] for table, rows in full.items() if table != 'records'}
+
+    conn = sqlite3.connect(db_path)
+    fingerprints = conn.execute(
+        'SELECT license_num, occurrence, record_id FROM record_fingerprints ORDER BY record_id'
+    ).fetchall()
+    conn.close()
+    assert fingerprints == [('Л001', 0, 1), ('Л002', 0, 2), ('Л003', 0, 3), ('Л003', 1, 4), ('Л005', 0, 6)]
+
+    # Importing the same version again changes nothing
+    db_path, stats = _import(tmp_path, schema, version_b, incremental=True)
+    assert stats == {'new': 0, 'changed': 0, 'deleted': 0, 'unchanged': 5}
+    assert _tables(db_path, with_ids=False) == tables
+
+
+@pytest.mark.parametrize('incremental, synchronous', [(False, 0), (True, 1)])
+def test_incremental_import_keeps_synchronous(tmp_path, schema, dump, incremental, synchronous):
+    """synchronous=OFF only for a full rebuild, an incremental import updates the only copy"""
+    db_path, _ = _import(tmp_path, schema, dump)
+    importer = XMLToDatabaseImporter(db_path, schema)
+    assert importer.open_database()
+    saved = importer.apply_pragmas(incremental)
+    assert importer.conn.execute('PRAGMA synchronous').fetchone()[0] == synchronous
+    importer.restore_pragmas(saved)
+    assert importer.conn.execute('PRAGMA synchronous').fetchone()[0] == 2  # FULL, the default
+    importer.close()
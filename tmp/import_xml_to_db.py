@@ -3,23 +3,218 @@
 Script to parse XML broadcast license data and import into SQLite database.
 """
 
+import hashlib
+import os
+import re
 import sqlite3
+import sys
+import time
 import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from typing import Iterator, Optional, List, Dict, Any, Tuple
+from xml.sax.saxutils import quoteattr
+
+# The field mapping layer lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rkn_fields import RKN_NAMESPACE, FieldSpec, iter_records, iter_rows, safe_date, safe_int
+
+
+# Rows buffered per table before an executemany
+DEFAULT_BATCH_SIZE = 5000
+
+# Records per chunk sent to a worker process in parallel mode
+DEFAULT_CHUNK_RECORDS = 500
+
+# Bytes read at a time when splitting raw records
+READ_SIZE = 1 << 20
+
+# Sections skipped while splitting: start -> end marker
+SKIPPED_SECTIONS = {b'<!--': b'-->', b'<![CDATA[': b']]>'}
+
+# Bytes kept from the end of a block, longer than any tag searched for
+SPLIT_OVERLAP = 256
+
+# Pragmas for the duration of the import. A full import rebuilds the database
+# from the XML, so durability is traded for speed (synchronous=OFF). An incremental
+# import updates the only copy of the data and uses INCREMENTAL_SYNCHRONOUS instead.
+IMPORT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'OFF',
+    'cache_size': -262144,  # 256 MB
+    'temp_store': 'MEMORY',
+}
+
+# With WAL, NORMAL may lose the last transactions on power loss but never corrupts
+INCREMENTAL_SYNCHRONOUS = 'NORMAL'
+
+LICENSE_ACTIONS = ('granting', 'renewal', 'prolongation', 'suspension', 'annulled')
+
+# Field specs of the target tables, in column order (ids are added on write)
+RECORD_SPEC = FieldSpec([
+    ('org_id', safe_int),
+    ('org_name', None),
+    ('org_name_short', None),
+    ('org_name_brand', None),
+    ('pattern_name', None),
+    ('address', None),
+    ('phone', None),
+    ('email', None),
+    ('place', None),
+    ('inn', None),
+    ('ogrn', None),
+    ('licensed_activity', None),
+    ('license_num', None),
+    ('license_num_old', None),
+    ('license_date', safe_date),
+    ('service_start_date', safe_date),
+    ('end_date', safe_date),
+    ('smi_name', None),
+    ('status', None),
+    ('num_order', None),
+    ('date_order', safe_date),
+    ('sreda', None),
+    ('changed_user_descr', None),
+], elements=('grid', 'programm_concept') + LICENSE_ACTIONS)
+ACTION_SPEC = FieldSpec([
+    ('date', safe_date),
+    ('reason', None),
+    ('description', None),
+])
+GRID_SPEC = FieldSpec([
+    ('region_name_full', None),
+    ('region_text', None),
+    ('mount_point', None),
+    ('channel_num', None),
+    ('freq', None),
+    ('power', None),
+    ('population', None),
+    ('brcst_time', None),
+    ('sat_brcst_params', None),
+    ('brcst_descr', None),
+    ('pack_pos_num', None),
+    ('pack_num', None),
+    ('isz', None),
+    ('transponder', safe_int),
+])
+CONCEPT_SPEC = FieldSpec([
+    ('smi_name', None),
+    ('brcst_direction', None),
+    ('percentage', safe_int),
+    ('spec', None),
+])
+
+RECORD_COLUMNS = ('id',) + RECORD_SPEC.names
+LICENSE_ACTION_COLUMNS = ('record_id', 'action_type') + ACTION_SPEC.names
+BROADCAST_GRID_COLUMNS = ('record_id',) + GRID_SPEC.names
+PROGRAMM_CONCEPT_COLUMNS = ('record_id',) + CONCEPT_SPEC.names
+LICENSE_NUM_POSITION = RECORD_SPEC.names.index('license_num')
+
+# Child tables of records, deleted together with a changed or removed record
+CHILD_TABLES = ('license_actions', 'broadcast_grid', 'programm_concept')
+
+# Content hash of every imported record, used by incremental imports.
+# occurrence numbers records sharing a license_num in file order.
+FINGERPRINT_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS record_fingerprints (
+    license_num TEXT NOT NULL,
+    occurrence INTEGER NOT NULL,
+    record_id INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (license_num, occurrence)
+)
+'''
+FINGERPRINT_COLUMNS = ('license_num', 'occurrence', 'record_id', 'content_hash')
+
+# Ids per IN (...) list when deleting records
+DELETE_BATCH_SIZE = 500
+
+# (record fields, license actions, grid rows, programme concept rows), without ids
+ParsedRecord = Tuple[tuple, List[tuple], List[tuple], List[tuple]]
+
+
+class BufferedWriter:
+    """Accumulate rows per table and write them with executemany in batches."""
+    
+    def __init__(self, cursor: sqlite3.Cursor, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.statements: Dict[str, str] = {}
+        self.buffers: Dict[str, List[tuple]] = {}
+        self.pending = 0
+    
+    def register(self, table: str, columns: tuple):
+        """Register a table; tables are flushed in registration order (parents first)."""
+        placeholders = ', '.join('?' * len(columns))
+        self.statements[table] = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        self.buffers[table] = []
+    
+    def add(self, table: str, row: tuple):
+        """Buffer a row, flushing all tables once batch_size rows are pending."""
+        self.buffers[table].append(row)
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        """Write all buffered rows."""
+        for table, rows in self.buffers.items():
+            if rows:
+                self._write(table, rows)
+                rows.clear()
+        self.pending = 0
+    
+    def _write(self, table: str, rows: List[tuple]):
+        statement = self.statements[table]
+        if not self.cursor.connection.in_transaction:
+            # An outermost savepoint would start its own transaction and commit it on RELEASE
+            self.cursor.execute("BEGIN")
+        self.cursor.execute("SAVEPOINT buffered_write")
+        try:
+            self.cursor.executemany(statement, rows)
+        except sqlite3.Error:
+            # executemany keeps the rows before the failing one: undo them,
+            # then find the offending rows one by one and keep the rest
+            self.cursor.execute("ROLLBACK TO buffered_write")
+            for row in rows:
+                try:
+                    self.cursor.execute(statement, row)
+                except sqlite3.Error as e:
+                    print(f"Error inserting into {table} (record {row[0]}): {e}")
+        finally:
+            self.cursor.execute("RELEASE buffered_write")
 
 
 class XMLToDatabaseImporter:
     """Import broadcast license data from XML to SQLite."""
     
-    def __init__(self, db_path: str, schema_path: str):
-        """Initialize importer with database and schema paths."""
+    def __init__(self, db_path: str, schema_path: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                 pragmas: Optional[Dict[str, Any]] = None, defer_indexes: bool = True):
+        """Initialize importer with database and schema paths.
+
+        batch_size: rows buffered before executemany; pragmas: import-time pragma
+        profile (IMPORT_PRAGMAS by default, {} to keep connection defaults);
+        defer_indexes: drop indexes during the import and recreate them afterwards.
+        """
         self.db_path = db_path
         self.schema_path = schema_path
         self.conn = None
         self.cursor = None
-        self.namespace = {'rkn': 'http://rsoc.ru/opendata/7705846236-LicBroadcast'}
+        self.namespace = {'rkn': RKN_NAMESPACE}
+        self.batch_size = batch_size
+        self.pragmas = IMPORT_PRAGMAS if pragmas is None else pragmas
+        self.defer_indexes = defer_indexes
+        self.writer: Optional[BufferedWriter] = None
+        self.next_record_id = 1
+        
+        # Incremental mode: {(license_num, occurrence): (record_id, content_hash)} of
+        # records not seen yet in this run; None for a full import
+        self.fingerprints: Optional[Dict[Tuple[str, int], Tuple[int, str]]] = None
+        self.occurrences: Dict[str, int] = {}
+        self.fingerprint_updates: List[tuple] = []
+        self.stats = {'new': 0, 'changed': 0, 'deleted': 0, 'unchanged': 0}
     
     def create_database(self):
         """Create database schema."""
@@ -36,206 +231,434 @@ class XMLToDatabaseImporter:
         with open(self.schema_path, 'r', encoding='utf-8') as f:
             schema = f.read()
             self.cursor.executescript(schema)
+        self.cursor.executescript(FINGERPRINT_SCHEMA)
         
         self.conn.commit()
         print("Database schema created successfully.")
     
-    def parse_xml(self, xml_path: str) -> Optional[ET.Element]:
-        """Parse XML file and return root element."""
-        print(f"Parsing XML file: {xml_path}")
-        try:
-            tree = ET.parse(xml_path)
-            return tree.getroot()
-        except Exception as e:
-            print(f"Error parsing XML: {e}")
-            return None
+    def open_database(self) -> bool:
+        """Open an existing database for an incremental import.
+
+        Returns False (and leaves the database closed) if it does not exist or has
+        records without fingerprints, e.g. from an older importer; a full import
+        with create_database is needed then.
+        """
+        if not Path(self.db_path).exists():
+            return False
+        self.conn = sqlite3.connect(self.db_path)
+        self.cursor = self.conn.cursor()
+        self.cursor.executescript(FINGERPRINT_SCHEMA)
+        has_records = self.conn.execute("SELECT EXISTS (SELECT 1 FROM records)").fetchone()[0]
+        has_fingerprints = self.conn.execute("SELECT EXISTS (SELECT 1 FROM record_fingerprints)").fetchone()[0]
+        if has_records and not has_fingerprints:
+            self.close()
+            self.conn = self.cursor = None
+            return False
+        print(f"Opened database at {self.db_path} for incremental import.")
+        return True
     
-    def get_text(self, element: Optional[ET.Element], default: str = "") -> str:
-        """Safely get text from XML element."""
-        if element is not None and element.text:
-            return element.text.strip()
-        return default
+    def apply_pragmas(self, incremental: bool = False) -> Dict[str, Any]:
+        """Switch to the import pragma profile, return previous values for restore_pragmas."""
+        self.conn.commit()
+        pragmas = dict(self.pragmas)
+        if incremental and str(pragmas.get('synchronous', '')).upper() in ('OFF', '0'):
+            pragmas['synchronous'] = INCREMENTAL_SYNCHRONOUS
+        saved = {}
+        for name, value in pragmas.items():
+            saved[name] = self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+            self.conn.execute(f"PRAGMA {name} = {value}")
+        return saved
     
-    def safe_date(self, date_str: str) -> Optional[str]:
-        """Convert date string to proper format or return None."""
-        if not date_str or date_str.lower() == 'none':
-            return None
-        try:
-            # Try to parse and validate date
-            datetime.strptime(date_str, '%Y-%m-%d')
-            return date_str
-        except ValueError:
-            return None
+    def restore_pragmas(self, saved: Dict[str, Any]):
+        """Restore pragma values saved by apply_pragmas."""
+        self.conn.commit()
+        for name, value in saved.items():
+            self.conn.execute(f"PRAGMA {name} = {value}")
     
-    def safe_int(self, value_str: str) -> Optional[int]:
-        """Convert string to integer or return None."""
-        if not value_str:
-            return None
+    def drop_indexes(self) -> List[str]:
+        """Drop schema indexes, return their CREATE statements for create_indexes."""
+        indexes = self.conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        ).fetchall()
+        for name, _ in indexes:
+            self.conn.execute(f'DROP INDEX "{name}"')
+        return [sql for _, sql in indexes]
+    
+    def create_indexes(self, statements: List[str]):
+        """Recreate indexes dropped by drop_indexes."""
+        if statements:
+            print(f"Creating {len(statements)} indexes...")
+        for sql in statements:
+            self.conn.execute(sql)
+    
+    def iter_records(self, xml_path: str) -> Iterator[ET.Element]:
+        """Stream rkn:record elements one at a time, see rkn_fields.iter_records."""
+        print(f"Streaming XML file: {xml_path}")
         try:
-            return int(value_str)
-        except ValueError:
-            return None
+            yield from iter_records(xml_path)
+        except (ET.ParseError, OSError) as e:
+            # Records parsed before the error are kept
+            print(f"Error parsing XML: {e}")
     
-    def insert_record(self, record_elem: ET.Element) -> Optional[int]:
-        """Insert main record and return record ID."""
+    def extract_record(self, record_elem: ET.Element) -> Optional[Tuple[tuple, Dict[str, ET.Element]]]:
+        """Extract main record fields (without id) and its action/grid/concept elements."""
         try:
-            # Extract basic fields
-            org_id = self.safe_int(self.get_text(record_elem.find('rkn:org_id', self.namespace)))
-            org_name = self.get_text(record_elem.find('rkn:org_name', self.namespace))
-            org_name_short = self.get_text(record_elem.find('rkn:org_name_short', self.namespace))
-            org_name_brand = self.get_text(record_elem.find('rkn:org_name_brand', self.namespace))
-            pattern_name = self.get_text(record_elem.find('rkn:pattern_name', self.namespace))
-            address = self.get_text(record_elem.find('rkn:address', self.namespace))
-            phone = self.get_text(record_elem.find('rkn:phone', self.namespace))
-            email = self.get_text(record_elem.find('rkn:email', self.namespace))
-            place = self.get_text(record_elem.find('rkn:place', self.namespace))
-            inn = self.get_text(record_elem.find('rkn:inn', self.namespace))
-            ogrn = self.get_text(record_elem.find('rkn:ogrn', self.namespace))
-            licensed_activity = self.get_text(record_elem.find('rkn:licensed_activity', self.namespace))
-            license_num = self.get_text(record_elem.find('rkn:license_num', self.namespace))
-            license_num_old = self.get_text(record_elem.find('rkn:license_num_old', self.namespace))
-            license_date = self.safe_date(self.get_text(record_elem.find('rkn:license_date', self.namespace)))
-            service_start_date = self.safe_date(self.get_text(record_elem.find('rkn:service_start_date', self.namespace)))
-            end_date = self.safe_date(self.get_text(record_elem.find('rkn:end_date', self.namespace)))
-            smi_name = self.get_text(record_elem.find('rkn:smi_name', self.namespace))
-            status = self.get_text(record_elem.find('rkn:status', self.namespace))
-            num_order = self.get_text(record_elem.find('rkn:num_order', self.namespace))
-            date_order = self.safe_date(self.get_text(record_elem.find('rkn:date_order', self.namespace)))
-            sreda = self.get_text(record_elem.find('rkn:sreda', self.namespace))
-            changed_user_descr = self.get_text(record_elem.find('rkn:changed_user_descr', self.namespace))
-            
-            # Insert record
-            self.cursor.execute('''
-                INSERT INTO records (
-                    org_id, org_name, org_name_short, org_name_brand, pattern_name,
-                    address, phone, email, place, inn, ogrn, licensed_activity,
-                    license_num, license_num_old, license_date, service_start_date,
-                    end_date, smi_name, status, num_order, date_order, sreda,
-                    changed_user_descr
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                org_id, org_name, org_name_short, org_name_brand, pattern_name,
-                address, phone, email, place, inn, ogrn, licensed_activity,
-                license_num, license_num_old, license_date, service_start_date,
-                end_date, smi_name, status, num_order, date_order, sreda,
-                changed_user_descr
-            ))
-            
-            return self.cursor.lastrowid
+            return RECORD_SPEC.extract_with_elements(record_elem)
         
         except Exception as e:
             print(f"Error inserting record: {e}")
             return None
     
-    def insert_license_actions(self, record_id: int, record_elem: ET.Element):
-        """Insert license action records (granting, renewal, etc.)."""
-        actions = ['granting', 'renewal', 'prolongation', 'suspension', 'annulled']
+    def extract_license_actions(self, elements: Dict[str, ET.Element], label: str) -> List[tuple]:
+        """Extract license actions (granting, renewal, etc.), without record_id."""
+        rows = []
         
-        for action_name in actions:
-            action_elem = record_elem.find(f'rkn:{action_name}', self.namespace)
+        for action_name in LICENSE_ACTIONS:
+            action_elem = elements.get(action_name)
             if action_elem is not None:
                 try:
-                    date = self.safe_date(self.get_text(action_elem.find('rkn:date', self.namespace)))
-                    reason = self.get_text(action_elem.find('rkn:reason', self.namespace))
-                    description = self.get_text(action_elem.find('rkn:description', self.namespace))
-                    
-                    self.cursor.execute('''
-                        INSERT INTO license_actions (record_id, action_type, date, reason, description)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (record_id, action_name, date, reason, description))
+                    rows.append((action_name,) + ACTION_SPEC.extract(action_elem))
                 
                 except Exception as e:
-                    print(f"Error inserting {action_name} action for record {record_id}: {e}")
+                    print(f"Error inserting {action_name} action for record {label}: {e}")
+        return rows
     
-    def insert_broadcast_grid(self, record_id: int, record_elem: ET.Element):
-        """Insert broadcast grid (сетка вещания) records."""
-        grid_elem = record_elem.find('rkn:grid', self.namespace)
-        if grid_elem is None:
-            return
+    def extract_broadcast_grid(self, grid_elem: Optional[ET.Element], label: str) -> List[tuple]:
+        """Extract broadcast grid (сетка вещания) rows, without record_id."""
+        rows = []
         
-        for row in grid_elem.findall('rkn:row', self.namespace):
+        for row in iter_rows(grid_elem):
             try:
-                region_name_full = self.get_text(row.find('rkn:region_name_full', self.namespace))
-                region_text = self.get_text(row.find('rkn:region_text', self.namespace))
-                mount_point = self.get_text(row.find('rkn:mount_point', self.namespace))
-                channel_num = self.get_text(row.find('rkn:channel_num', self.namespace))
-                freq = self.get_text(row.find('rkn:freq', self.namespace))
-                power = self.get_text(row.find('rkn:power', self.namespace))
-                population = self.get_text(row.find('rkn:population', self.namespace))
-                brcst_time = self.get_text(row.find('rkn:brcst_time', self.namespace))
-                sat_brcst_params = self.get_text(row.find('rkn:sat_brcst_params', self.namespace))
-                brcst_descr = self.get_text(row.find('rkn:brcst_descr', self.namespace))
-                pack_pos_num = self.get_text(row.find('rkn:pack_pos_num', self.namespace))
-                pack_num = self.get_text(row.find('rkn:pack_num', self.namespace))
-                isz = self.get_text(row.find('rkn:isz', self.namespace))
-                transponder = self.safe_int(self.get_text(row.find('rkn:transponder', self.namespace)))
-                
-                self.cursor.execute('''
-                    INSERT INTO broadcast_grid (
-                        record_id, region_name_full, region_text, mount_point, channel_num,
-                        freq, power, population, brcst_time, sat_brcst_params, brcst_descr,
-                        pack_pos_num, pack_num, isz, transponder
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    record_id, region_name_full, region_text, mount_point, channel_num,
-                    freq, power, population, brcst_time, sat_brcst_params, brcst_descr,
-                    pack_pos_num, pack_num, isz, transponder
-                ))
+                rows.append(GRID_SPEC.extract(row))
             
             except Exception as e:
-                print(f"Error inserting broadcast grid row for record {record_id}: {e}")
+                print(f"Error inserting broadcast grid row for record {label}: {e}")
+        return rows
     
-    def insert_programm_concept(self, record_id: int, record_elem: ET.Element):
-        """Insert program concept (программная концепция) records."""
-        concept_elem = record_elem.find('rkn:programm_concept', self.namespace)
-        if concept_elem is None:
-            return
+    def extract_programm_concept(self, concept_elem: Optional[ET.Element], label: str) -> List[tuple]:
+        """Extract program concept (программная концепция) rows, without record_id."""
+        rows = []
         
-        for row in concept_elem.findall('rkn:row', self.namespace):
+        for row in iter_rows(concept_elem):
             try:
-                smi_name = self.get_text(row.find('rkn:smi_name', self.namespace))
-                brcst_direction = self.get_text(row.find('rkn:brcst_direction', self.namespace))
-                percentage = self.safe_int(self.get_text(row.find('rkn:percentage', self.namespace)))
-                spec = self.get_text(row.find('rkn:spec', self.namespace))
-                
-                self.cursor.execute('''
-                    INSERT INTO programm_concept (record_id, smi_name, brcst_direction, percentage, spec)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (record_id, smi_name, brcst_direction, percentage, spec))
+                rows.append(CONCEPT_SPEC.extract(row))
             
             except Exception as e:
-                print(f"Error inserting program concept row for record {record_id}: {e}")
+                print(f"Error inserting program concept row for record {label}: {e}")
+        return rows
+    
+    def parse_record(self, record_elem: ET.Element) -> Optional[ParsedRecord]:
+        """Turn a record element into row tuples for all tables.
+
+        Pure function of the element, so it can run in worker processes.
+        Returns None if the main record could not be extracted.
+        """
+        extracted = self.extract_record(record_elem)
+        if extracted is None:
+            return None
+        record, elements = extracted
+        label = record[LICENSE_NUM_POSITION]
+        return (
+            record,
+            self.extract_license_actions(elements, label),
+            self.extract_broadcast_grid(elements.get('grid'), label),
+            self.extract_programm_concept(elements.get('programm_concept'), label),
+        )
+    
+    def write_record(self, parsed: ParsedRecord) -> int:
+        """Write a parsed record, return its id.
+
+        In a full import every record is new. In an incremental import the content
+        hash is compared with the stored fingerprint: unchanged records are left
+        alone, changed ones are replaced under the same id.
+        """
+        license_num = parsed[0][LICENSE_NUM_POSITION]
+        occurrence = self.occurrences.get(license_num, 0)
+        self.occurrences[license_num] = occurrence + 1
+        key = (license_num, occurrence)
+        content_hash = self.content_hash(parsed)
+        
+        existing = self.fingerprints.pop(key, None) if self.fingerprints is not None else None
+        if existing is None:
+            record_id = self.insert_rows(parsed)
+            self.writer.add('record_fingerprints', key + (record_id, content_hash))
+            self.stats['new'] += 1
+            return record_id
+        
+        record_id, stored_hash = existing
+        if stored_hash == content_hash:
+            self.stats['unchanged'] += 1
+            return record_id
+        
+        self.delete_records([record_id])
+        self.insert_rows(parsed, record_id)
+        self.fingerprint_updates.append((content_hash,) + key)
+        self.stats['changed'] += 1
+        return record_id
+    
+    def content_hash(self, parsed: ParsedRecord) -> str:
+        """Hash of all rows of a record, ids excluded."""
+        return hashlib.sha1(repr(parsed).encode('utf-8')).hexdigest()
     
-    def import_xml(self, xml_path: str):
-        """Main import function."""
-        root = self.parse_xml(xml_path)
-        if root is None:
-            return
+    def insert_rows(self, parsed: ParsedRecord, record_id: Optional[int] = None) -> int:
+        """Buffer the rows of a parsed record under record_id or the next free id."""
+        record, actions, grid, concept = parsed
+        if record_id is None:
+            # Ids are assigned here, so child rows can be buffered before the record is written
+            record_id = self.next_record_id
+            self.next_record_id += 1
         
+        self.writer.add('records', (record_id,) + record)
+        for row in actions:
+            self.writer.add('license_actions', (record_id,) + row)
+        for row in grid:
+            self.writer.add('broadcast_grid', (record_id,) + row)
+        for row in concept:
+            self.writer.add('programm_concept', (record_id,) + row)
+        return record_id
+    
+    def delete_records(self, record_ids: List[int]):
+        """Delete records with all their child rows."""
+        for start in range(0, len(record_ids), DELETE_BATCH_SIZE):
+            batch = record_ids[start:start + DELETE_BATCH_SIZE]
+            placeholders = ', '.join('?' * len(batch))
+            for table in CHILD_TABLES:
+                self.conn.execute(f"DELETE FROM {table} WHERE record_id IN ({placeholders})", batch)
+            self.conn.execute(f"DELETE FROM records WHERE id IN ({placeholders})", batch)
+    
+    def load_fingerprints(self):
+        """Load stored fingerprints for an incremental import."""
+        self.fingerprints = {
+            (license_num, occurrence): (record_id, content_hash)
+            for license_num, occurrence, record_id, content_hash in self.conn.execute(
+                "SELECT license_num, occurrence, record_id, content_hash FROM record_fingerprints"
+            )
+        }
+        print(f"Loaded {len(self.fingerprints)} record fingerprints.")
+    
+    def apply_removals(self):
+        """Delete records missing from the dump and store changed fingerprints."""
+        removed = list(self.fingerprints.items())
+        self.delete_records([record_id for _, (record_id, _) in removed])
+        self.conn.executemany(
+            "DELETE FROM record_fingerprints WHERE license_num = ? AND occurrence = ?",
+            [key for key, _ in removed],
+        )
+        self.conn.executemany(
+            "UPDATE record_fingerprints SET content_hash = ? WHERE license_num = ? AND occurrence = ?",
+            self.fingerprint_updates,
+        )
+        self.stats['deleted'] = len(removed)
+    
+    def import_xml(self, xml_path: str, workers: int = 1, incremental: bool = False):
+        """Main import function. workers > 1 parses records in that many processes.
+
+        incremental: only write new and changed records and delete records missing
+        from the dump (database opened with open_database).
+        """
+        self.writer = BufferedWriter(self.cursor, self.batch_size)
+        self.writer.register('records', RECORD_COLUMNS)
+        self.writer.register('license_actions', LICENSE_ACTION_COLUMNS)
+        self.writer.register('broadcast_grid', BROADCAST_GRID_COLUMNS)
+        self.writer.register('programm_concept', PROGRAMM_CONCEPT_COLUMNS)
+        self.writer.register('record_fingerprints', FINGERPRINT_COLUMNS)
+        self.next_record_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM records").fetchone()[0]
+        self.occurrences = {}
+        self.fingerprint_updates = []
+        self.stats = dict.fromkeys(self.stats, 0)
+        if incremental:
+            self.load_fingerprints()
+        
+        started = time.perf_counter()
+        saved_pragmas = self.apply_pragmas(incremental)
+        # An incremental import deletes by record_id, so it keeps the indexes
+        indexes = self.drop_indexes() if self.defer_indexes and not incremental else []
+        try:
+            if workers > 1:
+                records_count = self.import_records_parallel(xml_path, workers)
+            else:
+                records_count = self.import_records(xml_path)
+            if incremental:
+                self.apply_removals()
+            self.writer.flush()
+            self.create_indexes(indexes)
+            self.conn.commit()
+        finally:
+            self.restore_pragmas(saved_pragmas)
+            self.fingerprints = None
+        elapsed = time.perf_counter() - started
+        print(f"\nImport complete! Processed {records_count} records "
+              f"in {elapsed:.1f}s ({records_count / elapsed if elapsed else 0:.0f} records/sec).")
+        if incremental:
+            print("  New: {new}, changed: {changed}, deleted: {deleted}, unchanged: {unchanged}".format(**self.stats))
+    
+    def import_records(self, xml_path: str) -> int:
+        """Parse records and buffer their rows, return the number of records."""
         records_count = 0
+        started = time.perf_counter()
         
-        # Find all record elements
-        for record_elem in root.findall('rkn:record', self.namespace):
+        # Records are processed while the file is still being read
+        for record_elem in self.iter_records(xml_path):
             try:
-                # Insert main record
-                record_id = self.insert_record(record_elem)
-                if record_id is None:
+                parsed = self.parse_record(record_elem)
+                if parsed is None:
                     continue
-                
-                # Insert related data
-                self.insert_license_actions(record_id, record_elem)
-                self.insert_broadcast_grid(record_id, record_elem)
-                self.insert_programm_concept(record_id, record_elem)
+                self.write_record(parsed)
                 
                 records_count += 1
-                if records_count % 10 == 0:
-                    print(f"Processed {records_count} records...")
+                if records_count % 1000 == 0:
+                    self.print_progress(records_count, started)
             
             except Exception as e:
                 print(f"Error processing record: {e}")
         
-        self.conn.commit()
-        print(f"\nImport complete! Inserted {records_count} records.")
+        return records_count
+    
+    def import_records_parallel(self, xml_path: str, workers: int,
+                                chunk_records: int = DEFAULT_CHUNK_RECORDS) -> int:
+        """Parse records in a process pool; this process stays the only writer.
+
+        Raw record XML is cut out of the file without parsing (split_records) and
+        sent to workers in chunks. Chunks are written in file order, so record ids
+        and rows are identical to the sequential import.
+        """
+        print(f"Parsing with {workers} worker processes")
+        records_count = 0
+        started = time.perf_counter()
+        chunks = self.iter_record_chunks(xml_path, chunk_records)
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self.namespace,)) as executor:
+            # A bounded window of chunks in flight keeps memory flat
+            pending = deque()
+            for document in chunks:
+                pending.append(executor.submit(_parse_chunk, document))
+                if len(pending) < workers * 2:
+                    continue
+                records_count = self.write_chunk(pending.popleft().result(), records_count, started)
+            while pending:
+                records_count = self.write_chunk(pending.popleft().result(), records_count, started)
+        
+        return records_count
+    
+    def write_chunk(self, parsed_records: List[Optional[ParsedRecord]], records_count: int,
+                    started: float) -> int:
+        """Buffer rows of a chunk parsed by a worker, return the updated record count."""
+        for parsed in parsed_records:
+            if parsed is None:
+                continue
+            self.write_record(parsed)
+            records_count += 1
+            if records_count % 1000 == 0:
+                self.print_progress(records_count, started)
+        return records_count
+    
+    def iter_record_chunks(self, xml_path: str, chunk_records: int) -> Iterator[bytes]:
+        """Group raw records into standalone XML documents for the workers."""
+        prolog, wrapper_start, wrapper_end = b'', b'<chunk>', b'</chunk>'
+        chunk = []
+        for raw in self.split_records(xml_path):
+            if isinstance(raw, tuple):
+                # Document header: XML declaration and namespace declarations
+                prolog, namespaces = raw
+                wrapper_start = b'<chunk ' + namespaces + b'>'
+                continue
+            chunk.append(raw)
+            if len(chunk) >= chunk_records:
+                yield b''.join([prolog, wrapper_start, *chunk, wrapper_end])
+                chunk = []
+        if chunk:
+            yield b''.join([prolog, wrapper_start, *chunk, wrapper_end])
+    
+    def split_records(self, xml_path: str):
+        """Cut raw rkn:record elements out of the file without parsing it.
+
+        Yields (prolog, namespace declarations) once, then the bytes of every record.
+        Comments and CDATA sections are skipped, so a '</rkn:record>' inside them
+        does not end a record.
+        """
+        print(f"Streaming XML file: {xml_path}")
+        with open(xml_path, 'rb') as f:
+            buffer, prefix, namespaces = self.read_header(f)
+            prolog = re.match(rb'\s*(<\?xml[^>]*\?>)?', buffer).group(1) or b''
+            yield prolog, namespaces
+            
+            outside = re.compile(rb'<!--|<!\[CDATA\[|<' + re.escape(prefix) + rb'record(?=[\s/>])')
+            inside = re.compile(rb'<!--|<!\[CDATA\[|</' + re.escape(prefix) + rb'record\s*>')
+            start = None  # offset of the record being cut, None between records
+            pos = 0
+            eof = False
+            while True:
+                match = (outside if start is None else inside).search(buffer, pos)
+                end = -1
+                if match:
+                    token = match.group()
+                    if token in SKIPPED_SECTIONS:
+                        end = buffer.find(SKIPPED_SECTIONS[token], match.end())
+                        if end != -1:
+                            end += len(SKIPPED_SECTIONS[token])
+                    elif start is None:
+                        # Record start tag, possibly an empty element <rkn:record/>
+                        end = buffer.find(b'>', match.end())
+                        if end != -1:
+                            end += 1
+                            if buffer[end - 2:end] == b'/>':
+                                yield buffer[match.start():end]
+                            else:
+                                start = match.start()
+                    else:
+                        end = match.end()
+                        yield buffer[start:end]
+                        start = None
+                if end != -1:
+                    pos = end
+                    continue
+                if eof:
+                    return
+                # Token cut at the end of the buffer: keep the unfinished record
+                # (or the unfinished comment / a possibly cut tag) and read on
+                resume = match.start() if match else max(pos, len(buffer) - SPLIT_OVERLAP)
+                keep = resume if start is None else start
+                buffer = buffer[keep:]
+                pos = resume - keep
+                if start is not None:
+                    start = 0
+                data = f.read(READ_SIZE)
+                eof = not data
+                buffer += data
+    
+    def read_header(self, f) -> Tuple[bytes, bytes, bytes]:
+        """Read up to the first record, return (bytes read, record tag prefix, namespace declarations).
+
+        Namespaces are taken from a pull parser, so the root element and any
+        wrappers before the first record may be of any size.
+        """
+        parser = ET.XMLPullParser(events=('start-ns', 'start'))
+        record_tag = f"{{{self.namespace['rkn']}}}record"
+        buffer = b''
+        declared = {}
+        found = False
+        while not found:
+            data = f.read(READ_SIZE)
+            if not data:
+                break
+            buffer += data
+            parser.feed(data)
+            for event, value in parser.read_events():
+                if event == 'start-ns':
+                    declared.setdefault(value[0], value[1])
+                elif value.tag == record_tag:
+                    found = True
+                    break
+        prefix = next((name for name, uri in declared.items() if uri == self.namespace['rkn']), '')
+        namespaces = ' '.join(
+            f"{'xmlns:' + name if name else 'xmlns'}={quoteattr(uri)}" for name, uri in declared.items()
+        )
+        return buffer, (prefix + ':' if prefix else '').encode(), namespaces.encode('utf-8')
+    
+    def print_progress(self, records_count: int, started: float):
+        elapsed = time.perf_counter() - started
+        print(f"Processed {records_count} records ({records_count / elapsed if elapsed else 0:.0f} records/sec)...")
     
     def close(self):
         """Close database connection."""
@@ -244,22 +667,40 @@ class XMLToDatabaseImporter:
             print("Database connection closed.")
 
 
+# Parser of a worker process, see import_records_parallel
+_worker_importer: Optional['XMLToDatabaseImporter'] = None
+
+
+def _init_worker(namespace: Dict[str, str]):
+    global _worker_importer
+    _worker_importer = XMLToDatabaseImporter(None, None)
+    _worker_importer.namespace = namespace
+
+
+def _parse_chunk(document: bytes) -> List[Optional[ParsedRecord]]:
+    root = ET.fromstring(document)
+    return [_worker_importer.parse_record(record_elem) for record_elem in root]
+
+
 def main():
     """Main entry point."""
-    import sys
+    import argparse
     
     # Default paths
-    db_path = 'broadcast_licenses.db'
-    schema_path = 'sqlite_schema.sql'
-    xml_path = r'data\data-20251201T0000-structure-20220404T0000.xml'
-    
-    # Allow command line arguments
-    if len(sys.argv) > 1:
-        xml_path = sys.argv[1]
-    if len(sys.argv) > 2:
-        db_path = sys.argv[2]
-    if len(sys.argv) > 3:
-        schema_path = sys.argv[3]
+    p = argparse.ArgumentParser(description='Import RKN broadcast license XML into SQLite')
+    p.add_argument('xml_path', nargs='?', default=r'data\data-20251201T0000-structure-20220404T0000.xml')
+    p.add_argument('db_path', nargs='?', default='broadcast_licenses.db')
+    p.add_argument('schema_path', nargs='?', default='sqlite_schema.sql')
+    p.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                   help='Rows buffered per executemany')
+    p.add_argument('--safe', action='store_true',
+                   help='Keep default pragmas and indexes during the import')
+    p.add_argument('--workers', type=int, default=1,
+                   help='Processes parsing records; 1 parses in the writer process')
+    p.add_argument('--incremental', action='store_true',
+                   help='Update an existing database: only new, changed and removed licenses are written')
+    args = p.parse_args()
+    xml_path, db_path, schema_path = args.xml_path, args.db_path, args.schema_path
     
     print("=" * 60)
     print("XML to SQLite Database Importer")
@@ -270,11 +711,18 @@ def main():
     print("=" * 60)
     
     # Create and run importer
-    importer = XMLToDatabaseImporter(db_path, schema_path)
+    importer = XMLToDatabaseImporter(
+        db_path, schema_path, batch_size=args.batch_size,
+        pragmas={} if args.safe else None, defer_indexes=not args.safe,
+    )
     
     try:
-        importer.create_database()
-        importer.import_xml(xml_path)
+        incremental = args.incremental and importer.open_database()
+        if args.incremental and not incremental:
+            print("No fingerprinted database to update, running a full import.")
+        if not incremental:
+            importer.create_database()
+        importer.import_xml(xml_path, workers=args.workers, incremental=incremental)
     
     except Exception as e:
         print(f"Fatal error: {e}")
@@ -4,11 +4,43 @@ Parse broadcast license XML and populate target_schema.sql database.
 Filters: status == 'действующая' AND licensed_activity == 'Радиовещание радиоканала'
 """
 
+import os
 import sqlite3
+import sys
 import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Optional, Dict, Tuple
-from datetime import datetime
+from typing import Any, Iterator, Optional, Dict, Tuple
+
+# The field mapping layer lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rkn_fields import RKN_NAMESPACE, FieldSpec, iter_records, iter_rows, safe_float, safe_int
+
+
+# Fields used for filtering, the organisation and the SMI
+RECORD_SPEC = FieldSpec([
+    ('status', None),
+    ('licensed_activity', None),
+    ('org_id', safe_int),
+    ('org_name', None),
+    ('org_name_short', None),
+    ('inn', None),
+    ('ogrn', None),
+    ('address', None),
+    ('phone', None),
+    ('email', None),
+    ('smi_name', None),
+], elements=('grid',))
+GRID_SPEC = FieldSpec([
+    ('region_name_full', None),
+    ('region_text', None),
+    ('population', safe_float),
+    ('mount_point', None),
+    ('channel_num', None),
+    ('freq', None),
+    ('power', None),
+    ('brcst_time', None),
+])
 
 
 class XMLToTargetSchemaImporter:
@@ -20,7 +52,7 @@ class XMLToTargetSchemaImporter:
         self.schema_path = schema_path
         self.conn = None
         self.cursor = None
-        self.namespace = {'rkn': 'http://rsoc.ru/opendata/7705846236-LicBroadcast'}
+        self.namespace = {'rkn': RKN_NAMESPACE}
         
         # Filters
         self.status_filter = 'действующая'
@@ -51,39 +83,14 @@ class XMLToTargetSchemaImporter:
         self.conn.commit()
         print("Database schema created successfully.")
     
-    def parse_xml(self, xml_path: str) -> Optional[ET.Element]:
-        """Parse XML file and return root element."""
-        print(f"Parsing XML file: {xml_path}")
+    def iter_records(self, xml_path: str) -> Iterator[ET.Element]:
+        """Stream rkn:record elements one at a time, see rkn_fields.iter_records."""
+        print(f"Streaming XML file: {xml_path}")
         try:
-            tree = ET.parse(xml_path)
-            return tree.getroot()
-        except Exception as e:
+            yield from iter_records(xml_path)
+        except (ET.ParseError, OSError) as e:
+            # Records parsed before the error are kept
             print(f"Error parsing XML: {e}")
-            return None
-    
-    def get_text(self, element: Optional[ET.Element], default: str = "") -> str:
-        """Safely get text from XML element."""
-        if element is not None and element.text:
-            return element.text.strip()
-        return default
-    
-    def safe_int(self, value_str: str) -> Optional[int]:
-        """Convert string to integer or return None."""
-        if not value_str:
-            return None
-        try:
-            return int(value_str)
-        except ValueError:
-            return None
-    
-    def safe_float(self, value_str: str) -> Optional[float]:
-        """Convert string to float or return None."""
-        if not value_str:
-            return None
-        try:
-            return float(value_str.replace(',', '.'))
-        except ValueError:
-            return None
     
     def get_or_create_region(self, region_name: str) -> int:
         """Get or create region, return its ID."""
@@ -120,22 +127,22 @@ class XMLToTargetSchemaImporter:
         self.smi_cache[smi_name] = smi_id
         return smi_id
     
-    def get_or_create_organisation(self, record_elem: ET.Element) -> Optional[int]:
-        """Extract and create organisation, return its ID."""
-        org_id_val = self.safe_int(self.get_text(record_elem.find('rkn:org_id', self.namespace)))
+    def get_or_create_organisation(self, record: Dict[str, Any]) -> Optional[int]:
+        """Create organisation from record fields (RECORD_SPEC), return its ID."""
+        org_id_val = record['org_id']
         if org_id_val is None:
             return None
         
         if org_id_val in self.org_cache:
             return self.org_cache[org_id_val]
         
-        org_name = self.get_text(record_elem.find('rkn:org_name', self.namespace))
-        org_name_short = self.get_text(record_elem.find('rkn:org_name_short', self.namespace))
-        inn = self.get_text(record_elem.find('rkn:inn', self.namespace))
-        ogrn = self.get_text(record_elem.find('rkn:ogrn', self.namespace))
-        address = self.get_text(record_elem.find('rkn:address', self.namespace))
-        phone = self.get_text(record_elem.find('rkn:phone', self.namespace))
-        email = self.get_text(record_elem.find('rkn:email', self.namespace))
+        org_name = record['org_name']
+        org_name_short = record['org_name_short']
+        inn = record['inn']
+        ogrn = record['ogrn']
+        address = record['address']
+        phone = record['phone']
+        email = record['email']
         
         # Check for duplicate by inn/ogrn
         try:
@@ -158,26 +165,17 @@ class XMLToTargetSchemaImporter:
         
         return None
     
-    def insert_broadcast_records(self, record_id: int, record_elem: ET.Element):
+    def insert_broadcast_records(self, record_id: int, smi_name: str, grid_elem: Optional[ET.Element]):
         """Insert broadcast records from grid."""
-        grid_elem = record_elem.find('rkn:grid', self.namespace)
         if grid_elem is None:
             return
         
-        smi_name = self.get_text(record_elem.find('rkn:smi_name', self.namespace))
         smi_id = self.get_or_create_smi(smi_name)
         
-        for row in grid_elem.findall('rkn:row', self.namespace):
+        for row in iter_rows(grid_elem):
             try:
-                region_name = self.get_text(row.find('rkn:region_name_full', self.namespace))
-                district_name = self.get_text(row.find('rkn:region_text', self.namespace))
-                population = self.safe_float(self.get_text(row.find('rkn:population', self.namespace)))
-                
-                mount_point = self.get_text(row.find('rkn:mount_point', self.namespace))
-                channel_num = self.get_text(row.find('rkn:channel_num', self.namespace))
-                freq = self.get_text(row.find('rkn:freq', self.namespace))
-                power = self.get_text(row.find('rkn:power', self.namespace))
-                brcst_time = self.get_text(row.find('rkn:brcst_time', self.namespace))
+                (region_name, district_name, population,
+                 mount_point, channel_num, freq, power, brcst_time) = GRID_SPEC.extract(row)
                 
                 # Get or create region and district
                 region_id = self.get_or_create_region(region_name)
@@ -195,31 +193,27 @@ class XMLToTargetSchemaImporter:
     
     def import_xml(self, xml_path: str):
         """Main import function with filters."""
-        root = self.parse_xml(xml_path)
-        if root is None:
-            return
-        
         records_count = 0
         filtered_count = 0
         
-        # Find all record elements
-        for record_elem in root.findall('rkn:record', self.namespace):
+        # Records are processed while the file is still being read
+        for record_elem in self.iter_records(xml_path):
             try:
-                # Apply filters
-                status = self.get_text(record_elem.find('rkn:status', self.namespace))
-                licensed_activity = self.get_text(record_elem.find('rkn:licensed_activity', self.namespace))
+                values, elements = RECORD_SPEC.extract_with_elements(record_elem)
+                record = RECORD_SPEC.to_dict(values)
                 
-                if status != self.status_filter or licensed_activity != self.activity_filter:
+                # Apply filters
+                if record['status'] != self.status_filter or record['licensed_activity'] != self.activity_filter:
                     filtered_count += 1
                     continue
                 
                 # Get or create organisation
-                org_id = self.get_or_create_organisation(record_elem)
+                org_id = self.get_or_create_organisation(record)
                 if org_id is None:
                     continue
                 
                 # Insert broadcast records
-                self.insert_broadcast_records(org_id, record_elem)
+                self.insert_broadcast_records(org_id, record['smi_name'], elements.get('grid'))
                 
                 records_count += 1
                 if records_count % 10 == 0: